@@ -0,0 +1,83 @@
+# benchmarks/expression_benchmark.py
+#
+# Times filter and mutate expressions on a synthetic frame three ways: the plain
+# per-operator pandas code, the fused NumPy kernels, and the kernels with numexpr
+# (when it is installed). Also reports the peak memory each one allocates.
+# Run from the repository root:  python -m benchmarks.expression_benchmark [rows]
+
+import sys
+import time
+import tracemalloc
+import numpy as np
+import pandas as pd
+from src import expressions, kernels
+from src.backends import PandasBackend
+from src.compiler import parse_flow
+from src.transpiler import FlowTranspiler
+
+SCRIPT = """schema Facts { a: int; b: int; c: float; d: float; e: int; }
+source facts <- File(path: "facts.csv") using Facts;
+sink out -> File(path: "out.csv");
+facts -> {step} -> out;
+"""
+
+TYPES = {'a': 'int', 'b': 'int', 'c': 'float', 'd': 'float', 'e': 'int'}
+
+CASES = {
+    'wide mutate': "mutate(x = facts.a * facts.b + facts.c - facts.d * 2, y = (facts.a + facts.e) * facts.c / (facts.b + 1))",
+    'long arithmetic': "mutate(x = facts.a + facts.b * 3 - facts.e + facts.c * facts.d - facts.a / 7 + facts.b * facts.e - 1)",
+    'compound filter': "filter(facts.a > 10 and facts.c < 0.5 or facts.b * facts.e > 900 and facts.d > 0)",
+}
+
+
+def make_frame(rows, seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({'a': rng.integers(0, 100, rows), 'b': rng.integers(0, 100, rows), 'c': rng.random(rows),
+                         'd': rng.normal(size=rows), 'e': rng.integers(0, 50, rows)})
+
+
+def compile_step(step, backend):
+    """The statement the transpiler generates for one step, reading `df` and writing `out`."""
+    tree = next(parse_flow(SCRIPT.replace("{step}", step)).find_data(step.split("(")[0]))
+    op_type, op_args = FlowTranspiler(backend=backend).transform(tree)
+    for expr in (op_args.values() if op_type == 'mutate' else [op_args]): expressions.bind_types(expr, TYPES)
+    if op_type == 'filter': code = backend.filter('out', 'df', backend.expression(op_args))
+    else: code = backend.mutate('out', 'df', {name: backend.expression(expr) for name, expr in op_args.items()})
+    return compile(code, f"<{op_type}>", "exec")
+
+
+def measure(code, df, repeat=3):
+    namespace = {'pd': pd, 'flow_kernels': kernels, 'df': df}
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        exec(code, namespace)
+        best = min(best, time.perf_counter() - start)
+    tracemalloc.start()
+    exec(code, namespace)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return best, peak
+
+
+def main(rows=10_000_000):
+    df = make_frame(rows)
+    installed_numexpr = kernels.numexpr
+    variants = {'pandas': (PandasBackend(fused_kernels=False), None),
+                'fused': (PandasBackend(), None)}
+    if installed_numexpr is not None: variants['numexpr'] = (PandasBackend(), installed_numexpr)
+    print(f"Evaluating expressions over {rows:,} rows (numexpr {'installed' if installed_numexpr else 'not installed'})\n")
+    for case, step in CASES.items():
+        print(case)
+        baseline = None
+        for variant, (backend, numexpr_module) in variants.items():
+            kernels.numexpr = numexpr_module
+            seconds, peak = measure(compile_step(step, backend), df)
+            baseline = baseline or seconds
+            print(f"  {variant:<8} {seconds:8.3f}s  peak {peak / 2**20:8.1f} MiB  {baseline / seconds:5.2f}x")
+        print()
+    kernels.numexpr = installed_numexpr
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10_000_000)
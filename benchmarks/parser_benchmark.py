@@ -0,0 +1,49 @@
+# benchmarks/parser_benchmark.py
+#
+# Parses a synthetic Flow script with both the Earley and the LALR parser.
+# Run from the repository root:  python -m benchmarks.parser_benchmark [statements]
+
+import sys
+import time
+from src.compiler import build_parser
+
+HEADER = """schema Users { id: int; name: string; age: int; status: string; city_id: int; }
+schema Cities { city_id: int; city_name: string; }
+source users <- File(path: "examples/users.csv") using Users;
+source cities <- File(path: "examples/cities.csv") using Cities;
+sink report -> File(path: "report.csv");
+"""
+
+# A rotation of statements covering every transformation in flow.lark.
+STATEMENTS = [
+    "v{i} = users -> filter(user.age > {i} and user.status == 'active') -> select(id, name, age);",
+    "v{i} = users -> mutate(age_next = user.age + 1, score = (user.age * 2) / 3 - {i}) -> sort(age, name, order: 'desc');",
+    "v{i} = users -> group_by(status) -> aggregate(n = count(), mean_age = avg(age), oldest = max(age));",
+    "v{i} = join(users, cities, on: users.city_id == cities.city_id);",
+    "users -> filter(user.name != 'x{i}' or user.age < 18) -> report;",
+]
+
+
+def make_script(statement_count):
+    body = [STATEMENTS[i % len(STATEMENTS)].format(i=i) for i in range(statement_count)]
+    return HEADER + "\n".join(body) + "\n"
+
+
+def time_parse(algorithm, script):
+    parser = build_parser(algorithm, use_cache=False)
+    start = time.perf_counter()
+    parser.parse(script)
+    return time.perf_counter() - start
+
+
+def main(statement_count=10_000):
+    script = make_script(statement_count)
+    print(f"Parsing a synthetic script with {statement_count} statements ({len(script) / 1024:.0f} KiB)\n")
+    results = {algorithm: time_parse(algorithm, script) for algorithm in ('lalr', 'earley')}
+    for algorithm, seconds in results.items():
+        print(f"  {algorithm:<7} {seconds:8.2f}s  {statement_count / seconds:10.0f} statements/s")
+    print(f"\nLALR speedup: {results['earley'] / results['lalr']:.1f}x")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10_000)
@@ -0,0 +1,75 @@
+# src/aggregation.py
+#
+# Mergeable partial aggregates for `group_by -> aggregate`. Each chunk or partition
+# is reduced to a small frame of per-group states; states merge associatively, so
+# chunked and parallel runs finish with the same result as one eager groupby.
+
+import pandas as pd
+
+# For each aggregate (after 'avg' -> 'mean'): the partial states it keeps, as
+# (pandas reduction over rows, pandas reduction that merges two states).
+PARTIAL_STATES = {
+    'count': [('count', 'sum')],
+    'sum':   [('sum', 'sum')],
+    'mean':  [('sum', 'sum'), ('count', 'sum')],
+    'min':   [('min', 'min')],
+    'max':   [('max', 'max')],
+}
+
+
+def _state_column(new_col, state):
+    return f"{new_col}__{state}"
+
+
+def partial_aggregate(df, by, aggs):
+    """Reduces one chunk to per-group states. `aggs` maps output column -> (input column, func)."""
+    named = {}
+    for new_col, (col, func) in aggs.items():
+        for state, _ in PARTIAL_STATES[func]:
+            named[_state_column(new_col, state)] = pd.NamedAgg(column=col, aggfunc=state)
+    return df.groupby(by).agg(**named).reset_index()
+
+
+def merge_partials(partials, by, aggs):
+    """Combines several state frames into one, still keyed by the group columns."""
+    named = {}
+    for new_col, (_, func) in aggs.items():
+        for state, merge in PARTIAL_STATES[func]:
+            column = _state_column(new_col, state)
+            named[column] = pd.NamedAgg(column=column, aggfunc=merge)
+    return pd.concat(partials, ignore_index=True).groupby(by).agg(**named).reset_index()
+
+
+def finalize(states, by, aggs):
+    """Turns merged states into the frame the eager `groupby().agg().reset_index()` produces."""
+    if states is None:
+        return pd.DataFrame(columns=list(by) + list(aggs))
+    result = states[list(by)].copy()
+    for new_col, (_, func) in aggs.items():
+        if func == 'mean':
+            result[new_col] = states[_state_column(new_col, 'sum')] / states[_state_column(new_col, 'count')]
+        else:
+            result[new_col] = states[_state_column(new_col, PARTIAL_STATES[func][0][0])]
+    return result
+
+
+class PartialAggregator:
+    """Folds chunks into running per-group states; memory grows with groups, not rows."""
+    def __init__(self, by, aggs):
+        self.by = by
+        self.aggs = aggs
+        self.states = None
+
+    def add(self, df):
+        # Empty chunks carry no groups and would only muddy the state dtypes.
+        if df.empty: return
+        self.merge(partial_aggregate(df, self.by, self.aggs))
+
+    def merge(self, states):
+        """Merges a state frame produced elsewhere, e.g. by another worker."""
+        if states is None or states.empty: return
+        if self.states is None: self.states = states
+        else: self.states = merge_partials([self.states, states], self.by, self.aggs)
+
+    def result(self):
+        return finalize(self.states, self.by, self.aggs)
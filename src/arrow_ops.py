@@ -0,0 +1,135 @@
+# src/arrow_ops.py
+#
+# Runtime helpers imported by scripts compiled with `flow run --engine arrow`. They
+# give pyarrow.compute the semantics Flow scripts have under pandas: '+' joins
+# strings, '/' is true division, groups come back sorted and joins keep pd.merge's
+# row and column order. CSVs are read and written as pandas reads and writes them,
+# so both engines give a script the same output files.
+
+import operator
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+from .ingest import NULL_VALUES
+
+_PYTHON_OPERATORS = {
+    '+': operator.add, '-': operator.sub, '*': operator.mul, '/': operator.truediv,
+    '>': operator.gt, '<': operator.lt, '==': operator.eq, '!=': operator.ne,
+    'and': operator.and_, 'or': operator.or_,
+}
+_ARROW_OPERATORS = {
+    '+': pc.add, '-': pc.subtract, '*': pc.multiply,
+    '>': pc.greater, '<': pc.less, '==': pc.equal, '!=': pc.not_equal,
+    'and': pc.and_kleene, 'or': pc.or_kleene,
+}
+
+
+def read_csv(path, columns=None):
+    """
+    Reads a CSV as pd.read_csv does: the same values are missing, in string columns
+    too, and an int column with missing values is read as floats.
+    """
+    options = pa_csv.ConvertOptions(include_columns=columns or [], null_values=NULL_VALUES, strings_can_be_null=True)
+    table = pa_csv.read_csv(path, convert_options=options)
+    for i, field in enumerate(table.schema):
+        if pa.types.is_integer(field.type) and table.column(i).null_count:
+            table = table.set_column(i, field.name, pc.cast(table.column(i), pa.float64()))
+    return table
+
+
+def _nullable_int(arrow_type):
+    return pd.Int64Dtype() if pa.types.is_integer(arrow_type) else None
+
+
+def write_csv(table, path):
+    """
+    Writes a CSV through pandas, whose quoting and float formatting Arrow's writer
+    does not share. Ints with missing values stay ints, as in typed pandas reads.
+    """
+    table.to_pandas(types_mapper=_nullable_int).to_csv(path, index=False)
+
+
+def write_parquet(table, path):
+    """
+    Writes a Parquet file. Ints with missing values are stored as pandas' nullable
+    ints, as the pandas engine stores them, so pandas reads them back as ints.
+    """
+    nullable = [field.name for field, column in zip(table.schema, table.columns)
+                if pa.types.is_integer(field.type) and column.null_count]
+    if nullable:
+        frame = table.to_pandas()
+        for name in nullable: frame[name] = table[name].to_pandas(types_mapper=_nullable_int)
+        table = pa.Table.from_pandas(frame, preserve_index=False)
+    pq.write_table(table, path)
+
+
+def _is_array(value):
+    return isinstance(value, (pa.Array, pa.ChunkedArray))
+
+
+def _is_string(value):
+    if _is_array(value): return pa.types.is_string(value.type) or pa.types.is_large_string(value.type)
+    return isinstance(value, str)
+
+
+def _as_float(value):
+    return pc.cast(value, pa.float64()) if _is_array(value) else float(value)
+
+
+def binary(op, left, right):
+    """Applies a Flow operator to columns and/or literals."""
+    if not _is_array(left) and not _is_array(right):
+        return _PYTHON_OPERATORS[op](left, right)
+    if op == '+' and (_is_string(left) or _is_string(right)):
+        return pc.binary_join_element_wise(left, right, '')
+    if op == '/':
+        return pc.divide(_as_float(left), _as_float(right))
+    return _ARROW_OPERATORS[op](left, right)
+
+
+def assign(table, **columns):
+    """Adds or replaces columns, broadcasting literals, like DataFrame.assign."""
+    for name, value in columns.items():
+        if not _is_array(value): value = pa.repeat(value, table.num_rows)
+        if name in table.column_names: table = table.set_column(table.column_names.index(name), name, value)
+        else: table = table.append_column(name, value)
+    return table
+
+
+class GroupedTable:
+    def __init__(self, table, keys):
+        self.table = table
+        self.keys = keys
+
+
+def group_by(table, keys):
+    return GroupedTable(table, keys)
+
+
+def aggregate(grouped, aggs):
+    """`aggs` maps output column -> (input column, func); output matches groupby().agg().reset_index()."""
+    table, keys = grouped.table, grouped.keys
+    for key in keys:  # pandas drops groups whose key is null.
+        table = table.filter(pc.is_valid(table[key]))
+    specs = []
+    for col, func in aggs.values():
+        if func == 'sum': specs.append((col, func, pc.ScalarAggregateOptions(min_count=0)))
+        else: specs.append((col, func))
+    result = table.group_by(keys).aggregate(specs)
+    agg_columns = [i for i, name in enumerate(result.column_names) if name not in keys]
+    columns = [result[key] for key in keys] + [result.column(i) for i in agg_columns]
+    result = pa.table(columns, names=list(keys) + list(aggs))
+    return result.sort_by([(key, 'ascending') for key in keys])
+
+
+def merge(left, right, left_on, right_on):
+    """An inner join in pd.merge order: left rows in order, then matching right rows in order."""
+    left = left.append_column('_flow_left_row', pa.array(np.arange(left.num_rows)))
+    right = right.append_column('_flow_right_row', pa.array(np.arange(right.num_rows)))
+    joined = left.join(right, keys=left_on, right_keys=right_on, join_type='inner',
+                       left_suffix='_x', right_suffix='_y', coalesce_keys=(left_on == right_on))
+    joined = joined.sort_by([('_flow_left_row', 'ascending'), ('_flow_right_row', 'ascending')])
+    return joined.drop_columns(['_flow_left_row', '_flow_right_row'])
@@ -0,0 +1,228 @@
+# src/backends.py
+#
+# Code generation templates, one class per execution engine. The transpiler walks
+# the parse tree and asks its backend for the Python source of every expression,
+# source reader, sink and transformation. Expression strings use '{df}' as a
+# placeholder for the frame the expression is evaluated against; expressions
+# arrive as the typed IR from expressions.py.
+
+from .expressions import operator_count, program, render
+
+
+def _keywords(options):
+    return "".join(f", {key}={value!r}" for key, value in options.items())
+
+
+class PandasBackend:
+    """Generates pandas code. This is the reference engine, and the only one that streams."""
+    name = 'pandas'
+    supports_chunking = True
+    supports_typed_reads = True
+    supports_compact_storage = True
+    supports_incremental = True
+
+    def __init__(self, fused_kernels=True):
+        # Expressions with more than one operator are evaluated by kernels.py rather
+        # than one pandas operator (and one temporary array) at a time.
+        self.fused_kernels = fused_kernels
+
+    def imports(self):
+        return {"pandas as pd"}
+
+    # --- Expressions ---
+
+    def expression(self, expr):
+        if not self.fused_kernels or operator_count(expr) < 2 or expr.dtype == 'string': return render(expr, self)
+        return f"flow_kernels.evaluate({program(expr)!r}, {{df}})"
+
+    @staticmethod
+    def _infix(items):
+        s = str(items[0])
+        for i in range(1, len(items), 2):
+            s += f" {items[i]} {items[i+1]}"
+        return s
+
+    def arith_expr(self, items): return f"({self._infix(items)})"
+    def term(self, items): return self._infix(items)
+    def comparison(self, left, op, right): return f"({left} {op} {right})"
+    def bool_expression(self, items):
+        # 'and'/'or' arrive as the element-wise '&'/'|'; comparisons are already parenthesized.
+        return self._infix(items)
+    def conjunction(self, conditions):
+        # '&' binds tighter than '|', so a condition containing '|' needs its own parentheses.
+        return " & ".join(f"({c})" if " | " in c else c for c in conditions)
+
+    # --- Sources and sinks ---
+
+    def read(self, kind, path, columns=None, filters=None):
+        if kind == 'File':
+            options = f", usecols={columns}" if columns is not None else ""
+            return f"pd.read_csv('{path}'{options})"
+        options = f", columns={columns}" if columns is not None else ""
+        if filters: options += f", filters={filters}"
+        # Reads a file as pd.read_parquet does, and a partitioned dataset directory as well.
+        return f"flow_datasets.read_parquet('{path}'{options})"
+
+    def read_typed(self, kind, path, fields, columns=None, filters=None, downcast=(), categorical=(), source=None):
+        """
+        A schema-bound read through ingest.py: declared types, declared columns, compact
+        storage. `source` is an expression naming the file a CSV's rows came from.
+        """
+        options = f", columns={columns}" if columns is not None else ""
+        if kind == 'Parquet' and filters: options += f", filters={filters}"
+        if downcast: options += f", downcast={list(downcast)}"
+        if categorical: options += f", categorical={list(categorical)}"
+        if kind == 'File' and source: options += f", source={source}"
+        reader = 'read_csv' if kind == 'File' else 'read_parquet'
+        return f"flow_ingest.{reader}('{path}', {fields}{options})"
+
+    def read_sql(self, table, engine_var, columns=None, filters=None, aggregate=None, fields=None):
+        """A table read through sql.py, running the query the planner pushed down."""
+        options = f", columns={columns}" if columns is not None else ""
+        if filters: options += f", filters={filters}"
+        if aggregate: options += f", group_by={aggregate[0]}, aggs={aggregate[1]}"
+        if fields: options += f", fields={fields}"
+        return f"flow_sql.read_table({engine_var}, '{table}'{options})"
+
+    def write(self, py_var, kind, path, options=None):
+        """A File/Parquet sink; `options` are its write options, if any (see datasets.py)."""
+        if options: return f"flow_datasets.write({py_var}, '{kind}', '{path}'{_keywords(options)})"
+        if kind == 'File': return f"{py_var}.to_csv('{path}', index=False)"
+        if kind == 'Parquet': return f"{py_var}.to_parquet('{path}', index=False)"
+        return None
+
+    def write_sql(self, py_var, engine, table, mode):
+        return f"flow_sql.write_table({py_var}, {engine}, '{table}', '{mode}')"
+
+    # --- Transformations ---
+
+    def filter(self, dst, src, condition):
+        return f"{dst} = {src}[{condition.replace('{df}', src)}]"
+
+    def select(self, dst, src, columns):
+        return f"{dst} = {src}[{columns}]"
+
+    def sort(self, dst, src, by, ascending):
+        # A stable sort keeps ties in input order, matching the streaming and arrow paths.
+        return f"{dst} = {src}.sort_values(by={by}, ascending={ascending}, kind='stable')"
+
+    def mutate(self, dst, src, assignments):
+        assign_args = ", ".join([f"{k}={v.replace('{df}', src)}" for k, v in assignments.items()])
+        return f"{dst} = {src}.assign({assign_args})"
+
+    def group_by(self, dst, src, columns):
+        return f"{dst} = {src}.groupby({columns})"
+
+    def aggregate(self, dst, src, aggs):
+        agg_args = ", ".join(f"{new_col}=pd.NamedAgg(column='{col}', aggfunc='{func}')"
+                             for new_col, (col, func) in aggs.items())
+        return f"{dst} = {src}.agg({agg_args}).reset_index()"
+
+    def join(self, dst, left, right, left_on, right_on):
+        return f"{dst} = pd.merge({left}, {right}, left_on='{left_on}', right_on='{right_on}')"
+
+
+class ArrowBackend:
+    """Generates pyarrow.compute code over pyarrow Tables, with helpers from arrow_ops."""
+    name = 'arrow'
+    supports_chunking = False
+    supports_typed_reads = True
+    supports_compact_storage = False
+    supports_incremental = False
+
+    def imports(self):
+        return {"pyarrow as pa", f"arrow_ops as flow_arrow from {__package__}"}
+
+    # --- Expressions ---
+
+    def expression(self, expr): return render(expr, self)
+
+    @staticmethod
+    def _fold(items, operators=None):
+        s = str(items[0])
+        for i in range(1, len(items), 2):
+            op = operators.get(items[i], items[i]) if operators else items[i]
+            s = f"flow_arrow.binary('{op}', {s}, {items[i+1]})"
+        return s
+
+    def arith_expr(self, items): return self._fold(items)
+    def term(self, items): return self._fold(items)
+    def comparison(self, left, op, right): return f"flow_arrow.binary('{op}', {left}, {right})"
+    def bool_expression(self, items):
+        # 'and' binds tighter than 'or': fold each run of 'and's, then join the runs with 'or'.
+        groups, current = [], [items[0]]
+        for i in range(1, len(items), 2):
+            if items[i] == '|':
+                groups.append(current)
+                current = [items[i+1]]
+            else:
+                current += ['&', items[i+1]]
+        groups.append(current)
+        folded = [self._fold(group, {'&': 'and'}) for group in groups]
+        return self._fold(sum(([g, '|'] for g in folded), [])[:-1], {'|': 'or'})
+    def conjunction(self, conditions):
+        return self._fold(sum(([c, 'and'] for c in conditions), [])[:-1])
+
+    # --- Sources and sinks ---
+
+    def read(self, kind, path, columns=None, filters=None):
+        if kind == 'File':
+            options = f", columns={columns}" if columns is not None else ""
+            return f"flow_arrow.read_csv('{path}'{options})"
+        options = f", columns={columns}" if columns is not None else ""
+        if filters: options += f", filters={filters}"
+        return f"flow_datasets.read_table('{path}'{options})"
+
+    def read_typed(self, kind, path, fields, columns=None, filters=None, downcast=(), categorical=(), source=None):
+        """A schema-bound read through ingest.py: declared types and columns, and the same rejects as pandas."""
+        options = f", columns={columns}" if columns is not None else ""
+        if kind == 'Parquet' and filters: options += f", filters={filters}"
+        reader = 'read_csv_table' if kind == 'File' else 'read_parquet_table'
+        return f"flow_ingest.{reader}('{path}', {fields}{options})"
+
+    def read_sql(self, table, engine_var, columns=None, filters=None, aggregate=None, fields=None):
+        read = PandasBackend.read_sql(self, table, engine_var, columns, filters, aggregate, fields)
+        return f"pa.Table.from_pandas({read}, preserve_index=False)"
+
+    def write(self, py_var, kind, path, options=None):
+        if options: return PandasBackend.write(self, py_var, kind, path, options)
+        if kind == 'File': return f"flow_arrow.write_csv({py_var}, '{path}')"
+        if kind == 'Parquet': return f"flow_arrow.write_parquet({py_var}, '{path}')"
+        return None
+
+    def write_sql(self, py_var, engine, table, mode):
+        return f"flow_sql.write_table({py_var}.to_pandas(), {engine}, '{table}', '{mode}')"
+
+    # --- Transformations ---
+
+    def filter(self, dst, src, condition):
+        return f"{dst} = {src}.filter({condition.replace('{df}', src)})"
+
+    def select(self, dst, src, columns):
+        return f"{dst} = {src}.select({columns})"
+
+    def sort(self, dst, src, by, ascending):
+        order = 'ascending' if ascending else 'descending'
+        return f"{dst} = {src}.sort_by({[(col, order) for col in by]})"
+
+    def mutate(self, dst, src, assignments):
+        assign_args = ", ".join([f"{k}={v.replace('{df}', src)}" for k, v in assignments.items()])
+        return f"{dst} = flow_arrow.assign({src}, {assign_args})"
+
+    def group_by(self, dst, src, columns):
+        return f"{dst} = flow_arrow.group_by({src}, {columns})"
+
+    def aggregate(self, dst, src, aggs):
+        return f"{dst} = flow_arrow.aggregate({src}, {aggs})"
+
+    def join(self, dst, left, right, left_on, right_on):
+        return f"{dst} = flow_arrow.merge({left}, {right}, '{left_on}', '{right_on}')"
+
+
+BACKENDS = {backend.name: backend for backend in (PandasBackend, ArrowBackend)}
+
+
+def get_backend(name='pandas'):
+    if name not in BACKENDS:
+        raise ValueError(f"Error: Unknown engine '{name}'. Choose one of: {', '.join(BACKENDS)}.")
+    return BACKENDS[name]()
@@ -0,0 +1,323 @@
+# src/bench.py
+#
+# The benchmark suite behind `flow bench`. It generates seeded synthetic datasets
+# shaped like the examples (users, cities, users_names) at any scale, runs one
+# .flow script per transformation against them plus a compile-only scenario, and
+# records wall time, throughput and peak RSS. Results are saved as JSON and can
+# be compared against a stored baseline to flag regressions.
+#
+# Every measurement runs in a fresh process, so imports, allocator state and the
+# memory of earlier scenarios never count towards it; the best of `repeat` runs is
+# kept.
+
+import json
+import os
+import platform
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from . import profiling, sources
+from .backends import get_backend
+from .cache import get_cache_dir, tool_version
+from .compiler import compile_flow, get_parser, parse_flow, preload
+from .planner import QueryPlanner
+from .transpiler import FlowTranspiler
+from .validator import Validator
+
+# Bumped whenever the generator changes, so datasets generated before are not reused.
+GENERATOR_VERSION = 1
+# Rows generated (and held in memory) at a time.
+GENERATE_CHUNK_ROWS = 1_000_000
+MAX_CITIES = 1000
+DEFAULT_ROWS = 100_000
+DEFAULT_REPEAT = 3
+DEFAULT_THRESHOLD = 0.10
+# Differences below these never count as regressions; they are within the noise of a small run.
+MIN_TIME_DELTA = 0.05
+MIN_RSS_DELTA = 16 * 1024 * 1024
+# Copies of every scenario pipeline in the script the 'compile' scenario compiles.
+COMPILE_COPIES = 200
+
+FIRST_NAMES = ["Alice", "Bob", "Charlie", "Diana", "Ethan", "Fiona", "George", "Hannah", "Ivan", "Julia",
+               "Kevin", "Laura", "Mohan", "Nina", "Oscar", "Priya", "Quinn", "Rosa", "Sam", "Tara"]
+LAST_NAMES = ["Smith", "Jones", "Brown", "Garcia", "Miller", "Davis", "Khan", "Wilson", "Lopez", "Taylor",
+              "Moore", "Singh", "Clark", "Lewis", "Walker", "Young", "King", "Wright", "Scott", "Green"]
+CITY_NAMES = ["New York", "London", "Paris", "Tokyo", "Mumbai", "Berlin", "Sydney", "Toronto", "Madrid", "Seoul"]
+STATUSES = ["active", "inactive", "pending"]
+STATUS_WEIGHTS = [0.6, 0.3, 0.1]
+
+SCHEMAS = """schema Users { id: int; name: string; city_id: int; }
+schema Cities { city_id: int; city_name: string; }
+schema UserNames { id: int; first_name: string; last_name: string; age: int; status: string; }
+"""
+SOURCES = {
+    'users': 'source users <- Parquet(path: "{data}/users.parquet") using Users;',
+    'cities': 'source cities <- File(path: "{data}/cities.csv") using Cities;',
+    'names': 'source names <- File(path: "{data}/users_names.csv") using UserNames;',
+}
+SINK = 'sink out -> Parquet(path: "{out}/out.parquet");'
+
+# Scenario -> (the sources it reads, its pipeline). The first source's rows are the
+# scenario's rows; `{n}` is the variable part of the pipeline, so the compile script
+# can repeat it without every copy being the same step.
+SCENARIOS = {
+    'filter': (['names'], 'names -> filter(names.age > {n} and names.status == "active") -> out;'),
+    'select': (['names'], 'names -> select(id, age, status) -> out;'),
+    'sort': (['users'], 'users -> sort(name, id) -> out;'),
+    'mutate': (['names'], 'names -> mutate(full_name = names.first_name + " " + names.last_name, '
+                          'age_next = names.age + {n}) -> out;'),
+    'aggregate': (['names'], 'names -> group_by(status) -> aggregate(n = count(), mean_age = avg(age), '
+                             'oldest = max(age)) -> out;'),
+    'join': (['users', 'cities'], 'joined{n} = join(users, cities, on: users.city_id == cities.city_id);\n'
+                                  'joined{n} -> out;'),
+}
+COMPILE_SCENARIO = 'compile'
+SCENARIO_NAMES = list(SCENARIOS) + [COMPILE_SCENARIO]
+
+
+# --- Synthetic data ---
+
+# numpy and pyarrow are imported where data is generated, so loading this module
+# (as the CLI does) stays cheap.
+
+def _strings(values, rng, size, p=None):
+    import pyarrow as pa
+    return pa.array(values).take(pa.array(rng.choice(len(values), size=size, p=p)))
+
+
+def _write_chunks(path, kind, chunks):
+    import pyarrow.csv as pa_csv
+    import pyarrow.parquet as pq
+    writer = None
+    for table in chunks:
+        if writer is None:
+            writer = (pq.ParquetWriter(path, table.schema) if kind == 'Parquet' else
+                      pa_csv.CSVWriter(path, table.schema, write_options=pa_csv.WriteOptions(quoting_style='needed')))
+        writer.write_table(table)
+    writer.close()
+
+
+def _chunks(rows, seed, stream, make):
+    """Tables of at most GENERATE_CHUNK_ROWS rows; each chunk has its own seed, so any chunk is reproducible."""
+    import numpy as np
+    for index, start in enumerate(range(0, rows, GENERATE_CHUNK_ROWS)):
+        rng = np.random.default_rng([seed, stream, index])
+        yield make(rng, np.arange(start + 1, min(start + GENERATE_CHUNK_ROWS, rows) + 1, dtype=np.int64))
+
+
+def generate(directory, rows, seed=0):
+    """
+    Writes users.csv, users.parquet, cities.csv and users_names.csv with the columns
+    of the examples. The same rows and seed always produce the same files.
+    """
+    import numpy as np
+    import pyarrow as pa
+    cities = min(rows, MAX_CITIES)
+
+    def users(rng, ids):
+        return pa.table({'id': ids, 'name': _strings(FIRST_NAMES, rng, len(ids)),
+                         'city_id': rng.integers(101, 101 + cities, size=len(ids))})
+
+    def names(rng, ids):
+        return pa.table({'id': ids, 'first_name': _strings(FIRST_NAMES, rng, len(ids)),
+                         'last_name': _strings(LAST_NAMES, rng, len(ids)),
+                         'age': rng.integers(18, 91, size=len(ids)),
+                         'status': _strings(STATUSES, rng, len(ids), STATUS_WEIGHTS)})
+
+    city_names = [CITY_NAMES[i % len(CITY_NAMES)] + (f" {i // len(CITY_NAMES)}" if i >= len(CITY_NAMES) else "")
+                  for i in range(cities)]
+    os.makedirs(directory, exist_ok=True)
+    _write_chunks(os.path.join(directory, 'users.csv'), 'File', _chunks(rows, seed, 0, users))
+    _write_chunks(os.path.join(directory, 'users.parquet'), 'Parquet', _chunks(rows, seed, 0, users))
+    _write_chunks(os.path.join(directory, 'users_names.csv'), 'File', _chunks(rows, seed, 1, names))
+    _write_chunks(os.path.join(directory, 'cities.csv'), 'File',
+                  [pa.table({'city_id': np.arange(101, 101 + cities, dtype=np.int64), 'city_name': city_names})])
+
+
+def ensure_data(data_dir, rows, seed=0):
+    """Returns the directory of the dataset for `rows` and `seed`, generating it on first use."""
+    directory = os.path.join(data_dir, f"rows-{rows}-seed-{seed}-v{GENERATOR_VERSION}")
+    if os.path.isdir(directory): return directory
+    partial = f"{directory}.{os.getpid()}.tmp"
+    shutil.rmtree(partial, ignore_errors=True)
+    try:
+        generate(partial, rows, seed)
+    except BaseException:
+        shutil.rmtree(partial, ignore_errors=True)
+        raise
+    os.rename(partial, directory)  # Only a complete dataset is ever reused.
+    return directory
+
+
+# --- Scenarios ---
+
+def scenario_script(name, data, out):
+    """The .flow script of a data scenario, reading from `data` and writing to `out`."""
+    source_names, pipeline = SCENARIOS[name]
+    lines = [SCHEMAS] + [SOURCES[source].format(data=data) for source in source_names]
+    lines += [SINK.format(out=out), pipeline.format(n=40)]
+    return "\n".join(lines) + "\n"
+
+
+def compile_script():
+    """A script with COMPILE_COPIES copies of every scenario pipeline, for the compile scenario."""
+    lines = [SCHEMAS] + [source.format(data='data') for source in SOURCES.values()] + [SINK.format(out='out')]
+    for n in range(COMPILE_COPIES):
+        lines += [pipeline.format(n=n) for _, pipeline in SCENARIOS.values()]
+    return "\n".join(lines) + "\n"
+
+
+def _measure_run(task):
+    """Compiles and runs one scenario script; only the run counts towards the wall time and peak RSS."""
+    flow_code, engine, chunk_size, workers = task
+    sources.configure(0)  # Every run reads its sources from disk.
+    preload()  # Imports are startup cost, not part of a run.
+    start = time.perf_counter()
+    compiled = compile_flow(flow_code, use_cache=False, chunk_size=chunk_size, workers=workers, engine=engine)
+    compile_time = time.perf_counter() - start
+    profiling.reset_peak_rss()
+    start = time.perf_counter()
+    exec(compiled.code, {'__name__': '__flow__'})
+    return {'wall_time': time.perf_counter() - start, 'compile_time': compile_time, 'peak_rss': profiling.peak_rss()}
+
+
+def _measure_compile(task):
+    """Times the parse, plan, validate and transpile stages of the compile script, as compile_flow runs them."""
+    flow_code, engine, chunk_size, workers = task
+    get_parser()  # Loading the parser tables is not part of compiling a script.
+    backend = get_backend(engine)
+    profiling.reset_peak_rss()
+    stages = {}
+    start = time.perf_counter()
+    parse_tree = parse_flow(flow_code)
+    stages['parse'] = time.perf_counter() - start
+    start = time.perf_counter()
+    plan = QueryPlanner(parse_tree, chunk_size, workers, backend.supports_chunking).build()
+    stages['plan'] = time.perf_counter() - start
+    start = time.perf_counter()
+    variable_schemas = {name: source.schema_name for name, source in plan.sources.items()
+                        if source.schema_name in plan.schemas}
+    Validator(dict(plan.schemas), variable_schemas).visit(parse_tree)
+    stages['validate'] = time.perf_counter() - start
+    start = time.perf_counter()
+    FlowTranspiler(plan, backend).transform(parse_tree)
+    stages['transpile'] = time.perf_counter() - start
+    return {'wall_time': sum(stages.values()), 'stages': stages, 'peak_rss': profiling.peak_rss()}
+
+
+def _best(measure, task, repeat):
+    """Runs `measure` `repeat` times, each in a fresh process, and keeps the fastest run."""
+    runs = []
+    for _ in range(repeat):
+        with ProcessPoolExecutor(max_workers=1) as pool:
+            runs.append(pool.submit(measure, task).result())
+    best = min(runs, key=lambda run: run['wall_time'])
+    best['peak_rss'] = min((run['peak_rss'] for run in runs if run['peak_rss'] is not None), default=None)
+    best['times'] = [run['wall_time'] for run in runs]
+    return best
+
+
+def format_result(result):
+    unit = 'statements' if result['scenario'] == COMPILE_SCENARIO else 'rows'
+    line = (f"  {result['scenario']:<10} {result['rows']:>12,} {unit:<10} {result['wall_time']:9.3f}s "
+            f"{result['throughput']:14,.0f} {unit}/s")
+    if result['peak_rss']: line += f"   peak RSS {result['peak_rss'] / sources.MB:,.0f} MB"
+    return line
+
+
+def run_suite(row_counts=(DEFAULT_ROWS,), seed=0, scenarios=None, engine='pandas', chunk_size=None, workers=None,
+              repeat=DEFAULT_REPEAT, data_dir=None, report=print):
+    """
+    Runs the selected scenarios at every row count and returns the results as a
+    JSON-ready dict. `report` is called with a line per finished measurement.
+    """
+    if (chunk_size or workers) and not get_backend(engine).supports_chunking:
+        raise ValueError(f"Error: The '{engine}' engine does not support --stream or --workers.")
+    scenarios = list(scenarios or SCENARIO_NAMES)
+    data_dir = data_dir or os.path.join(get_cache_dir(), 'bench')
+    options = {'engine': engine, 'chunk_size': chunk_size, 'workers': workers}
+    results = []
+
+    def record(scenario, rows, measured):
+        result = {'scenario': scenario, 'rows': rows, 'throughput': rows / measured['wall_time'] if measured['wall_time'] else 0.0}
+        result.update(measured)
+        results.append(result)
+        report(format_result(result))
+
+    if COMPILE_SCENARIO in scenarios:
+        flow_code = compile_script()
+        statements = COMPILE_COPIES * sum(pipeline.count(';') for _, pipeline in SCENARIOS.values())
+        record(COMPILE_SCENARIO, statements, _best(_measure_compile, (flow_code, engine, chunk_size, workers), repeat))
+    for rows in row_counts:
+        data = None
+        for scenario in scenarios:
+            if scenario == COMPILE_SCENARIO: continue
+            if data is None:
+                report(f"ℹ️  Using the {rows:,}-row dataset (seed {seed}) in {data_dir}")
+                data = ensure_data(data_dir, rows, seed)
+            out = tempfile.mkdtemp(prefix='flow-bench-')
+            try:
+                task = (scenario_script(scenario, data, out), engine, chunk_size, workers)
+                record(scenario, rows, _best(_measure_run, task, repeat))
+            finally:
+                shutil.rmtree(out, ignore_errors=True)
+    return {'version': tool_version(), 'python': platform.python_version(), 'platform': platform.platform(),
+            'cpus': os.cpu_count(), 'created': time.strftime('%Y-%m-%dT%H:%M:%S%z'), 'seed': seed,
+            'repeat': repeat, 'options': options, 'results': results}
+
+
+def save(results, path):
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2)
+
+
+def load(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+# --- Comparison ---
+
+def _change(old, new):
+    return (new - old) / old if old else 0.0
+
+
+def compare(baseline, current, threshold=DEFAULT_THRESHOLD):
+    """
+    Pairs the results of two runs by scenario and row count. A result regresses when
+    its wall time or peak RSS grew by more than `threshold` (and by more than the noise
+    floor). Returns one dict per current result; those without a baseline have none.
+    """
+    base = {(r['scenario'], r['rows']): r for r in baseline['results']}
+    comparison = []
+    for result in current['results']:
+        old = base.get((result['scenario'], result['rows']))
+        entry = {'scenario': result['scenario'], 'rows': result['rows'], 'baseline': old, 'current': result,
+                 'regressions': []}
+        if old is not None:
+            time_change = _change(old['wall_time'], result['wall_time'])
+            if time_change > threshold and result['wall_time'] - old['wall_time'] > MIN_TIME_DELTA:
+                entry['regressions'].append('time')
+            if old.get('peak_rss') and result.get('peak_rss'):
+                rss_change = _change(old['peak_rss'], result['peak_rss'])
+                if rss_change > threshold and result['peak_rss'] - old['peak_rss'] > MIN_RSS_DELTA:
+                    entry['regressions'].append('memory')
+        comparison.append(entry)
+    return comparison
+
+
+def format_comparison(comparison):
+    lines = [f"  {'scenario':<10} {'rows':>12} {'baseline':>10} {'current':>10} {'time':>8} {'memory':>8}"]
+    for entry in comparison:
+        old, new = entry['baseline'], entry['current']
+        prefix = "❌" if entry['regressions'] else "✅"
+        if old is None:
+            lines.append(f"ℹ️  {entry['scenario']:<10} {entry['rows']:>12,} {'-':>10} {new['wall_time']:9.3f}s  (no baseline)")
+            continue
+        memory = (f"{_change(old['peak_rss'], new['peak_rss']):+8.1%}"
+                  if old.get('peak_rss') and new.get('peak_rss') else f"{'-':>8}")
+        lines.append(f"{prefix} {entry['scenario']:<10} {entry['rows']:>12,} {old['wall_time']:9.3f}s "
+                     f"{new['wall_time']:9.3f}s {_change(old['wall_time'], new['wall_time']):+8.1%} {memory}"
+                     + (f"  regressed: {', '.join(entry['regressions'])}" if entry['regressions'] else ""))
+    return "\n".join(lines)
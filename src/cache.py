@@ -0,0 +1,140 @@
+# src/cache.py
+
+import hashlib
+import marshal
+import os
+import pickle
+import sys
+import threading
+from collections import OrderedDict
+from importlib import metadata
+
+CACHE_DIR_ENV = "FLOW_CACHE_DIR"
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "flow")
+
+# The grammar and compiler modules decide what a script compiles to. Their contents
+# are part of the cache key so an edited planner or transpiler never serves stale code.
+COMPILER_SUFFIXES = (".lark", ".py")
+# Compiled scripts a memory-backed CompileCache keeps, least recently used dropped first.
+MEMORY_ENTRIES = 256
+
+
+def get_cache_dir():
+    """Returns the directory used for Flow's on-disk caches."""
+    return os.environ.get(CACHE_DIR_ENV, DEFAULT_CACHE_DIR)
+
+
+def tool_version():
+    """Returns the installed package version, or 'dev' for a source checkout."""
+    try:
+        return metadata.version("pj-flow")
+    except metadata.PackageNotFoundError:
+        return "dev"
+
+
+_compiler_digest = None
+
+
+def compiler_digest():
+    """
+    Hashes the tool version and the grammar and compiler sources, once per process:
+    a process keeps running the compiler it imported even if the files change.
+    """
+    global _compiler_digest
+    if _compiler_digest is not None: return _compiler_digest
+    digest = hashlib.sha256(tool_version().encode())
+    src_dir = os.path.dirname(os.path.abspath(__file__))
+    for name in sorted(os.listdir(src_dir)):
+        if not name.endswith(COMPILER_SUFFIXES): continue
+        with open(os.path.join(src_dir, name), "rb") as f:
+            digest.update(f.read())
+    _compiler_digest = digest.hexdigest()
+    return _compiler_digest
+
+
+class CompiledScript:
+    """The result of compiling a .flow script: Python source, code object, schemas and plan."""
+    def __init__(self, python_script, code, schemas, variable_schemas, notes=None, from_cache=False, plan=None):
+        self.python_script = python_script
+        self.code = code
+        self.schemas = schemas
+        self.variable_schemas = variable_schemas
+        self.notes = notes or []   # Planner notes worth showing the user, e.g. in-memory fallbacks.
+        self.from_cache = from_cache
+        self.plan = plan           # The LogicalPlan, kept so incremental runs need not parse a cached script.
+
+
+class CompileCache:
+    def __init__(self, cache_dir=None, memory=False):
+        self.cache_dir = os.path.join(cache_dir or get_cache_dir(), "compiled")
+        # With `memory`, entries loaded or stored are also kept in this process (see server.py).
+        self.entries = OrderedDict() if memory else None
+        self._lock = threading.Lock()
+
+    def key(self, flow_code, options=None):
+        """Hashes the script, the compiler sources, the tool version and any compile options."""
+        digest = hashlib.sha256(compiler_digest().encode())
+        # Code objects are marshalled, and marshal output is interpreter-specific.
+        digest.update(sys.implementation.cache_tag.encode())
+        digest.update(repr(sorted((options or {}).items())).encode())
+        digest.update(flow_code.encode())
+        return digest.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.pkl")
+
+    def load(self, key):
+        """Returns the cached CompiledScript for `key`, or None on a miss or unreadable entry."""
+        if self.entries is not None:
+            with self._lock:
+                if key in self.entries:
+                    self.entries.move_to_end(key)
+                    return self.entries[key]
+        try:
+            with open(self._path(key), "rb") as f:
+                entry = pickle.load(f)
+            code = marshal.loads(entry["code"])
+        except (OSError, EOFError, KeyError, ValueError, pickle.UnpicklingError):
+            return None
+        compiled = CompiledScript(entry["python_script"], code, entry["schemas"],
+                                  entry["variable_schemas"], entry["notes"], from_cache=True, plan=entry.get("plan"))
+        self._remember(key, compiled)
+        return compiled
+
+    def _remember(self, key, compiled):
+        if self.entries is None: return
+        with self._lock:
+            self.entries[key] = compiled
+            if len(self.entries) > MEMORY_ENTRIES: self.entries.popitem(last=False)
+
+    def store(self, key, compiled):
+        """Writes an entry atomically so concurrent runs never read a half-written file."""
+        self._remember(key, CompiledScript(compiled.python_script, compiled.code, compiled.schemas,
+                                           compiled.variable_schemas, compiled.notes, from_cache=True,
+                                           plan=compiled.plan))
+        os.makedirs(self.cache_dir, exist_ok=True)
+        entry = {
+            "python_script": compiled.python_script,
+            "code": marshal.dumps(compiled.code),
+            "schemas": compiled.schemas,
+            "variable_schemas": compiled.variable_schemas,
+            "notes": compiled.notes,
+            "plan": compiled.plan,
+        }
+        # Server jobs compile on several threads of one process.
+        tmp_path = f"{self._path(key)}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(entry, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, self._path(key))
+
+    def clear(self):
+        """Deletes every cached entry and returns how many were removed."""
+        if self.entries is not None:
+            with self._lock: self.entries.clear()
+        if not os.path.isdir(self.cache_dir): return 0
+        removed = 0
+        for name in os.listdir(self.cache_dir):
+            if name.endswith(".pkl"):
+                os.remove(os.path.join(self.cache_dir, name))
+                removed += 1
+        return removed
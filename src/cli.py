@@ -1,56 +1,113 @@
 # src/cli.py
 
+import json
+import os
+import sys
 import click
-from lark import Lark
-from .transpiler import FlowTranspiler
-from .validator import Validator
+from . import bench as flow_bench
+from . import explain as flow_explain
+# joins, materialize and watermarks load pandas or pyarrow, so the commands that need
+# them import them; `flow submit` then starts without either.
+from . import incremental, profiling, server, sources
+from .backends import BACKENDS
+from .cache import CompileCache
+from .compiler import compile_flow, load_plan, parse_flow, plan_flow
 from .runner import TestRunner # <-- NEW IMPORT
+from .planner import DEFAULT_CHUNK_SIZE
+
+# Test blocks tend to share fixtures, so `flow test` caches sources unless told otherwise.
+DEFAULT_TEST_SOURCE_CACHE_MB = 1024
 
 # --- Main Logic Functions ---
 
-def run_flow_script(filepath: str):
-    # ... (this function is unchanged) ...
+def run_flow_script(filepath: str, use_cache: bool = True, chunk_size: int = None, workers: int = None, engine: str = 'pandas',
+                    materialize_variables: bool = False, force: bool = False, dry_run: bool = False):
+    """
+    Compiles a .flow script (reusing a cached build when the script is unchanged)
+    and executes it. Pipelines whose definition, sources and outputs are unchanged
+    since the last successful run are skipped unless `force` is set; `dry_run` only
+    lists what would run.
+    """
     try:
-        with open("src/flow.lark", "r") as f: flow_grammar = f.read()
         with open(filepath, "r") as f: flow_code = f.read()
     except FileNotFoundError as e:
         print(f"❌ Error: Could not find a required file. {e}"); return
-    flow_parser = Lark(flow_grammar, start='start')
-    parse_tree = flow_parser.parse(flow_code)
     try:
-        schema_collector = FlowTranspiler()
-        schema_collector.transform(parse_tree)
-        validator = Validator(schema_collector.schemas, schema_collector.variable_schemas)
-        validator.visit(parse_tree)
-        print("✅ Validation successful!")
+        plan = load_plan(flow_code, use_cache, chunk_size=chunk_size, workers=workers, engine=engine,
+                         materialize=materialize_variables)
+        state = incremental.BuildState.load(filepath)
+        hashes = incremental.source_hashes(plan, state)
+        reasons = incremental.outdated(plan, state, hashes, engine, force)
+        if dry_run:
+            for index, node in enumerate(plan.nodes):
+                if index in reasons: print(f"🔁 {incremental.describe(node)}: {reasons[index]}")
+                elif node.sinks(): print(f"✅ {incremental.describe(node)}: up to date")
+            return
+        compiled = compile_flow(flow_code, use_cache=use_cache, chunk_size=chunk_size, workers=workers, engine=engine,
+                                materialize=materialize_variables, up_to_date=incremental.up_to_date(plan, reasons))
     except Exception as e:
         print(f"❌ {e}"); return
-    transpiler = FlowTranspiler()
-    python_script = transpiler.transform(parse_tree)
+    if compiled.from_cache:
+        print("✅ Validation successful! (cached)")
+    else:
+        print("✅ Validation successful!")
+    for note in compiled.notes:
+        print(f"ℹ️  {note}")
     print("\n--- Generated Python Script ---")
-    print(python_script)
+    print(compiled.python_script)
     print("\n--- Running Script ---")
     try:
-        exec(python_script, globals())
+        exec(compiled.code, {'__name__': '__flow__'})
         print("\n✅ Script finished successfully.")
     except Exception as e:
-        print(f"\n❌ An error occurred during script execution: {e}")
+        print(f"\n❌ An error occurred during script execution: {e}"); return
+    incremental.record(plan, state, hashes, reasons, engine)
 
-def run_flow_tests(filepath: str):
+def explain_flow_script(filepath: str, analyze: bool = False, as_json: bool = False, chunk_size: int = None,
+                        workers: int = None, engine: str = 'pandas'):
     """
-    Parses a .flow file and runs any test blocks found within it.
+    Prints the plan for a .flow script, or with `analyze` runs an instrumented build
+    of it and prints where the time, rows and memory went.
     """
     try:
-        with open("src/flow.lark", "r") as f: flow_grammar = f.read()
         with open(filepath, "r") as f: flow_code = f.read()
     except FileNotFoundError as e:
         print(f"❌ Error: Could not find a required file. {e}"); return
-        
-    flow_parser = Lark(flow_grammar, start='start')
-    parse_tree = flow_parser.parse(flow_code)
+    try:
+        if not analyze:
+            plan = flow_explain.plan_to_dict(plan_flow(flow_code, chunk_size, workers, engine))
+            print(json.dumps(plan, indent=2) if as_json else flow_explain.format_plan(plan, engine))
+            return
+        compiled = compile_flow(flow_code, chunk_size=chunk_size, workers=workers, engine=engine, profile=True)
+    except Exception as e:
+        print(f"❌ {e}"); return
+    profiling.reset()
+    error = None
+    try:
+        exec(compiled.code, {'__name__': '__flow__'})
+    except Exception as e:
+        error = e
+    records = profiling.records()
+    print(json.dumps(flow_explain.profile_to_dict(records), indent=2) if as_json else flow_explain.format_profile(records))
+    if error is not None:
+        print(f"\n❌ An error occurred during script execution: {error}", file=sys.stderr if as_json else sys.stdout)
+
+def run_flow_tests(filepath: str, jobs: int = 1, fail_fast: bool = False, name_filters=None, junit_path: str = None):
+    """
+    Parses a .flow file and runs any test blocks found within it.
+    Returns True when every selected test passed.
+    """
+    try:
+        with open(filepath, "r") as f: flow_code = f.read()
+    except FileNotFoundError as e:
+        print(f"❌ Error: Could not find a required file. {e}"); return False
 
-    runner = TestRunner(parse_tree)
-    runner.run()
+    parse_tree = parse_flow(flow_code)
+
+    suite_name = os.path.splitext(os.path.basename(filepath))[0]
+    runner = TestRunner(parse_tree, jobs=jobs, fail_fast=fail_fast, name_filters=name_filters,
+                        junit_path=junit_path, suite_name=suite_name)
+    return runner.run()
 
 # --- Click CLI Definition ---
 
@@ -61,18 +118,211 @@ def cli():
 
 @cli.command()
 @click.argument('filepath', type=click.Path(exists=True))
-def run(filepath):
+@click.option('--no-cache', is_flag=True, help="Recompile the script even if a cached build exists.")
+@click.option('--stream', is_flag=True, help="Process File/Parquet pipelines in chunks to bound memory use.")
+@click.option('--chunk-size', type=click.IntRange(min=1), default=DEFAULT_CHUNK_SIZE, show_default=True,
+              help="Rows per chunk when streaming.")
+@click.option('--workers', type=click.IntRange(min=1), default=None,
+              help="Run File/Parquet pipelines and joins over partitions on this many processes.")
+@click.option('--engine', type=click.Choice(list(BACKENDS)), default='pandas', show_default=True,
+              help="The execution backend the script is compiled for.")
+@click.option('--source-cache-mb', type=click.FloatRange(min=0), default=None,
+              help="Memory budget for keeping loaded sources (default: $FLOW_SOURCE_CACHE_MB or 0).")
+@click.option('--spill-sources', is_flag=True, help="Keep sources evicted from the source cache on disk as Feather files.")
+@click.option('--materialize', 'materialize_variables', is_flag=True,
+              help="Keep assigned variables as memory-mapped Arrow files and reuse them while their sources are unchanged.")
+@click.option('--work-dir', type=click.Path(file_okay=False), default=None,
+              help="Where --materialize keeps variables (default: the 'work' directory in the Flow cache).")
+@click.option('--force', is_flag=True, help="Run every pipeline, even those whose sources and outputs are unchanged.")
+@click.option('--dry-run', is_flag=True, help="List the pipelines that would run and why, without running them.")
+def run(filepath, no_cache, stream, chunk_size, workers, engine, source_cache_mb, spill_sources, materialize_variables, work_dir,
+        force, dry_run):
     """Parses, validates, and executes a .flow script."""
+    from . import materialize
     print(f"--- Running Flow script: {filepath} ---\n")
-    run_flow_script(filepath)
+    sources.configure(source_cache_mb, spill_sources)
+    materialize.configure(work_dir)
+    run_flow_script(filepath, use_cache=not no_cache, chunk_size=chunk_size if stream else None,
+                    workers=workers, engine=engine, materialize_variables=materialize_variables, force=force, dry_run=dry_run)
+
+@cli.command()
+@click.argument('filepath', type=click.Path(exists=True))
+@click.option('--analyze', is_flag=True, help="Run the script and report time, rows, memory and I/O per step.")
+@click.option('--json', 'as_json', is_flag=True, help="Print the plan or profile as JSON.")
+@click.option('--stream', is_flag=True, help="Plan File/Parquet pipelines to run in chunks.")
+@click.option('--chunk-size', type=click.IntRange(min=1), default=DEFAULT_CHUNK_SIZE, show_default=True,
+              help="Rows per chunk when streaming.")
+@click.option('--workers', type=click.IntRange(min=1), default=None,
+              help="Plan File/Parquet pipelines and joins to run on this many processes.")
+@click.option('--engine', type=click.Choice(list(BACKENDS)), default='pandas', show_default=True,
+              help="The execution backend the script is compiled for.")
+def explain(filepath, analyze, as_json, stream, chunk_size, workers, engine):
+    """Shows how a .flow script will run, or with --analyze, how it ran."""
+    explain_flow_script(filepath, analyze, as_json, chunk_size if stream else None, workers, engine)
 
 # NEW: The 'test' command
 @cli.command()
 @click.argument('filepath', type=click.Path(exists=True))
-def test(filepath):
+@click.option('--source-cache-mb', type=click.FloatRange(min=0), default=None,
+              help=f"Memory budget for sources shared between tests (default: $FLOW_SOURCE_CACHE_MB or {DEFAULT_TEST_SOURCE_CACHE_MB}).")
+@click.option('--spill-sources', is_flag=True, help="Keep sources evicted from the source cache on disk as Feather files.")
+@click.option('-j', '--jobs', type=click.IntRange(min=1), default=1, show_default=True,
+              help="Run tests in this many worker processes.")
+@click.option('--fail-fast', is_flag=True, help="Stop starting new tests after the first failure.")
+@click.option('-k', '--filter', 'name_filters', multiple=True,
+              help="Only run tests whose name contains this text or matches this glob. Repeatable.")
+@click.option('--junit-xml', type=click.Path(dir_okay=False), default=None, help="Write a JUnit XML report here.")
+def test(filepath, source_cache_mb, spill_sources, jobs, fail_fast, name_filters, junit_xml):
     """Finds and runs tests in a .flow file."""
     print(f"--- Running tests in: {filepath} ---\n")
-    run_flow_tests(filepath)
+    sources.configure(source_cache_mb, spill_sources, default_mb=DEFAULT_TEST_SOURCE_CACHE_MB)
+    if not run_flow_tests(filepath, jobs, fail_fast, list(name_filters), junit_xml):
+        sys.exit(1)
+
+@cli.command()
+@click.option('--rows', 'row_counts', type=click.FloatRange(min=1), multiple=True,
+              help="Rows in the generated datasets, e.g. 1e6; repeat for several scales.  [default: 1e5]")
+@click.option('--seed', type=int, default=0, show_default=True, help="Seed of the synthetic data generator.")
+@click.option('-k', '--scenario', 'scenarios', type=click.Choice(flow_bench.SCENARIO_NAMES), multiple=True,
+              help="Only run this scenario; repeat for several. Runs all of them by default.")
+@click.option('--stream', is_flag=True, help="Run File/Parquet pipelines in chunks.")
+@click.option('--chunk-size', type=click.IntRange(min=1), default=DEFAULT_CHUNK_SIZE, show_default=True,
+              help="Rows per chunk with --stream.")
+@click.option('--workers', type=click.IntRange(min=1), default=None,
+              help="Run eligible pipelines over source partitions on this many processes.")
+@click.option('--engine', type=click.Choice(list(BACKENDS)), default='pandas', show_default=True,
+              help="Execution engine the scenarios are compiled for.")
+@click.option('--repeat', type=click.IntRange(min=1), default=flow_bench.DEFAULT_REPEAT, show_default=True,
+              help="Runs per scenario; the fastest is kept.")
+@click.option('--data-dir', type=click.Path(file_okay=False), default=None,
+              help="Where generated datasets are kept and reused (default: 'bench' in the Flow cache directory).")
+@click.option('-o', '--output', type=click.Path(dir_okay=False), default=None, help="Write the results here as JSON.")
+@click.option('--baseline', type=click.Path(exists=True, dir_okay=False), default=None,
+              help="Compare the results with ones saved by --output, and exit with status 1 on a regression.")
+@click.option('--results', type=click.Path(exists=True, dir_okay=False), default=None,
+              help="Compare these saved results with --baseline instead of running the suite.")
+@click.option('--threshold', type=click.FloatRange(min=0), default=flow_bench.DEFAULT_THRESHOLD, show_default=True,
+              help="Relative growth in wall time or peak RSS that counts as a regression.")
+def bench(row_counts, seed, scenarios, stream, chunk_size, workers, engine, repeat, data_dir, output, baseline,
+          results, threshold):
+    """
+    Benchmarks every transformation, and compiling, on seeded synthetic data, recording
+    wall time, rows/s and peak RSS.
+    """
+    if results:
+        if not baseline:
+            print("❌ Error: --results needs a --baseline to compare with."); sys.exit(1)
+        current = flow_bench.load(results)
+    else:
+        try:
+            current = flow_bench.run_suite([int(rows) for rows in row_counts] or [flow_bench.DEFAULT_ROWS], seed,
+                                           scenarios, engine, chunk_size if stream else None, workers, repeat, data_dir)
+        except Exception as e:
+            print(f"❌ {e}"); sys.exit(1)
+        if output:
+            flow_bench.save(current, output)
+            print(f"✅ Results written to {output}")
+    if not baseline: return
+    reference = flow_bench.load(baseline)
+    if reference.get('options') != current.get('options'):
+        print(f"ℹ️  The baseline was recorded with different options: {reference.get('options')}")
+    comparison = flow_bench.compare(reference, current, threshold)
+    print(f"\n--- Compared with {baseline} ---")
+    print(flow_bench.format_comparison(comparison))
+    regressions = sum(1 for entry in comparison if entry['regressions'])
+    if regressions:
+        print(f"\n❌ {regressions} result(s) regressed by more than {threshold:.0%}."); sys.exit(1)
+    print(f"\n✅ No regressions beyond {threshold:.0%}.")
+
+@cli.command()
+@click.option('--socket', 'socket_path', type=click.Path(dir_okay=False), default=None,
+              help=f"Unix socket to listen on (default: ${server.SOCKET_ENV}, else {server.SOCKET_NAME} in the Flow cache).")
+@click.option('-j', '--jobs', type=click.IntRange(min=1), default=server.DEFAULT_JOBS, show_default=True,
+              help="Jobs run at the same time; later ones wait in the queue.")
+@click.option('--max-queued', type=click.IntRange(min=1), default=server.DEFAULT_MAX_QUEUED, show_default=True,
+              help="Jobs allowed to wait; beyond this, submissions are turned away.")
+@click.option('--source-cache-mb', type=click.FloatRange(min=0), default=None,
+              help=f"Memory budget for sources kept between jobs (default: $FLOW_SOURCE_CACHE_MB, else "
+                   f"{server.DEFAULT_SERVE_SOURCE_CACHE_MB}).")
+@click.option('--spill-sources', is_flag=True, help="Keep sources evicted from the source cache on disk as Feather files.")
+@click.option('--work-dir', type=click.Path(file_okay=False), default=None,
+              help="Where jobs submitted with --materialize keep variables (default: the 'work' directory in the Flow cache).")
+@click.option('--status', is_flag=True, help="Print the status of the running server and exit.")
+@click.option('--stop', is_flag=True, help="Stop the running server.")
+def serve(socket_path, jobs, max_queued, source_cache_mb, spill_sources, work_dir, status, stop):
+    """Runs a long-lived server that keeps Flow warm and runs jobs sent by `flow submit`."""
+    if status or stop:
+        try:
+            reply = server.request({'op': 'stop' if stop else 'status'}, socket_path)
+        except OSError:
+            print(f"❌ Error: No Flow server is listening on {socket_path or server.socket_path()}."); sys.exit(1)
+        if stop: print("🧹 Flow server stopping.")
+        else: print(json.dumps(reply, indent=2))
+        return
+    from . import materialize
+    sources.configure(source_cache_mb, spill_sources, default_mb=server.DEFAULT_SERVE_SOURCE_CACHE_MB)
+    materialize.configure(work_dir)
+    try:
+        server.serve(socket_path, jobs, max_queued)
+    except Exception as e:
+        print(f"❌ {e}"); sys.exit(1)
+
+@cli.command()
+@click.argument('filepath', type=click.Path(exists=True, dir_okay=False))
+@click.option('--socket', 'socket_path', type=click.Path(dir_okay=False), default=None,
+              help=f"Socket of the server (default: ${server.SOCKET_ENV}, else {server.SOCKET_NAME} in the Flow cache).")
+@click.option('--no-cache', is_flag=True, help="Recompile the script even if a cached build exists.")
+@click.option('--stream', is_flag=True, help="Process File/Parquet pipelines in chunks to bound memory use.")
+@click.option('--chunk-size', type=click.IntRange(min=1), default=DEFAULT_CHUNK_SIZE, show_default=True,
+              help="Rows per chunk with --stream.")
+@click.option('--engine', type=click.Choice(list(BACKENDS)), default='pandas', show_default=True,
+              help="Execution engine to generate code for.")
+@click.option('--materialize', 'materialize_variables', is_flag=True,
+              help="Keep assigned variables as memory-mapped Arrow files and reuse them while their sources are unchanged.")
+@click.option('--force', is_flag=True, help="Run every pipeline, even those whose sources and outputs are unchanged.")
+@click.option('--json', 'as_json', is_flag=True, help="Print the server's reply as JSON.")
+def submit(filepath, socket_path, no_cache, stream, chunk_size, engine, materialize_variables, force, as_json):
+    """Runs a .flow script on the `flow serve` server and prints its output and timings."""
+    options = {'chunk_size': chunk_size if stream else None, 'engine': engine,
+               'no_cache': no_cache, 'materialize': materialize_variables, 'force': force}
+    message = {'op': 'run', 'path': os.path.abspath(filepath), 'cwd': os.getcwd(), 'options': options}
+    try:
+        reply = server.request(message, socket_path)
+    except OSError as e:
+        print(f"❌ Error: Could not reach a Flow server on {socket_path or server.socket_path()}; "
+              f"start one with `flow serve`. {e}"); sys.exit(1)
+    if as_json:
+        print(json.dumps(reply, indent=2))
+    else:
+        if reply.get('output'): print(reply['output'], end="")
+        for note in reply.get('notes', []):
+            print(f"ℹ️  {note}")
+        timings = reply.get('timings', {})
+        if reply['status'] == 'ok':
+            cached = " (cached)" if reply.get('from_cache') else ""
+            print(f"✅ Script finished successfully in {timings['total']:.3f}s: queued {timings['queued']:.3f}s, "
+                  f"compile {timings['compile']:.3f}s{cached}, run {timings['run']:.3f}s.")
+        else:
+            print(f"❌ {reply['error']}")
+    if reply['status'] != 'ok': sys.exit(1)
+
+@cli.command(name='clear-cache')
+def clear_cache():
+    """
+    Deletes all cached compiled scripts, spilled sources, join key indexes, materialized
+    variables and incremental run state (so every pipeline runs, and every incremental
+    source is read in full, next time).
+    """
+    from . import joins, materialize, watermarks
+    removed = CompileCache().clear()
+    removed_sources = sources.clear_spilled()
+    removed_indexes = joins.clear_indexes()
+    removed_variables = materialize.clear()
+    removed_states = incremental.clear()
+    removed_watermarks = watermarks.clear()
+    print(f"🧹 Removed {removed} cached script(s), {removed_sources} spilled source(s), "
+          f"{removed_indexes} join index(es), {removed_variables} materialized variable(s), "
+          f"{removed_states} run state(s) and {removed_watermarks} incremental source state(s).")
 
 if __name__ == '__main__':
     cli()
\ No newline at end of file
@@ -0,0 +1,127 @@
+# src/compiler.py
+
+import importlib
+import os
+from lark import Lark
+from .backends import get_backend
+from .cache import CompileCache, CompiledScript, get_cache_dir
+from .planner import QueryPlanner, resolve_source_files
+from .transpiler import FlowTranspiler
+from .validator import Validator
+
+# Modules compiled scripts import their runtime helpers from (and, through them, pandas and pyarrow).
+RUNTIME_MODULES = ['aggregation', 'arrow_ops', 'datasets', 'ingest', 'joins', 'kernels', 'materialize', 'parallel',
+                   'profiling', 'scheduler', 'sql', 'streaming', 'watermarks']
+GRAMMAR_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "flow.lark")
+PARSER_CACHE_FILE = "flow_parser.lalr"
+
+_parser = None
+
+
+def build_parser(algorithm='lalr', use_cache=True):
+    """
+    Builds a parser for flow.lark. The LALR tables are serialized to the Flow cache
+    directory the first time they are built; Lark checks the grammar hash and its
+    own version when loading, so a stale file is simply rebuilt.
+    """
+    options = {}
+    if algorithm == 'lalr' and use_cache:
+        cache_dir = get_cache_dir()
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            options['cache'] = os.path.join(cache_dir, PARSER_CACHE_FILE)
+        except OSError:
+            pass  # Fall back to building the tables in memory.
+    # Positions let plans, notes and profiles point back at .flow line numbers.
+    return Lark.open(GRAMMAR_PATH, start='start', parser=algorithm, propagate_positions=True, **options)
+
+
+def get_parser():
+    """Returns the process-wide LALR parser, loading it on first use."""
+    global _parser
+    if _parser is None:
+        _parser = build_parser()
+    return _parser
+
+
+def preload():
+    """Loads the parser and the runtime modules now, so the first script compiled and run does not pay for them."""
+    get_parser()
+    for name in RUNTIME_MODULES: importlib.import_module(f"{__package__}.{name}")
+
+
+def parse_flow(flow_code):
+    """Parses Flow source code into a Lark parse tree."""
+    return get_parser().parse(flow_code)
+
+
+def plan_flow(flow_code, chunk_size=None, workers=None, engine='pandas'):
+    """Parses a .flow script and returns its LogicalPlan without generating code."""
+    return QueryPlanner(parse_flow(flow_code), chunk_size, workers, get_backend(engine).supports_chunking).build()
+
+
+def _options(chunk_size, workers, engine, profile, materialize):
+    return {'chunk_size': chunk_size, 'workers': workers, 'engine': engine, 'profile': profile,
+            'materialize': materialize}
+
+
+def load_plan(flow_code, use_cache=True, cache=None, chunk_size=None, workers=None, engine='pandas', profile=False,
+              materialize=False):
+    """
+    Returns the LogicalPlan incremental runs check before compiling. compile_flow keeps
+    the plan with its cache entry, so for a script built before this skips parsing and
+    planning; only the source files are resolved again.
+    """
+    if use_cache:
+        cache = cache or CompileCache()
+        cached = cache.load(cache.key(flow_code, _options(chunk_size, workers, engine, profile, materialize)))
+        if cached and cached.plan:
+            resolve_source_files(cached.plan)
+            return cached.plan
+    return plan_flow(flow_code, chunk_size, workers, engine)
+
+
+def compile_flow(flow_code, use_cache=True, cache=None, chunk_size=None, workers=None, engine='pandas', profile=False,
+                 materialize=False, up_to_date=()):
+    """
+    Parses, validates and transpiles a .flow script, returning a CompiledScript.
+    On a cache hit all three stages are skipped. Validation errors raise ValueError.
+    A `chunk_size` compiles eligible pipelines to stream their input in chunks, and
+    `workers` runs them over source partitions on a process pool. `engine` picks the
+    backend the script is generated for ('pandas' or 'arrow'), and `profile` makes
+    the script record per-step timings through the profiling module. `materialize`
+    keeps assigned variables in the work directory between runs (see materialize.py),
+    and `up_to_date` lists the plan nodes whose sinks are current and are left out.
+    """
+    backend = get_backend(engine)
+    if (chunk_size or workers) and not backend.supports_chunking:
+        raise ValueError(f"Error: The '{engine}' engine does not support --stream or --workers.")
+    cache = cache or CompileCache()
+    options = _options(chunk_size, workers, engine, profile, materialize)
+    key = cache.key(flow_code, {**options, 'up_to_date': tuple(up_to_date)}) if use_cache else None
+    if key:
+        cached = cache.load(key)
+        if cached: return cached
+
+    parse_tree = parse_flow(flow_code)
+    plan = QueryPlanner(parse_tree, chunk_size, workers, backend.supports_chunking, up_to_date).build()
+    if not backend.supports_incremental and any(source.incremental for source in plan.sources.values()):
+        raise ValueError(f"Error: The '{engine}' engine does not support incremental sources.")
+    # The planner has collected the schemas, so an invalid script fails before any code is generated.
+    variable_schemas = {name: source.schema_name for name, source in plan.sources.items()
+                        if source.schema_name in plan.schemas}
+    Validator(dict(plan.schemas), variable_schemas).visit(parse_tree)
+    transpiler = FlowTranspiler(plan, backend, profile, materialize)
+    python_script = transpiler.transform(parse_tree)
+
+    code = compile(python_script, "<flow>", "exec")
+    compiled = CompiledScript(python_script, code, transpiler.schemas, transpiler.variable_schemas, plan.notes(),
+                              plan=plan)
+    if key:
+        try:
+            cache.store(key, compiled)
+            # Also under the options alone, where load_plan finds it whichever pipelines were up to date.
+            cache.store(cache.key(flow_code, options), compiled)
+        except OSError:
+            pass  # An unwritable cache directory must never fail the run.
+    return compiled
@@ -0,0 +1,238 @@
+# src/datasets.py
+#
+# Runtime helpers for File and Parquet sinks declared with write options, and for
+# reading the Parquet datasets they write. A sink may be
+#
+#   partition_by: "a,b"    written as a Hive-partitioned directory, one a=<value>/b=<value>
+#                          subdirectory per key with the key columns left out of its files;
+#   compression: "zstd"    the Parquet codec, or gzip/zstd/bz2 for a CSV;
+#   row_group_size: N      Parquet row groups of at most N rows;
+#   sort_by: "a,b"         sorted ascending (stably) before it is written.
+#
+# Frames are converted and written a batch at a time, so an output is never held
+# twice in memory, and streamed pipelines append chunk by chunk. A partitioned
+# output is written next to its path and swapped in once complete. A Parquet source
+# whose path is a directory is read as such a dataset: partition columns come back
+# from the directory names, and pushed-down filters on them skip whole directories.
+
+import io
+import os
+import shutil
+from collections import OrderedDict
+from urllib.parse import quote, unquote
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from .planner import CSV_CODECS
+
+# The directory name Hive (and pyarrow) give the partition of missing keys.
+NULL_PARTITION = "__HIVE_DEFAULT_PARTITION__"
+# Rows converted from pandas to Arrow at a time when a frame is written.
+WRITE_BATCH_ROWS = 64 * 1024
+# Partition files kept open at once; past this the least recently written one is
+# closed, and its partition continues in a new part file.
+MAX_OPEN_FILES = 128
+
+
+def is_dataset(path):
+    return os.path.isdir(path)
+
+
+def data_files(path):
+    """The data files of a dataset directory, skipping hidden and '_'-prefixed entries as pyarrow does."""
+    found = []
+    for root, dirs, names in os.walk(path):
+        dirs[:] = sorted(d for d in dirs if not d.startswith(('.', '_')))
+        found += [os.path.join(root, name) for name in sorted(names) if not name.startswith(('.', '_'))]
+    return found
+
+
+def _partition_types(path, fields=None):
+    """
+    The partition columns of a dataset directory and their types: declared ones from
+    `fields`, else int64 when every value is an integer and string otherwise.
+    """
+    from .ingest import ARROW_TYPES
+    values = OrderedDict()  # Column -> values seen in directory names.
+    for file in data_files(path):
+        for segment in os.path.relpath(os.path.dirname(file), path).split(os.sep):
+            name, sep, value = segment.partition('=')
+            if sep: values.setdefault(name, set()).add(unquote(value))
+    types = []
+    for name, seen in values.items():
+        if fields and name in fields: types.append((name, ARROW_TYPES[fields[name]]))
+        else:
+            present = [v for v in seen if v != NULL_PARTITION]
+            integral = present and all(v.lstrip('+-').isdigit() for v in present)
+            types.append((name, pa.int64() if integral else pa.string()))
+    return pa.schema(types)
+
+
+def dataset(path, fields=None, files=None):
+    """A pyarrow Dataset over a Parquet file or dataset directory (or just `files` of the latter)."""
+    if not is_dataset(path): return ds.dataset(path, format='parquet')
+    partitioning = ds.HivePartitioning(_partition_types(path, fields), null_fallback=NULL_PARTITION)
+    return ds.dataset(files if files is not None else path, format='parquet', partitioning=partitioning,
+                      partition_base_dir=path if files is not None else None)
+
+
+def schema(path):
+    return dataset(path).schema if is_dataset(path) else pq.read_schema(path)
+
+
+def read_table(path, columns=None, filters=None, fields=None):
+    """
+    Reads a Parquet file or dataset directory as a Table. Filters on partition columns
+    skip the directories that cannot match without opening their files.
+    """
+    if not is_dataset(path): return pq.read_table(path, columns=columns, filters=filters)
+    expression = pq.filters_to_expression(filters) if filters else None
+    return dataset(path, fields).to_table(columns=columns, filter=expression)
+
+
+def read_parquet(path, columns=None, filters=None):
+    """A Parquet file or dataset directory as a DataFrame; files read exactly as pd.read_parquet does."""
+    if not is_dataset(path): return pd.read_parquet(path, columns=columns, filters=filters)
+    return read_table(path, columns, filters).to_pandas()
+
+
+def _segment(name, value):
+    if value is None or (not isinstance(value, str) and pd.isna(value)): return f"{name}={NULL_PARTITION}"
+    return f"{name}={quote(str(value), safe='')}"
+
+
+class _PartFile:
+    """One output file, written a table or frame at a time."""
+    def __init__(self, path, kind, compression, row_group_size, schema=None):
+        self.path, self.kind = path, kind
+        self.compression, self.row_group_size = compression, row_group_size
+        self.schema = schema  # Parquet: the schema every batch is cast to.
+        self.started = False
+        if kind == 'File':
+            raw = pa.OSFile(path, 'wb')
+            self.stream = pa.CompressedOutputStream(raw, compression) if compression else raw
+            self.text = io.TextIOWrapper(self.stream, encoding='utf-8', newline='')
+        else:
+            self.writer = None
+
+    def write(self, data):
+        if self.kind == 'File':
+            if isinstance(data, pa.Table):
+                self.text.flush()
+                pa_csv.write_csv(data, self.stream, pa_csv.WriteOptions(include_header=not self.started,
+                                                                       quoting_style='needed'))
+            else:
+                data.to_csv(self.text, index=False, header=not self.started)
+            self.started = True
+            return
+        table = data if isinstance(data, pa.Table) else pa.Table.from_pandas(data, preserve_index=False)
+        if self.writer is None:
+            self.schema = self.schema or table.schema
+            self.writer = pq.ParquetWriter(self.path, self.schema, compression=self.compression or 'snappy')
+        if table.schema != self.schema: table = table.cast(self.schema)
+        self.writer.write_table(table, row_group_size=self.row_group_size)
+        self.started = True
+
+    def close(self):
+        if self.kind == 'File':
+            self.text.flush()
+            self.text.detach()
+            self.stream.close()
+        elif self.writer is not None:
+            self.writer.close()
+
+
+class SinkWriter:
+    """
+    Writes DataFrame or Table chunks to a File/Parquet sink with write options. Plain
+    sinks use streaming.ChunkWriter.
+    """
+    def __init__(self, path, kind, partition_by=None, compression=None, row_group_size=None):
+        self.path, self.kind = path, kind
+        self.partition_by = list(partition_by or [])
+        self.compression, self.row_group_size = compression, row_group_size
+        self.rows_written = 0
+        self.schema = None         # Parquet: the schema of the first chunk, without partition columns.
+        self.empty = None          # The last empty chunk, for an unpartitioned sink that gets no rows.
+        self.files = OrderedDict()  # Partition directory -> open _PartFile, least recently written first.
+        self.parts = {}            # Partition directory -> part files started in it.
+        self.target = path
+        if self.partition_by:
+            self.target = f"{path}.{os.getpid()}.tmp"
+            shutil.rmtree(self.target, ignore_errors=True)  # Left over from a failed run.
+            os.makedirs(self.target)
+
+    def _file(self, directory):
+        if directory in self.files:
+            self.files.move_to_end(directory)
+            return self.files[directory]
+        if not self.partition_by:
+            self.files[directory] = _PartFile(self.path, self.kind, self.compression, self.row_group_size)
+            return self.files[directory]
+        if len(self.files) >= MAX_OPEN_FILES: self.files.popitem(last=False)[1].close()
+        part = self.parts[directory] = self.parts.get(directory, -1) + 1
+        suffix = '.parquet' if self.kind == 'Parquet' else '.csv' + CSV_CODECS.get(self.compression, '')
+        os.makedirs(os.path.join(self.target, directory), exist_ok=True)
+        self.files[directory] = _PartFile(os.path.join(self.target, directory, f"part-{part}{suffix}"),
+                                          self.kind, self.compression, self.row_group_size, self.schema)
+        return self.files[directory]
+
+    def _batches(self, data):
+        """Slices of a frame small enough to convert at once; Parquet slices end on row group boundaries."""
+        if isinstance(data, pa.Table) or len(data) <= WRITE_BATCH_ROWS: return [data]
+        size = WRITE_BATCH_ROWS
+        if self.kind == 'Parquet' and self.row_group_size: size = max(1, size // self.row_group_size) * self.row_group_size
+        return [data.iloc[start:start + size] for start in range(0, len(data), size)]
+
+    def write(self, data):
+        if len(data) == 0:
+            self.empty = data
+            return
+        if not self.partition_by:
+            for batch in self._batches(data): self._file('').write(batch)
+            self.rows_written += len(data)
+            return
+        is_table = isinstance(data, pa.Table)
+        keys = data.select(self.partition_by).to_pandas() if is_table else data[self.partition_by]
+        groups = keys.groupby(self.partition_by, dropna=False, sort=False, observed=True).indices
+        rest = data.drop_columns(self.partition_by) if is_table else data.drop(columns=self.partition_by)
+        if self.kind == 'Parquet' and self.schema is None:
+            self.schema = rest.schema if is_table else pa.Schema.from_pandas(rest.head(WRITE_BATCH_ROWS), preserve_index=False)
+        for key, rows in groups.items():
+            key = key if isinstance(key, tuple) else (key,)
+            directory = os.path.join(*(_segment(name, value) for name, value in zip(self.partition_by, key)))
+            part = rest.take(rows) if is_table else rest.iloc[rows]
+            for batch in self._batches(part): self._file(directory).write(batch)
+        self.rows_written += len(data)
+
+    def close(self, failed=False):
+        for part in self.files.values(): part.close()
+        self.files.clear()
+        if not self.partition_by:
+            if not self.rows_written and self.empty is not None and not failed:
+                part = _PartFile(self.path, self.kind, self.compression, self.row_group_size)
+                part.write(self.empty)  # An empty input still produces the sink file.
+                part.close()
+            return
+        if failed:
+            shutil.rmtree(self.target, ignore_errors=True)  # The previous output stays in place.
+            return
+        old = f"{self.path}.{os.getpid()}.old"
+        if os.path.isdir(self.path): os.rename(self.path, old)
+        elif os.path.exists(self.path): os.remove(self.path)
+        os.rename(self.target, self.path)
+        shutil.rmtree(old, ignore_errors=True)
+
+    def __enter__(self): return self
+    def __exit__(self, exc_type, *exc_info): self.close(failed=exc_type is not None)
+
+
+def write(data, kind, path, partition_by=None, compression=None, row_group_size=None, sort_by=None):
+    """Writes a whole DataFrame or Table to a File/Parquet sink with write options."""
+    if sort_by:
+        if isinstance(data, pa.Table): data = data.sort_by([(column, 'ascending') for column in sort_by])
+        else: data = data.sort_values(by=sort_by, kind='stable')
+    with SinkWriter(path, kind, partition_by, compression, row_group_size) as writer:
+        writer.write(data)
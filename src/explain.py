@@ -0,0 +1,165 @@
+# src/explain.py
+#
+# Renders a LogicalPlan (`flow explain`) and the records of a profiled run
+# (`flow explain --analyze`) as a tree for people or as JSON for tools.
+
+from lark import Token, Tree
+from .planner import JoinPlan, PipelinePlan, sink_options
+
+
+def expression_text(node):
+    """Turns an expression parse tree back into Flow source text."""
+    if isinstance(node, Token): return node.value
+    if node.data == 'column_ref': return f"{node.children[0]}.{node.children[1]}"
+    parts = []
+    for child in node.children:
+        text = expression_text(child)
+        # A nested boolean or arithmetic expression was parenthesized in the source.
+        if node.data == 'factor' and isinstance(child, Tree) and child.data != 'column_ref': text = f"({text})"
+        parts.append(text)
+    return " ".join(parts)
+
+
+def describe_step(op_type, args):
+    if op_type == 'filter': return expression_text(args)
+    if op_type in ('select', 'sort', 'group_by'): return ", ".join(args)
+    if op_type == 'mutate': return ", ".join(f"{name} = {expression_text(expr)}" for name, expr in args.items())
+    if op_type == 'aggregate':
+        return ", ".join(f"{name} = {func}({col or ''})" for name, (col, func) in args.items())
+    return str(args)
+
+
+def _execution(plan, node):
+    if node.up_to_date: return "skipped: up to date"
+    if not node.live: return "skipped: never used by a sink or assert"
+    if isinstance(node, PipelinePlan) and node.delta: return f"new rows of '{node.delta}' only"
+    if isinstance(node, PipelinePlan) and node.streaming:
+        return f"partitioned on {plan.workers} workers" if plan.workers else f"streamed in chunks of {plan.chunk_size} rows"
+    if isinstance(node, JoinPlan): return node.strategy(plan.workers)
+    return "in memory"
+
+
+def plan_to_dict(plan):
+    """A JSON-serializable description of a LogicalPlan."""
+    sources = []
+    for source in plan.sources.values():
+        location = source.args.get('path') or source.args.get('table')
+        sources.append({'name': source.name, 'kind': source.kind, 'location': location, 'line': source.line,
+                        'columns': source.columns, 'filters': [list(f) for f in source.filters],
+                        'loaded': source.materialize, 'new_rows_only': source.delta,
+                        'aggregate': source.aggregate and {'group_by': source.aggregate[0],
+                                                           'aggs': {k: list(v) for k, v in source.aggregate[1].items()}}})
+    nodes = []
+    for node in plan.nodes:
+        if isinstance(node, JoinPlan):
+            nodes.append({'type': 'join', 'line': node.line, 'target': node.target, 'left': node.left,
+                          'right': node.right, 'on': [node.left_on, node.right_on],
+                          'execution': _execution(plan, node), 'estimated_bytes': node.estimated_bytes})
+            continue
+        steps = []
+        for index, ((op_type, args), line) in enumerate(zip(node.steps, node.step_lines)):
+            if op_type == 'sink':
+                sink = plan.sinks.get(args, {})
+                sink_args = sink.get('args', {})
+                detail = f"{sink.get('name')} {sink_args.get('path') or sink_args.get('table', '')}".strip()
+                options = sink_options(args, sink.get('name'), sink_args) if sink else {}
+                if options:
+                    detail += " (" + ", ".join(f"{key} {','.join(value) if isinstance(value, list) else value}"
+                                               for key, value in options.items()) + ")"
+                steps.append({'op': 'sink', 'name': args, 'detail': detail, 'line': line})
+            else:
+                steps.append({'op': op_type, 'detail': describe_step(op_type, args), 'line': line,
+                              'in_database': index < node.pushed_steps})
+        nodes.append({'type': 'pipeline', 'line': node.line, 'target': node.target, 'start': node.start,
+                      'execution': _execution(plan, node), 'note': node.stream_blocker, 'steps': steps})
+    return {'sources': sources, 'nodes': nodes}
+
+
+def _tree(lines, items, render, prefix=""):
+    """Appends `items` to `lines` with box-drawing branches; render(item) -> (text, children)."""
+    for i, item in enumerate(items):
+        last = i == len(items) - 1
+        text, children = render(item)
+        lines.append(f"{prefix}{'└─' if last else '├─'} {text}")
+        _tree(lines, children, render, prefix + ("   " if last else "│  "))
+
+
+def _at(line):
+    return f"  (line {line})" if line else ""
+
+
+def format_plan(plan_dict, engine='pandas'):
+    lines = [f"Plan ({engine} engine)"]
+    def render(item):
+        kind = item.get('type')
+        if kind is None and 'kind' in item:  # A source.
+            text = f"source {item['name']}: {item['kind']} {item['location']}{_at(item['line'])}"
+            if item['columns'] is not None: text += f"  columns: {', '.join(item['columns'])}"
+            if item['filters']: text += "  filters: " + " and ".join(f"{c} {op} {v!r}" for c, op, v in item['filters'])
+            if item.get('aggregate'):
+                aggs = ", ".join(f"{name} = {func}({col})" for name, (col, func) in item['aggregate']['aggs'].items())
+                text += f"  aggregated in database: group_by {', '.join(item['aggregate']['group_by'])}: {aggs}"
+            if item.get('new_rows_only'): text += "  [new rows only]"
+            if not item['loaded']: text += "  [not loaded here]"
+            return text, []
+        if kind == 'join':
+            text = f"{item['target']} = join({item['left']}, {item['right']}) on {item['on'][0]} == {item['on'][1]}"
+            text = f"{text}{_at(item['line'])}  [{item['execution']}]"
+            if item['estimated_bytes']:
+                text += "  (on disk: " + ", ".join(f"{side} {_size(size)}" for side, size in item['estimated_bytes'].items()) + ")"
+            return text, []
+        if kind == 'pipeline':
+            head = f"{item['target']} = {item['start']}" if item['target'] else item['start']
+            text = f"{head}{_at(item['line'])}  [{item['execution']}]"
+            if item['note'] and item['execution'] == 'in memory': text += f"  ({item['note']})"
+            return text, item['steps']
+        # A pipeline step.
+        name = f"sink {item['name']}" if item['op'] == 'sink' else item['op']
+        text = f"{name} {item['detail']}".rstrip() + _at(item['line'])
+        return text + ("  [in database]" if item.get('in_database') else ""), []
+    _tree(lines, plan_dict['sources'] + plan_dict['nodes'], render)
+    return "\n".join(lines)
+
+
+def _size(num_bytes):
+    for unit in ("B", "KB", "MB", "GB"):
+        if abs(num_bytes) < 1024 or unit == "GB": break
+        num_bytes /= 1024
+    return f"{num_bytes:.1f} {unit}" if unit != "B" else f"{num_bytes} B"
+
+
+def _measurements(record):
+    parts = [f"{record['seconds']:.3f}s"]
+    rows_in, rows_out = record['rows_in'], record['rows_out']
+    if rows_in is not None and rows_out is not None: parts.append(f"{rows_in:,} → {rows_out:,} rows")
+    elif rows_in is not None: parts.append(f"{rows_in:,} rows")
+    elif rows_out is not None: parts.append(f"{rows_out:,} rows")
+    if record['bytes_read'] is not None: parts.append(f"read {_size(record['bytes_read'])}")
+    if record['bytes_written'] is not None: parts.append(f"wrote {_size(record['bytes_written'])}")
+    if record['memory_delta_bytes'] is not None:
+        sign = "+" if record['memory_delta_bytes'] >= 0 else "-"
+        parts.append(f"mem {sign}{_size(abs(record['memory_delta_bytes']))}")
+    return "  ".join(parts)
+
+
+def profile_to_dict(records):
+    return {'total_seconds': sum(r['seconds'] for r in records), 'steps': records}
+
+
+def format_profile(records):
+    """Groups profile records by the statement they came from, in execution order."""
+    groups = {}
+    for record in records:
+        groups.setdefault((record['node'], record['node_line']), []).append(record)
+    lines = [f"Profile (total {sum(r['seconds'] for r in records):.3f}s)"]
+    def render(item):
+        if isinstance(item, tuple):
+            (node, node_line), steps = item
+            total = sum(r['seconds'] for r in steps)
+            if len(steps) == 1: return f"{node}{_at(node_line)}: {steps[0]['step']}  {_measurements(steps[0])}", []
+            return f"{node}{_at(node_line)}  {total:.3f}s", steps
+        step_lines = ", ".join(str(line) for line in dict.fromkeys(item['lines']))
+        where = f"  (line {step_lines})" if step_lines else ""
+        return f"{item['step']}{where}  {_measurements(item)}", []
+    _tree(lines, list(groups.items()), render)
+    return "\n".join(lines)
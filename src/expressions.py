@@ -0,0 +1,154 @@
+# src/expressions.py
+#
+# The typed expression IR. The transpiler turns filter, mutate and assert
+# expressions into these nodes instead of code strings. Column types are bound from
+# the schema_decl of the pipeline's input (bind_types), and each backend renders the
+# IR: render() reproduces the plain per-operator code through the backend's
+# expression templates, and program() lowers it to the nested tuples the fused
+# kernels in kernels.py evaluate.
+
+import ast
+
+class Column:
+    def __init__(self, name, dtype=None):
+        self.name = name
+        self.dtype = dtype   # Flow type from the schema, None when unknown.
+
+    def columns(self): return [self.name]
+    def __repr__(self): return f"Column({self.name!r}, {self.dtype!r})"
+
+
+class Literal:
+    def __init__(self, text):
+        self.text = text     # As written: 40, 2.5, 'active'
+        self.value = ast.literal_eval(text)
+        self.dtype = 'string' if isinstance(self.value, str) else 'float' if isinstance(self.value, float) else 'int'
+
+    def columns(self): return []
+    def __repr__(self): return f"Literal({self.text!r})"
+
+
+class Arith:
+    """A left-associative chain from `arith_expr` ('+'/'-') or `term` ('*'/'/'): operand, op, operand, ..."""
+    def __init__(self, rule, items):
+        self.rule = rule
+        self.items = items
+        self.dtype = None
+
+    def operands(self): return self.items[::2]
+    def columns(self): return [c for operand in self.operands() for c in operand.columns()]
+    def __repr__(self): return f"Arith({self.rule!r}, {self.items!r})"
+
+
+class Comparison:
+    def __init__(self, left, op, right):
+        self.left, self.op, self.right = left, op, right
+        self.dtype = 'bool'
+
+    def columns(self): return self.left.columns() + self.right.columns()
+    def __repr__(self): return f"Comparison({self.left!r}, {self.op!r}, {self.right!r})"
+
+
+class BoolExpr:
+    """Operands joined by '&' ('and') and '|' ('or'); '&' binds tighter."""
+    def __init__(self, items):
+        self.items = items
+        self.dtype = 'bool'
+
+    def columns(self): return [c for operand in self.items[::2] for c in operand.columns()]
+    def __repr__(self): return f"BoolExpr({self.items!r})"
+
+
+class Conjunction:
+    """The conditions of consecutive filters fused into one."""
+    def __init__(self, conditions):
+        self.conditions = conditions
+        self.dtype = 'bool'
+
+    def columns(self): return [c for condition in self.conditions for c in condition.columns()]
+    def __repr__(self): return f"Conjunction({self.conditions!r})"
+
+
+def conjunction(conditions):
+    """Fuses filter conditions, flattening conditions that are already conjunctions."""
+    flat = []
+    for condition in conditions:
+        flat.extend(condition.conditions if isinstance(condition, Conjunction) else [condition])
+    return Conjunction(flat)
+
+
+def _arith_type(left, right, op):
+    """Result type of `left op right`; strings only add to strings."""
+    if left is None or right is None: return None
+    if 'string' in (left, right): return 'string' if left == right == 'string' and op == '+' else None
+    if op == '/' or 'float' in (left, right): return 'float'
+    return 'int'
+
+
+def bind_types(expr, types):
+    """Sets the Flow type of every node from `types` (column -> type) and returns the expression's type."""
+    if isinstance(expr, Column):
+        expr.dtype = types.get(expr.name)
+    elif isinstance(expr, Arith):
+        dtype = bind_types(expr.items[0], types)
+        for i in range(1, len(expr.items), 2):
+            dtype = _arith_type(dtype, bind_types(expr.items[i + 1], types), expr.items[i])
+        expr.dtype = dtype
+    elif isinstance(expr, Comparison):
+        bind_types(expr.left, types)
+        bind_types(expr.right, types)
+    elif isinstance(expr, BoolExpr):
+        for operand in expr.items[::2]: bind_types(operand, types)
+    elif isinstance(expr, Conjunction):
+        for condition in expr.conditions: bind_types(condition, types)
+    return expr.dtype
+
+
+def operator_count(expr):
+    if isinstance(expr, (Column, Literal)): return 0
+    if isinstance(expr, Arith): return len(expr.items) // 2 + sum(operator_count(o) for o in expr.operands())
+    if isinstance(expr, Comparison): return 1 + operator_count(expr.left) + operator_count(expr.right)
+    if isinstance(expr, BoolExpr): return len(expr.items) // 2 + sum(operator_count(o) for o in expr.items[::2])
+    return len(expr.conditions) - 1 + sum(operator_count(c) for c in expr.conditions)
+
+
+def render(expr, backend):
+    """Plain code for the expression, one backend template call per operator; '{df}' is the frame."""
+    if isinstance(expr, Column): return f"{{df}}['{expr.name}']"
+    if isinstance(expr, Literal): return expr.text
+    if isinstance(expr, Arith):
+        items = [item if i % 2 else render(item, backend) for i, item in enumerate(expr.items)]
+        return backend.arith_expr(items) if expr.rule == 'arith_expr' else backend.term(items)
+    if isinstance(expr, Comparison):
+        return backend.comparison(render(expr.left, backend), expr.op, render(expr.right, backend))
+    if isinstance(expr, BoolExpr):
+        return backend.bool_expression([item if i % 2 else render(item, backend) for i, item in enumerate(expr.items)])
+    return backend.conjunction([render(condition, backend) for condition in expr.conditions])
+
+
+def _fold(operands, ops):
+    node = operands[0]
+    for op, operand in zip(ops, operands[1:]): node = (op, node, operand)
+    return node
+
+
+def program(expr):
+    """
+    Lowers the expression to nested tuples with Python's evaluation order:
+    ('col', name), ('lit', value) and (op, left, right) for + - * / > < == != & |.
+    """
+    if isinstance(expr, Column): return ('col', expr.name)
+    if isinstance(expr, Literal): return ('lit', expr.value)
+    if isinstance(expr, Arith): return _fold([program(o) for o in expr.operands()], expr.items[1::2])
+    if isinstance(expr, Comparison): return (expr.op, program(expr.left), program(expr.right))
+    if isinstance(expr, BoolExpr):
+        # Split on '|' first, since '&' binds tighter.
+        groups, current = [], [program(expr.items[0])]
+        for op, operand in zip(expr.items[1::2], expr.items[2::2]):
+            if op == '|':
+                groups.append(current)
+                current = [program(operand)]
+            else: current.append(program(operand))
+        groups.append(current)
+        return _fold([_fold(group, ['&'] * (len(group) - 1)) for group in groups], ['|'] * (len(groups) - 1))
+    return _fold([program(c) for c in expr.conditions], ['&'] * (len(expr.conditions) - 1))
@@ -0,0 +1,165 @@
+# src/incremental.py
+#
+# Incremental runs for `flow run`. The planner hashes every pipeline's definition:
+# its steps, its sinks and everything upstream of it (see
+# QueryPlanner._plan_definitions). After a successful run the script's state file
+# records, for every pipeline that writes sinks, the content hashes of the source
+# files it read and the stamps of the files it wrote, under that definition. The
+# next run skips a pipeline whose definition, sources and outputs still match,
+# and the variables only skipped pipelines read are skipped with it.
+
+import hashlib
+import json
+import os
+from .cache import compiler_digest, get_cache_dir
+from .sources import stamp
+
+STATE_SUBDIR = "state"
+HASH_BLOCK_BYTES = 1024 * 1024
+
+
+def state_path(script_path):
+    digest = hashlib.sha256(os.path.abspath(script_path).encode()).hexdigest()
+    return os.path.join(get_cache_dir(), STATE_SUBDIR, f"{digest}.json")
+
+
+def _stamp(path):
+    try:
+        return stamp(path)
+    except OSError:
+        return None
+
+
+class BuildState:
+    """What the last successful runs of one script read and wrote."""
+    def __init__(self, path, sources=None, pipelines=None):
+        self.path = path
+        self.sources = sources or {}      # Absolute path -> {'stamp': [mtime_ns, size], 'sha256': ...}
+        self.pipelines = pipelines or {}  # Pipeline key -> {'sources': {path: sha256}, 'outputs': {path: stamp}}
+
+    @classmethod
+    def load(cls, script_path):
+        path = state_path(script_path)
+        try:
+            with open(path) as f:
+                state = json.load(f)
+            return cls(path, state['sources'], state['pipelines'])
+        except (OSError, ValueError, KeyError):
+            return cls(path)  # No state yet, or unreadable: everything runs.
+
+    def content_hash(self, path):
+        """
+        SHA-256 of a file's contents (of a dataset directory's file names and contents),
+        rehashed only when its mtime or size changed; None if missing.
+        """
+        current, key = _stamp(path), os.path.abspath(path)
+        if current is None: return None
+        known = self.sources.get(key)
+        if known and known['stamp'] == current: return known['sha256']
+        digest = hashlib.sha256()
+        files = [path]
+        if os.path.isdir(path):
+            files = sorted(os.path.join(root, name) for root, _, names in os.walk(path) for name in names)
+        for file in files:
+            if file != path: digest.update(os.path.relpath(file, path).encode() + b'\0')
+            with open(file, 'rb') as f:
+                for block in iter(lambda: f.read(HASH_BLOCK_BYTES), b''):
+                    digest.update(block)
+        self.sources[key] = {'stamp': current, 'sha256': digest.hexdigest()}
+        return self.sources[key]['sha256']
+
+    def save(self):
+        """Writes the state atomically; an unwritable cache only costs a full run next time."""
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump({'sources': self.sources, 'pipelines': self.pipelines}, f)
+            os.replace(tmp_path, self.path)
+        except OSError:
+            pass
+
+
+def _key(node, engine, digest):
+    """Compiler and engine changes can change outputs as much as an edited pipeline."""
+    return hashlib.sha256(f"{digest}:{engine}:{node.definition}".encode()).hexdigest()
+
+
+def _outputs(plan, node):
+    """The files a node's sinks write, or None when one of them is not a file."""
+    paths = []
+    for sink in node.sinks():
+        info = plan.sinks.get(sink, {})
+        if info.get('name') not in ('File', 'Parquet'): return None
+        paths.append(info['args']['path'])
+    return paths
+
+
+def source_hashes(plan, state):
+    """Content hashes of every source file, taken before the run reads them."""
+    paths = {path for node in plan.nodes if node.source_files for path in node.source_files}
+    return {path: state.content_hash(path) for path in sorted(paths)}
+
+
+def outdated(plan, state, hashes, engine='pandas', force=False):
+    """
+    Returns {node index: reason to run} for every sink-writing node of `plan` that
+    is not up to date. Nodes that write no sink are left to the planner.
+    """
+    digest, reasons = compiler_digest(), {}
+    for index, node in enumerate(plan.nodes):
+        if not node.sinks(): continue
+        outputs = _outputs(plan, node)
+        if force: reasons[index] = "--force"
+        elif node.definition is None or node.source_files is None: reasons[index] = "it reads a database table"
+        elif outputs is None: reasons[index] = "it writes to a database"
+        else:
+            entry = state.pipelines.get(_key(node, engine, digest))
+            if entry is None:
+                reasons[index] = "it is new or its definition changed"
+                continue
+            changed = [path for path in node.source_files if hashes[path] != entry['sources'].get(path)]
+            changed += sorted(set(entry['sources']) - set(node.source_files))  # Files a pattern no longer matches.
+            missing = [path for path in outputs if _stamp(path) != entry['outputs'].get(path)]
+            if changed: reasons[index] = f"source {', '.join(map(repr, changed))} changed"
+            elif missing: reasons[index] = f"output {', '.join(map(repr, missing))} is missing or was modified"
+    return reasons
+
+
+def up_to_date(plan, reasons):
+    return [index for index, node in enumerate(plan.nodes) if node.sinks() and index not in reasons]
+
+
+def describe(node):
+    location = f"line {node.line}, " if node.line else ""
+    return f"{location}writes {', '.join(map(repr, node.sinks()))}"
+
+
+def record(plan, state, hashes, reasons, engine='pandas'):
+    """After a successful run: remembers what every pipeline that ran read and wrote."""
+    digest, keys = compiler_digest(), set()
+    for index, node in enumerate(plan.nodes):
+        if not node.sinks() or node.definition is None or node.source_files is None: continue
+        key = _key(node, engine, digest)
+        keys.add(key)
+        outputs = _outputs(plan, node)
+        if index not in reasons or outputs is None: continue
+        state.pipelines[key] = {'sources': {path: hashes[path] for path in node.source_files},
+                                'outputs': {path: _stamp(path) for path in outputs}}
+    # Pipelines and sources no longer in the script are forgotten.
+    state.pipelines = {key: entry for key, entry in state.pipelines.items() if key in keys}
+    read = {os.path.abspath(path) for path in hashes}
+    state.sources = {path: known for path, known in state.sources.items() if path in read}
+    state.save()
+
+
+def clear():
+    """Deletes the state of every script and returns how many were removed."""
+    state_dir = os.path.join(get_cache_dir(), STATE_SUBDIR)
+    if not os.path.isdir(state_dir): return 0
+    removed = 0
+    for name in os.listdir(state_dir):
+        if name.endswith(".json"):
+            os.remove(os.path.join(state_dir, name))
+            removed += 1
+    return removed
@@ -0,0 +1,241 @@
+# src/ingest.py
+#
+# Typed, compact reads for schema-bound File and Parquet sources in compiled pandas
+# scripts. CSVs are parsed by pyarrow straight into the declared types, and only
+# the declared columns are read. Where the planner found it safe, integers are
+# downcast to the smallest type that holds them, and low-cardinality strings
+# become categoricals. Rows that do not match the schema (a value that does not
+# parse as its declared type, or a row with the wrong number of fields) are written
+# to a reject file rather than failing the run. Sinks widen compact columns back
+# before writing, so the types a script writes do not depend on how it read them.
+# The Arrow engine reads schema-bound sources through read_csv_table() and
+# read_parquet_table(), without the compact storage.
+
+import csv
+import io
+import os
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pa_csv
+from . import datasets
+from .planner import REJECTS_SUFFIX
+
+ARROW_TYPES = {'int': pa.int64(), 'float': pa.float64(), 'string': pa.string(), 'bool': pa.bool_()}
+
+# The values pandas' read_csv treats as missing, so typed reads agree with it.
+NULL_VALUES = ['', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND', '1.#QNAN',
+               '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'None', 'n/a', 'nan', 'null']
+TRUE_VALUES = ['1', 'True', 'TRUE', 'true']
+FALSE_VALUES = ['0', 'False', 'FALSE', 'false']
+
+# What a valid value of each type looks like, for finding the rows a typed read rejected.
+VALID_PATTERNS = {
+    'int': r'^\s*[+-]?\d+\s*$',
+    'float': r'^\s*[+-]?(\d+\.?\d*([eE][+-]?\d+)?|\.\d+([eE][+-]?\d+)?|inf|Inf|INF|infinity|Infinity)\s*$',
+}
+
+# A string column becomes categorical when it has at most this many distinct values per row.
+CATEGORICAL_MAX_RATIO = 0.5
+
+REJECT_REASON_COLUMN = '_flow_reject_reason'
+
+NULLABLE_INTS = {np.dtype('int8'): 'Int8', np.dtype('int16'): 'Int16', np.dtype('int32'): 'Int32',
+                 np.dtype('int64'): 'Int64'}
+
+
+def rejects_path(path):
+    return f"{path}{REJECTS_SUFFIX}"
+
+
+def _file_columns(path, kind):
+    if kind == 'Parquet': return datasets.schema(path).names
+    # pyarrow detects a compressed CSV from its suffix, as the typed read itself does.
+    with io.TextIOWrapper(pa.input_stream(path, compression='detect'), encoding='utf-8', newline='') as f:
+        return next(csv.reader(f), [])
+
+
+def _declared_columns(path, kind, fields, columns):
+    """The declared (and, if given, needed) columns in the order the file has them."""
+    wanted = set(fields) if columns is None else set(fields) & set(columns)
+    file_columns = _file_columns(path, kind)
+    missing = sorted(wanted - set(file_columns))
+    if missing:
+        raise ValueError(f"Flow Execution Error: '{path}' has no column(s) {', '.join(missing)} declared in its schema.")
+    return [c for c in file_columns if c in wanted]
+
+
+def _convert_options(columns, column_types):
+    return pa_csv.ConvertOptions(include_columns=columns, column_types=column_types, null_values=NULL_VALUES,
+                                 true_values=TRUE_VALUES, false_values=FALSE_VALUES, strings_can_be_null=True)
+
+
+def _valid(column, flow_type):
+    """True where a string column's value is missing or parses as `flow_type`."""
+    if flow_type == 'string': return None
+    if flow_type == 'bool': ok = pc.is_in(column, value_set=pa.array(TRUE_VALUES + FALSE_VALUES))
+    else: ok = pc.match_substring_regex(column, VALID_PATTERNS[flow_type])
+    return pc.or_kleene(pc.is_null(column), ok)
+
+
+def _validate(path, fields, columns, parse_options):
+    """
+    Slow path after a typed read failed: reads the columns as text, splits off the
+    rows whose values do not parse, and casts the rest. Returns (table, rejected table).
+    """
+    text = pa_csv.read_csv(path, parse_options=parse_options,
+                           convert_options=_convert_options(columns, {c: pa.string() for c in columns}))
+    valid, reasons = None, None
+    for name in columns:
+        ok = _valid(text[name], fields[name])
+        if ok is None: continue
+        ok = pc.fill_null(ok, False)
+        reason = pc.if_else(ok, pa.scalar(None, pa.string()), pa.scalar(f"{name} is not {fields[name]}"))
+        reasons = reason if reasons is None else pc.coalesce(reasons, reason)
+        valid = ok if valid is None else pc.and_(valid, ok)
+    if valid is None: return text, None
+    good = text.filter(valid)
+    rejected = text.filter(pc.invert(valid)).append_column(REJECT_REASON_COLUMN, reasons.filter(pc.invert(valid)))
+    casts = []
+    for name in columns:
+        column = good[name]
+        if fields[name] == 'bool':
+            column = pc.if_else(pc.is_null(column), pa.scalar(None, pa.bool_()), pc.is_in(column, value_set=pa.array(TRUE_VALUES)))
+        elif fields[name] != 'string':
+            column = pc.cast(pc.utf8_trim_whitespace(column), ARROW_TYPES[fields[name]])
+        casts.append(column)
+    return pa.table(casts, names=columns), rejected
+
+
+def _smallest_int(low, high):
+    for dtype in (np.int8, np.int16, np.int32):
+        info = np.iinfo(dtype)
+        if info.min <= low and high <= info.max: return np.dtype(dtype)
+    return np.dtype(np.int64)
+
+
+def _to_series(column, flow_type, downcast, categorical):
+    """One Arrow column as a pandas Series: ints stay ints even with missing values."""
+    if flow_type == 'int':
+        dtype = np.dtype(np.int64)
+        if downcast and len(column) > column.null_count:
+            bounds = pc.min_max(column)
+            dtype = _smallest_int(bounds['min'].as_py(), bounds['max'].as_py())
+        if column.null_count:
+            return pd.Series(column.to_pandas(types_mapper={pa.int64(): pd.Int64Dtype()}.get)).astype(NULLABLE_INTS[dtype])
+        return pd.Series(column.to_numpy().astype(dtype, copy=False))
+    if flow_type == 'string' and categorical and len(column):
+        if pc.count_distinct(column, mode='all').as_py() <= len(column) * CATEGORICAL_MAX_RATIO:
+            return pd.Series(column.dictionary_encode().to_pandas())
+    if flow_type == 'bool' and column.null_count: return pd.Series(column.to_pandas(types_mapper={pa.bool_(): pd.BooleanDtype()}.get))
+    return pd.Series(column.to_pandas())
+
+
+def _to_frame(holder, fields, downcast, categorical):
+    """
+    Converts the table in the one-item list `holder` one column at a time. The list is
+    emptied first, so each Arrow column is released as soon as it is in pandas.
+    """
+    table = holder.pop()
+    names, data = table.column_names, {}
+    for name in names:
+        column, table = table[name], table.drop_columns([name])
+        data[name] = _to_series(column, fields[name], name in downcast, name in categorical)
+        del column
+    return pd.DataFrame(data, columns=names, copy=False)
+
+
+def widen(df):
+    """
+    Undoes compact storage before a frame reaches a sink: downcast integers go back to
+    64 bits and categoricals back to their values, so what is written has the types
+    an untyped read would give.
+    """
+    casts = {}
+    for name, dtype in df.dtypes.items():
+        if isinstance(dtype, pd.CategoricalDtype): casts[name] = dtype.categories.dtype
+        elif dtype in (np.int8, np.int16, np.int32): casts[name] = np.int64
+        elif dtype in (pd.Int8Dtype(), pd.Int16Dtype(), pd.Int32Dtype()): casts[name] = pd.Int64Dtype()
+    return df.astype(casts) if casts else df
+
+
+def _write_rejects(path, source_path, columns, rejected, bad_rows):
+    """
+    Writes rejected rows, with the reason in a last column, and says so. A row that did
+    not even split into fields keeps its raw text in the first column.
+    """
+    count = (rejected.num_rows if rejected is not None else 0) + len(bad_rows)
+    if not count:
+        if os.path.exists(path): os.remove(path)  # Left over from a run with rejects.
+        return
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(columns + [REJECT_REASON_COLUMN])
+        if rejected is not None and rejected.num_rows:
+            rejected.to_pandas().to_csv(f, index=False, header=False)
+        for text, expected, actual in bad_rows:
+            writer.writerow([text] + [''] * (len(columns) - 1) + [f"expected {expected} fields, got {actual}"])
+    print(f"ℹ️  {count} row(s) of '{source_path}' did not match its schema and were written to '{path}'.")
+
+
+def read_csv_table(path, fields, columns=None, rejects=None, source=None):
+    """
+    Reads a CSV into an Arrow table with the types `fields` declares (column -> Flow
+    type), writing the rows that do not match them to the reject file. `columns`
+    narrows the declared columns to the ones the script needs; `source` is the file
+    the rows came from when `path` holds a copy of some of them.
+    """
+    source = source or path
+    columns = _declared_columns(path, 'File', fields, columns)
+    bad_rows = []
+    def skip(row):
+        bad_rows.append((row.text, row.expected_columns, row.actual_columns))
+        return 'skip'
+    parse_options = pa_csv.ParseOptions(invalid_row_handler=skip)
+    try:
+        table = pa_csv.read_csv(path, parse_options=parse_options, convert_options=_convert_options(
+            columns, {c: ARROW_TYPES[fields[c]] for c in columns}))
+        rejected = None
+    except pa.ArrowInvalid:
+        bad_rows.clear()
+        table, rejected = _validate(path, fields, columns, parse_options)
+    _write_rejects(rejects or rejects_path(source), source, columns, rejected, bad_rows)
+    return table
+
+
+def read_csv(path, fields, columns=None, downcast=(), categorical=(), rejects=None, source=None):
+    """
+    Reads a CSV as read_csv_table() does, into pandas. `downcast` and `categorical`
+    name the columns that may be stored compactly.
+    """
+    holder = [read_csv_table(path, fields, columns, rejects, source)]
+    return _to_frame(holder, fields, downcast, categorical)
+
+
+def read_parquet_table(path, fields, columns=None, filters=None):
+    """
+    Reads the declared (and needed) columns of a Parquet file or dataset directory as
+    a Table, with ints as int64; partition columns take their declared types.
+    """
+    columns = _declared_columns(path, 'Parquet', fields, columns)
+    table = datasets.read_table(path, columns, filters, fields)
+    for i, name in enumerate(table.column_names):
+        if fields[name] == 'int' and pa.types.is_integer(table.schema.field(i).type):
+            table = table.set_column(i, name, table.column(i).cast(pa.int64()))
+    return table
+
+
+def read_parquet(path, fields, columns=None, filters=None, downcast=(), categorical=()):
+    """Reads a Parquet file or dataset directory as read_parquet_table() does, stored as compactly as allowed."""
+    table = read_parquet_table(path, fields, columns, filters)
+    data = {}
+    for name in table.column_names:
+        column, table = table[name], table.drop_columns([name])
+        if fields[name] == 'int' and pa.types.is_integer(column.type):
+            data[name] = _to_series(column, 'int', name in downcast, False)
+        elif fields[name] == 'string' and pa.types.is_string(column.type):
+            data[name] = _to_series(column, 'string', False, name in categorical)
+        else:
+            data[name] = pd.Series(column.to_pandas())
+    return pd.DataFrame(data, copy=False)
@@ -0,0 +1,227 @@
+# src/joins.py
+#
+# Runtime helpers for `join(...)` in compiled pandas scripts. join() picks a
+# strategy from what the planner knows (which sides can be streamed from disk and
+# which are already sorted on the key) and from the actual sizes of the inputs:
+#
+#   broadcast   the small side is indexed once and the big side is streamed from
+#               disk in chunks, so the big side is never fully in memory (only
+#               when a side is streamed; otherwise pd.merge is faster);
+#   sort-merge  a side already sorted on its key is used as the index as is;
+#   partitioned both sides are hash-partitioned and merged on a process pool;
+#   hash        a plain pd.merge.
+#
+# Every strategy returns exactly what pd.merge(left, right, left_on=, right_on=)
+# returns: left rows in order, each followed by its matches in right order.
+
+import hashlib
+import os
+import pickle
+import numpy as np
+import pandas as pd
+from .cache import get_cache_dir
+from .planner import DEFAULT_CHUNK_SIZE
+from .sources import SourceCache, stamp
+
+# A side up to this size in memory is small enough to index and broadcast.
+BROADCAST_MAX_BYTES = 256 * 1024 * 1024
+
+INDEX_SUBDIR = "join_index"
+
+
+class Scan:
+    """A File/Parquet source the planner left on disk so a join can stream it; `fields` are its declared types."""
+    def __init__(self, path, kind, chunk_size=DEFAULT_CHUNK_SIZE, columns=None, fields=None):
+        self.path = path
+        self.kind = kind
+        self.chunk_size = chunk_size
+        self.columns = columns
+        self.fields = fields
+
+    def size_on_disk(self):
+        return stamp(self.path)[1]
+
+    def chunks(self):
+        from .streaming import read_chunks
+        return read_chunks(self.path, self.kind, self.chunk_size, self.columns, fields=self.fields)
+
+    def load(self):
+        if self.fields:
+            from . import ingest
+            if self.kind == 'File': return ingest.read_csv(self.path, self.fields, self.columns)
+            return ingest.read_parquet(self.path, self.fields, self.columns)
+        if self.kind == 'File': return pd.read_csv(self.path, usecols=self.columns)
+        from .datasets import read_parquet
+        return read_parquet(self.path, columns=self.columns)
+
+
+def _nbytes(df):
+    return int(df.memory_usage(deep=True).sum())
+
+
+def _key_array(series):
+    """The key as a numpy array searchsorted can order, or None if only pd.merge handles it."""
+    if series.isna().any() and not pd.api.types.is_float_dtype(series): return None
+    if pd.api.types.is_bool_dtype(series) or pd.api.types.is_numeric_dtype(series): return series.to_numpy()
+    if pd.api.types.is_string_dtype(series):
+        values = series.to_numpy(dtype=object)
+        if all(isinstance(v, str) for v in values): return values
+    return None
+
+
+def _compatible(a, b):
+    """Both keys numeric or both strings; anything else goes through pd.merge and its checks."""
+    return a is not None and b is not None and (a.dtype == object) == (b.dtype == object)
+
+
+class KeyIndex:
+    """
+    The keys of one join side in sorted order, with the row each came from. Probing
+    it with the other side's keys is a pair of binary searches per key, so it can be
+    built once, reused for every chunk of a streamed side, and persisted to disk.
+    """
+    def __init__(self, keys, order):
+        self.keys = keys     # Sorted keys.
+        self.order = order   # order[i] is the row the i-th sorted key came from.
+
+    @classmethod
+    def build(cls, keys, presorted=False):
+        if presorted: return cls(keys, np.arange(len(keys)))
+        order = np.argsort(keys, kind='stable')  # Stable, so equal keys keep row order.
+        return cls(keys[order], order)
+
+    def probe(self, keys):
+        """Returns (probe rows, index rows) for every match, in probe order then index row order."""
+        lo = np.searchsorted(self.keys, keys, side='left')
+        hi = np.searchsorted(self.keys, keys, side='right')
+        counts = hi - lo
+        probe_rows = np.repeat(np.arange(len(keys)), counts)
+        offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        return probe_rows, self.order[np.repeat(lo, counts) + offsets]
+
+
+def _index_path(source, key):
+    """`source` is (path, reader call); the key also covers the file's mtime and size."""
+    stamp = SourceCache.file_key(source[0], source[1]) + (key,)
+    digest = hashlib.sha256(repr(stamp).encode()).hexdigest()
+    return os.path.join(get_cache_dir(), INDEX_SUBDIR, f"{digest}.pkl")
+
+
+def key_index(df, key, keys, presorted=False, source=None):
+    """Builds the index of a side, or loads the one persisted for the same unchanged source file."""
+    if source is None or presorted: return KeyIndex.build(keys, presorted)
+    path = _index_path(source, key)
+    try:
+        with open(path, 'rb') as f:
+            sorted_keys, order = pickle.load(f)
+        if len(order) == len(df): return KeyIndex(sorted_keys, order)
+    except (OSError, EOFError, ValueError, pickle.UnpicklingError):
+        pass
+    index = KeyIndex.build(keys)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            pickle.dump((index.keys, index.order), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+    except OSError:
+        pass  # An unwritable cache only costs a rebuild next time.
+    return index
+
+
+def clear_indexes():
+    """Deletes every persisted key index and returns how many were removed."""
+    index_dir = os.path.join(get_cache_dir(), INDEX_SUBDIR)
+    if not os.path.isdir(index_dir): return 0
+    removed = 0
+    for name in os.listdir(index_dir):
+        if name.endswith(".pkl"):
+            os.remove(os.path.join(index_dir, name))
+            removed += 1
+    return removed
+
+
+def _assemble(left, right, left_rows, right_rows, left_on, right_on):
+    """Builds pd.merge's output columns (shared key once, '_x'/'_y' suffixes) from matched row pairs."""
+    left_part = left.take(left_rows).reset_index(drop=True)
+    right_part = right.take(right_rows).reset_index(drop=True)
+    if left_on == right_on: right_part = right_part.drop(columns=[right_on])
+    overlap = set(left_part.columns) & set(right_part.columns)
+    left_part = left_part.rename(columns={c: f"{c}_x" for c in overlap})
+    right_part = right_part.rename(columns={c: f"{c}_y" for c in overlap})
+    return pd.concat([left_part, right_part], axis=1)
+
+
+def _index_join(build, build_on, probe_chunks, probe_on, build_is_left, presorted=False, source=None):
+    """
+    Joins every probe chunk against an index of `build`. When the build side is the
+    left input, matches are re-sorted by left row at the end to restore pd.merge order.
+    Returns None when the keys need pd.merge's own type handling.
+    """
+    build_keys = _key_array(build[build_on])
+    index, pieces, build_rows_seen = None, [], []
+    for chunk in probe_chunks:
+        probe_keys = _key_array(chunk[probe_on])
+        if not _compatible(build_keys, probe_keys): return None
+        if index is None: index = key_index(build, build_on, build_keys, presorted, source)
+        probe_rows, build_rows = index.probe(probe_keys)
+        if build_is_left:
+            pieces.append(_assemble(build, chunk, build_rows, probe_rows, build_on, probe_on))
+            build_rows_seen.append(build_rows)
+        else:
+            pieces.append(_assemble(chunk, build, probe_rows, build_rows, probe_on, build_on))
+    if not pieces: return None
+    result = pd.concat(pieces, ignore_index=True)
+    if build_is_left:
+        order = np.argsort(np.concatenate(build_rows_seen), kind='stable')
+        result = result.take(order).reset_index(drop=True)
+    return result
+
+
+def choose_strategy(left, right, left_sorted=False, right_sorted=False, workers=None):
+    """Names the strategy join() will use for these inputs; Scans count by their size on disk."""
+    left_small = not isinstance(left, Scan) and _nbytes(left) <= BROADCAST_MAX_BYTES
+    right_small = not isinstance(right, Scan) and _nbytes(right) <= BROADCAST_MAX_BYTES
+    if isinstance(left, Scan) and right_small: return 'broadcast'
+    if isinstance(right, Scan) and left_small: return 'broadcast'
+    if left_sorted or right_sorted: return 'sort-merge'
+    if workers: return 'partitioned'
+    # Both sides are in memory: pd.merge beats building a key index (by far on string keys).
+    return 'hash'
+
+
+def join(left, right, left_on, right_on, left_sorted=False, right_sorted=False, workers=None,
+         left_source=None, right_source=None):
+    """
+    An inner join equal to pd.merge. `left`/`right` are DataFrames or Scans, the
+    `*_sorted` flags say a side is sorted ascending on its key, and `*_source` is the
+    (path, reader call) of a side read straight from a file, whose key index is kept.
+    """
+    if isinstance(left, Scan) and isinstance(right, Scan):
+        # Load the smaller file and stream the bigger one.
+        if left.size_on_disk() <= right.size_on_disk(): left = left.load()
+        else: right = right.load()
+    # Streaming only pays off for the bigger side; a small file is loaded and indexed instead.
+    if isinstance(left, Scan) and left.size_on_disk() <= _nbytes(right): left = left.load()
+    if isinstance(right, Scan) and right.size_on_disk() <= _nbytes(left): right = right.load()
+    strategy = choose_strategy(left, right, left_sorted, right_sorted, workers)
+    result = None
+    if strategy == 'broadcast':
+        if isinstance(left, Scan) or (not isinstance(right, Scan) and _nbytes(right) <= _nbytes(left)):
+            probe = left.chunks() if isinstance(left, Scan) else [left]
+            result = _index_join(right, right_on, probe, left_on, build_is_left=False, source=right_source)
+        else:
+            probe = right.chunks() if isinstance(right, Scan) else [right]
+            result = _index_join(left, left_on, probe, right_on, build_is_left=True, source=left_source)
+    if result is not None: return result
+    # Keys pd.merge has to handle itself: the streamed side is loaded after all.
+    if isinstance(left, Scan): left = left.load()
+    if isinstance(right, Scan): right = right.load()
+    if strategy == 'sort-merge':
+        if right_sorted: result = _index_join(right, right_on, [left], left_on, build_is_left=False, presorted=True)
+        else: result = _index_join(left, left_on, [right], right_on, build_is_left=True, presorted=True)
+        if result is not None: return result
+    if strategy == 'partitioned':
+        from .parallel import partitioned_merge
+        return partitioned_merge(left, right, left_on, right_on, workers)
+    return pd.merge(left, right, left_on=left_on, right_on=right_on)
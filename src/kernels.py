@@ -0,0 +1,124 @@
+# src/kernels.py
+#
+# Runtime evaluator for filter and mutate expressions in compiled pandas scripts.
+# The transpiler passes each expression as a program of nested tuples (see
+# expressions.program). Numeric columns are read as NumPy arrays without copying.
+# Every operator whose result fits a temporary the expression already owns writes
+# into that buffer, so `a * b + c - d` allocates one array instead of three. With
+# numexpr installed, all-numeric arithmetic over large frames is compiled into a
+# single blocked pass instead; boolean masks stay on NumPy, whose comparisons are
+# faster than numexpr's. Anything else (strings, nullable extension types)
+# goes through the same pandas operators the plain codegen uses.
+
+import operator
+import numpy as np
+import pandas as pd
+
+# Below this many rows numexpr's setup costs more than it saves.
+NUMEXPR_MIN_ROWS = 100_000
+
+# The dtypes numexpr evaluates with the same promotion rules as NumPy.
+NUMEXPR_DTYPES = {np.dtype('bool'), np.dtype('int64'), np.dtype('float64')}
+
+ARITHMETIC = {'+', '-', '*', '/'}
+
+UFUNCS = {
+    '+': np.add, '-': np.subtract, '*': np.multiply, '/': np.true_divide,
+    '>': np.greater, '<': np.less, '==': np.equal, '!=': np.not_equal,
+    # pandas' '&'/'|' are element-wise: logical on bools, bitwise on integers.
+    '&': np.bitwise_and, '|': np.bitwise_or,
+}
+
+OPERATORS = {
+    '+': operator.add, '-': operator.sub, '*': operator.mul, '/': operator.truediv,
+    '>': operator.gt, '<': operator.lt, '==': operator.eq, '!=': operator.ne,
+    '&': operator.and_, '|': operator.or_,
+}
+
+try:
+    import numexpr
+except ImportError:
+    numexpr = None
+
+
+def _is_array(value):
+    return isinstance(value, np.ndarray)
+
+
+def _column(df, name):
+    """A NumPy view of a column with a plain NumPy dtype, else the Series itself."""
+    series = df[name]
+    if isinstance(series.dtype, np.dtype) and series.dtype.kind in 'biuf': return series.to_numpy()
+    return series
+
+
+def _weak(value):
+    """The dtype NumPy resolves an operand as; Python scalars are weakly typed."""
+    return value.dtype if _is_array(value) else type(value)
+
+
+def _binary(op, left, right, index):
+    """Returns (result, owned); `owned` results are fresh temporaries later operators may overwrite."""
+    (a, a_owned), (b, b_owned) = left, right
+    if not (_is_array(a) or _is_array(b)) or isinstance(a, (str, pd.Series)) or isinstance(b, (str, pd.Series)):
+        # pandas semantics for strings and extension types; arrays keep the frame's index.
+        if _is_array(a): a = pd.Series(a, index=index, copy=False)
+        if _is_array(b): b = pd.Series(b, index=index, copy=False)
+        result = OPERATORS[op](a, b)
+        if isinstance(result, pd.Series) and isinstance(result.dtype, np.dtype): return result.to_numpy(), True
+        return result, False
+    ufunc = UFUNCS[op]
+    try:
+        dtype = ufunc.resolve_dtypes((_weak(a), _weak(b), None))[-1]
+    except TypeError:
+        dtype = None
+    for buffer, owned in ((a, a_owned), (b, b_owned)):
+        # Arrays pandas hands back can be read-only under copy-on-write.
+        if owned and dtype is not None and buffer.dtype == dtype and buffer.flags.writeable:
+            return ufunc(a, b, out=buffer), True
+    return ufunc(a, b), True
+
+
+def _evaluate(node, df):
+    kind = node[0]
+    if kind == 'col': return _column(df, node[1]), False
+    if kind == 'lit': return node[1], False
+    return _binary(kind, _evaluate(node[1], df), _evaluate(node[2], df), df.index)
+
+
+def _numexpr_source(node, columns):
+    """numexpr source for a program over numeric columns, or None if it has other operands."""
+    kind = node[0]
+    if kind == 'col':
+        return columns.setdefault(node[1], f"c{len(columns)}")
+    if kind == 'lit':
+        value = node[1]
+        return repr(value) if isinstance(value, (int, float)) and not isinstance(value, bool) else None
+    left, right = _numexpr_source(node[1], columns), _numexpr_source(node[2], columns)
+    if left is None or right is None: return None
+    return f"({left} {kind} {right})"
+
+
+def _numexpr_evaluate(program, df):
+    if program[0] not in ARITHMETIC: return None
+    columns = {}
+    source = _numexpr_source(program, columns)
+    if source is None: return None
+    arrays = {}
+    for name, local in columns.items():
+        series = df[name]
+        if series.dtype not in NUMEXPR_DTYPES: return None
+        arrays[local] = series.to_numpy()
+    try:
+        return numexpr.evaluate(source, local_dict=arrays)
+    except (TypeError, ValueError, KeyError, NotImplementedError):
+        return None  # e.g. '&' between integers, which numexpr only allows on bools.
+
+
+def evaluate(program, df):
+    """Evaluates an expression program against `df`, returning an array, Series or scalar."""
+    with np.errstate(all='ignore'):  # pandas does not warn on division by zero either.
+        if numexpr is not None and len(df) >= NUMEXPR_MIN_ROWS:
+            result = _numexpr_evaluate(program, df)
+            if result is not None: return result
+        return _evaluate(program, df)[0]
@@ -0,0 +1,126 @@
+# src/materialize.py
+#
+# Runtime helpers for scripts compiled with `flow run --materialize`. Every
+# assigned Flow variable is written to an uncompressed Arrow IPC file in a work
+# directory and read back memory-mapped, so its columns live in the page cache
+# rather than in the process, and later runs reuse the file instead of
+# recomputing the variable. A file is named after the variable and a hash of its
+# definition (its steps and everything upstream of it), and carries a
+# fingerprint of the source files it was computed from (path, mtime and size),
+# so an edited pipeline or a changed source is never served stale.
+
+import hashlib
+import os
+import pyarrow as pa
+import pyarrow.ipc as ipc
+from .cache import get_cache_dir
+
+WORK_SUBDIR = "work"
+FINGERPRINT_KEY = b'flow_fingerprint'
+FRAME_KEY = b'flow_frame'
+
+_work_dir = None
+
+
+def configure(work_dir=None):
+    """Sets the work directory; without one it is 'work' in the Flow cache directory."""
+    global _work_dir
+    _work_dir = work_dir
+
+
+def get_work_dir():
+    return _work_dir or os.path.join(get_cache_dir(), WORK_SUBDIR)
+
+
+def fingerprint(definition, paths):
+    """Hashes a definition with the stamps of its source files, or None if one cannot be read."""
+    digest = hashlib.sha256(definition.encode())
+    for path in paths:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None  # Computing the variable reports the missing file.
+        digest.update(repr((os.path.abspath(path), stat.st_mtime_ns, stat.st_size)).encode())
+    return digest.hexdigest()
+
+
+def _path(name, definition):
+    return os.path.join(get_work_dir(), f"{name}-{definition[:16]}.arrow")
+
+
+def _zero_copy(column):
+    """Numeric columns without nulls in one chunk can be used as NumPy arrays over the mapping."""
+    return (column.num_chunks == 1 and column.null_count == 0
+            and (pa.types.is_integer(column.type) or pa.types.is_floating(column.type)))
+
+
+def _to_frame(table):
+    """
+    Converts a memory-mapped table to a DataFrame. pyarrow's to_pandas copies numeric
+    columns, so those are wrapped without copying and the rest converted as usual.
+    """
+    import pandas as pd
+    shared = [name for name in table.column_names if _zero_copy(table[name])]
+    frame = table.drop_columns(shared).to_pandas()
+    for name in shared:
+        frame[name] = pd.Series(table[name].chunk(0).to_numpy(), copy=False)
+    return frame[table.column_names]
+
+
+def _load(path, expected):
+    try:
+        source = pa.memory_map(path)
+        table = ipc.open_file(source).read_all()
+    except (OSError, pa.ArrowInvalid):
+        return None
+    metadata = table.schema.metadata or {}
+    if metadata.get(FINGERPRINT_KEY) != expected.encode(): return None
+    return _to_frame(table) if FRAME_KEY in metadata else table
+
+
+def _store(path, expected, value):
+    """Writes `value` atomically and returns it read back from the file."""
+    is_frame = not isinstance(value, pa.Table)
+    table = pa.Table.from_pandas(value, preserve_index=False) if is_frame else value
+    metadata = {**(table.schema.metadata or {}), FINGERPRINT_KEY: expected.encode()}
+    if is_frame: metadata[FRAME_KEY] = b'pandas'
+    table = table.replace_schema_metadata(metadata).combine_chunks()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    # One record batch, uncompressed, so every column can be mapped as one array.
+    with ipc.new_file(tmp_path, table.schema) as writer:
+        writer.write_table(table)
+    os.replace(tmp_path, path)
+    del table, value
+    return _load(path, expected)
+
+
+def materialized(name, definition, paths, compute, *inputs):
+    """
+    Returns the variable `name` from the work directory when it was computed from the
+    same definition and unchanged `paths`, else `compute(*inputs)` stored there first.
+    """
+    expected = fingerprint(definition, paths)
+    if expected is None: return compute(*inputs)
+    path = _path(name, definition)
+    value = _load(path, expected)
+    if value is not None:
+        print(f"ℹ️  '{name}' is unchanged since it was last computed; reading it from '{path}'.")
+        return value
+    value = compute(*inputs)
+    try:
+        return _store(path, expected, value)
+    except (OSError, pa.ArrowException):
+        return value  # An unwritable work directory only costs a recomputation next time.
+
+
+def clear():
+    """Deletes every materialized variable in the work directory and returns how many were removed."""
+    work_dir = get_work_dir()
+    if not os.path.isdir(work_dir): return 0
+    removed = 0
+    for name in os.listdir(work_dir):
+        if name.endswith(".arrow"):
+            os.remove(os.path.join(work_dir, name))
+            removed += 1
+    return removed
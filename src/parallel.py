@@ -0,0 +1,134 @@
+# src/parallel.py
+#
+# Runtime helpers imported by scripts compiled with `flow run --workers N`. A source
+# is split into partitions (byte ranges of a CSV, row groups of a Parquet file),
+# the row-local steps of a pipeline run on each partition in a process pool, and
+# the parent merges the per-partition results in partition order, so the output
+# matches a serial run.
+
+import io
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+from . import aggregation, datasets, kernels
+
+# CSV partitions are cut at about this many bytes, so a worker never holds more
+# than one partition of a very large file at a time.
+CSV_PARTITION_BYTES = 64 * 1024 * 1024
+
+# Below this many rows a single pd.merge is faster than shipping both sides to a pool.
+PARALLEL_MERGE_MIN_ROWS = 1_000_000
+
+
+def csv_partitions(path, workers):
+    """Splits a CSV into newline-aligned byte ranges; quoted fields must not span lines."""
+    size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        header = f.readline()
+        data_start = f.tell()
+        count = max(workers, math.ceil((size - data_start) / CSV_PARTITION_BYTES), 1)
+        step = max(1, (size - data_start) // count)
+        bounds = [data_start]
+        for i in range(1, count):
+            f.seek(max(data_start + i * step, bounds[-1]))
+            f.readline()  # Move to the start of the next full line.
+            bounds.append(min(max(f.tell(), bounds[-1]), size))
+    bounds.append(size)
+    return [('File', path, header, start, end) for start, end in zip(bounds, bounds[1:]) if end > start]
+
+
+def _row_group_may_match(row_group, filters):
+    """Uses a row group's min/max statistics to decide whether any row can pass `filters`."""
+    names = [row_group.column(i).path_in_schema for i in range(row_group.num_columns)]
+    for column, op, value in filters:
+        if column not in names: continue
+        stats = row_group.column(names.index(column)).statistics
+        if stats is None or not stats.has_min_max: continue
+        try:
+            if op == '>' and not stats.max > value: return False
+            if op == '<' and not stats.min < value: return False
+            if op == '==' and not stats.min <= value <= stats.max: return False
+        except TypeError:
+            continue  # Statistics of another type than the literal; read the group.
+    return True
+
+
+def parquet_partitions(path, filters=None):
+    """
+    One partition per row group, skipping groups whose statistics rule out `filters`;
+    for a dataset directory, one per file in the partitions `filters` do not rule out.
+    """
+    if datasets.is_dataset(path):
+        expression = pq.filters_to_expression(filters) if filters else None
+        return [('Parquet', path, fragment.path) for fragment in datasets.dataset(path).get_fragments(filter=expression)]
+    metadata = pq.ParquetFile(path).metadata
+    return [('Parquet', path, i) for i in range(metadata.num_row_groups)
+            if not filters or _row_group_may_match(metadata.row_group(i), filters)]
+
+
+def read_partition(partition, columns=None):
+    if partition[0] == 'File':
+        _, path, header, start, end = partition
+        with open(path, 'rb') as f:
+            f.seek(start)
+            data = f.read(end - start)
+        return pd.read_csv(io.BytesIO(header + data), usecols=columns)
+    _, path, row_group = partition
+    if isinstance(row_group, str):  # A file of a dataset directory.
+        return datasets.dataset(path, files=[row_group]).to_table(columns=columns).to_pandas()
+    return pq.ParquetFile(path).read_row_group(row_group, columns=columns).to_pandas()
+
+
+_compiled_bodies = {}
+
+
+def _run_partition(task):
+    """Worker entry point: reads one partition and runs the pipeline body over it."""
+    partition, columns, body, input_var, output_vars = task
+    code = _compiled_bodies.get(body)
+    if code is None:
+        code = _compiled_bodies[body] = compile(body, '<flow-partition>', 'exec')
+    namespace = {'pd': pd, 'flow_aggregation': aggregation, 'flow_kernels': kernels,
+                 input_var: read_partition(partition, columns)}
+    exec(code, namespace)
+    return [namespace[var] for var in output_vars]
+
+
+def map_partitions(path, kind, body, input_var, output_vars, workers, columns=None, filters=None):
+    """
+    Runs `body` (Python source reading `input_var`) over every partition of a source
+    and yields the values of `output_vars` for each partition, in partition order.
+    """
+    if kind == 'File': partitions = csv_partitions(path, workers)
+    elif kind == 'Parquet': partitions = parquet_partitions(path, filters)
+    else: raise ValueError(f"Flow Execution Error: '{kind}' sources cannot be partitioned.")
+    tasks = [(partition, columns, body, input_var, output_vars) for partition in partitions]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        yield from pool.map(_run_partition, tasks)
+
+
+def _merge_partition(task):
+    left, right, left_on, right_on = task
+    return pd.merge(left, right, left_on=left_on, right_on=right_on)
+
+
+def partitioned_merge(left, right, left_on, right_on, workers, min_rows=PARALLEL_MERGE_MIN_ROWS):
+    """
+    An inner join that hash-partitions both sides on the join key and merges the
+    partitions in a process pool. Rows are put back in pd.merge's order (left row,
+    then right row), so the result is identical to a serial merge.
+    """
+    if len(left) + len(right) < min_rows or left[left_on].dtype != right[right_on].dtype:
+        return pd.merge(left, right, left_on=left_on, right_on=right_on)
+    left = left.assign(_flow_left_row=np.arange(len(left)))
+    right = right.assign(_flow_right_row=np.arange(len(right)))
+    left_bucket = pd.util.hash_pandas_object(left[left_on], index=False).to_numpy() % workers
+    right_bucket = pd.util.hash_pandas_object(right[right_on], index=False).to_numpy() % workers
+    tasks = [(left[left_bucket == i], right[right_bucket == i], left_on, right_on) for i in range(workers)]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        merged = pd.concat(list(pool.map(_merge_partition, tasks)), ignore_index=True)
+    merged = merged.sort_values(['_flow_left_row', '_flow_right_row'], kind='mergesort')
+    return merged.drop(columns=['_flow_left_row', '_flow_right_row']).reset_index(drop=True)
@@ -0,0 +1,746 @@
+# src/planner.py
+
+import glob
+import hashlib
+import os
+from lark import Token, Tree
+
+# A column requirement of ALL_COLUMNS means "every column the source has".
+ALL_COLUMNS = None
+
+PUSHABLE_OPERATORS = {">", "<", "==", "!="}
+# pyarrow's Parquet filters drop rows whose value is missing for every operator, but
+# pandas keeps them on '!=', so only these reach a Parquet reader.
+PARQUET_OPERATORS = {">", "<", "=="}
+# Aggregates a database computes as pandas does, by the Flow types they accept (None: any).
+SQL_AGGREGATES = {'count': None, 'sum': {'int', 'float'}, 'mean': {'int', 'float'},
+                  'min': {'int', 'float'}, 'max': {'int', 'float'}}
+
+ROW_LOCAL_STEPS = {'filter', 'select', 'mutate'}
+STREAMABLE_IO = {'File', 'Parquet'}
+DEFAULT_CHUNK_SIZE = 100_000
+REJECTS_SUFFIX = ".rejects.csv"
+
+# Arguments of File/Parquet sinks that shape their output (see datasets.py), and
+# the codecs each kind accepts. CSV codec -> the suffix readers detect it by.
+SINK_OPTIONS = ('partition_by', 'compression', 'row_group_size', 'sort_by')
+PARQUET_CODECS = ('snappy', 'gzip', 'zstd', 'brotli', 'lz4', 'none')
+CSV_CODECS = {'gzip': '.gz', 'zstd': '.zst', 'bz2': '.bz2'}
+
+
+def line_of(tree):
+    """The .flow line a parse tree node starts on, or None for trees built without positions."""
+    return getattr(tree.meta, 'line', None)
+
+
+class SourcePlan:
+    def __init__(self, name, kind, args, schema_name=None, line=None):
+        self.name = name
+        self.kind = kind
+        self.args = args
+        self.schema_name = schema_name
+        self.columns = ALL_COLUMNS   # Projection pushed into the reader.
+        self.filters = []            # (column, op, value) predicates pushed into the reader.
+        self.consumers = []          # Pipelines and joins that read this variable.
+        self.materialize = True      # False when every consumer streams the source itself.
+        self.line = line
+        self.fields = None           # Declared column -> Flow type, for a source bound to a schema.
+        self.downcast = []           # Int columns no expression can overflow if they are narrowed.
+        self.categorical = []        # String columns that are only compared for equality or passed through.
+        self.definition = None       # Hash of the declaration, for incremental runs.
+        self.incremental = args.get('incremental', False)  # True for files, the key column for a table.
+        self.delta = False           # Only the rows added since the last run are read (see watermarks.py).
+        self.delta_blocker = None    # Why an incremental source is read in full, for reporting.
+        self.state_key = None        # Hash of the source and its readers, naming its saved state.
+        self.appended_sinks = []     # Paths of the sinks its new rows are appended to.
+        self.aggregate = None        # (group_by, aggs) a Postgres query computes for its one pipeline.
+
+
+class PipelinePlan:
+    def __init__(self, start, steps, target=None, line=None, step_lines=None):
+        self.start = start      # Flow variable the pipeline reads from.
+        self.steps = steps      # (op_type, args) tuples, including ('sink', name).
+        self.target = target    # Flow variable assigned by the pipeline, if any.
+        self.line = line
+        self.step_lines = step_lines or [None] * len(steps)  # .flow line of each step.
+        self.streaming = False
+        self.stream_blocker = None  # Why a pipeline could not be streamed, for reporting.
+        self.live = True        # False when nothing downstream reaches a sink or an assert.
+        self.up_to_date = False # Skipped because its outputs are current (see incremental.py).
+        self.sorted_by = None   # Column the result is sorted ascending on, if any.
+        self.definition = None  # Hash of the steps, sinks and everything upstream.
+        self.source_files = None  # File/Parquet paths upstream; None when a table is.
+        self.delta = None       # The incremental source whose new rows alone it reads.
+        self.pushed_steps = 0   # Leading steps its source's query already ran (see _push_down_aggregates).
+
+    def inputs(self): return [self.start]
+    def sinks(self): return [args for op_type, args in self.steps if op_type == 'sink']
+
+
+class JoinPlan:
+    def __init__(self, left, right, left_on, right_on, target, line=None):
+        self.left, self.right = left, right
+        self.left_on, self.right_on = left_on, right_on
+        self.target = target
+        self.line = line
+        self.live = True
+        self.up_to_date = False
+        self.definition = None
+        self.source_files = None
+        self.streamed = []          # Sides left on disk for the join to stream (see joins.py).
+        self.left_sorted = self.right_sorted = False  # Side already sorted ascending on its key.
+        self.estimated_bytes = {}   # Side -> size on disk of the source it comes from.
+
+    def inputs(self): return [self.left, self.right]
+    def sinks(self): return []
+
+    def strategy(self, workers=None):
+        """The strategy the join is planned for; the runtime can still fall back to a plain merge."""
+        if self.streamed: return f"broadcast hash join, streaming {' or '.join(self.streamed)}"
+        if self.left_sorted or self.right_sorted:
+            return f"sort-merge join on pre-sorted {self.left if self.left_sorted else self.right}"
+        if workers: return f"partitioned merge on {workers} workers"
+        return "hash join"
+
+
+class LogicalPlan:
+    def __init__(self, chunk_size=None, workers=None):
+        self.chunk_size = chunk_size  # Rows per chunk for streamed pipelines; None disables streaming.
+        self.workers = workers        # Worker processes for partitioned pipelines; None runs serially.
+        self.sources = {}   # Flow variable -> SourcePlan
+        self.sinks = {}     # Sink name -> function_call info
+        self.schemas = {}   # Schema name -> {column: Flow type}
+        self.nodes = []     # PipelinePlan / JoinPlan in document order
+
+    def pipelines(self):
+        return [node for node in self.nodes if isinstance(node, PipelinePlan)]
+
+    def notes(self):
+        """Human-readable notes about skipped pipelines and pipelines that had to run in memory."""
+        notes = []
+        for node in self.nodes:
+            if node.live: continue
+            if not node.up_to_date:
+                notes.append(f"'{node.target or node.inputs()[0]}' is never used by a sink or assert and was skipped.")
+            elif node.sinks():
+                notes.append(f"The pipeline writing {', '.join(map(repr, node.sinks()))} is up to date and was skipped.")
+            else:
+                notes.append(f"'{node.target}' is only used by up-to-date pipelines and was skipped.")
+        notes += [f"Incremental source '{s.name}' is read in full: {s.delta_blocker}."
+                  for s in self.sources.values() if s.delta_blocker]
+        return notes + [f"Pipeline from '{p.start}' runs in memory: {p.stream_blocker}."
+                        for p in self.pipelines() if p.stream_blocker]
+
+
+def source_paths(path):
+    """
+    The files a File/Parquet source path names; incremental sources may name a glob
+    pattern, which never matches the reject files typed reads write (see ingest.py).
+    """
+    if not glob.has_magic(path): return [path]
+    return sorted(p for p in glob.glob(path) if not p.endswith(REJECTS_SUFFIX))
+
+
+def resolve_source_files(plan):
+    """
+    Records the source files upstream of each node of `plan`, or None when a table is.
+    Patterns are matched again on every call, so a plan kept in the compile cache
+    still sees the files added since it was built.
+    """
+    current = {}  # Flow variable -> source files
+    for name, source in plan.sources.items():
+        current[name] = source_paths(source.args['path']) if source.kind in STREAMABLE_IO else None
+    for node in plan.nodes:
+        upstream = [current.get(name) for name in node.inputs()]
+        node.source_files = None
+        if all(files is not None for files in upstream):
+            node.source_files = sorted({path for files in upstream for path in files})
+        if node.target: current[node.target] = node.source_files
+
+
+def compressed(path):
+    """True for a CSV path whose suffix names a codec; such a file cannot be read from a byte offset."""
+    return path.endswith(tuple(CSV_CODECS.values()))
+
+
+def sink_options(name, kind, args):
+    """
+    The write options among a sink's (unquoted) arguments: partition_by and sort_by
+    as lists of columns, the compression codec and row_group_size as an int.
+    """
+    options = {}
+    for key in SINK_OPTIONS:
+        if key not in args: continue
+        value = args[key]
+        if kind not in STREAMABLE_IO:
+            raise ValueError(f"Error: '{key}' of sink '{name}' is only supported on File and Parquet sinks.")
+        if key in ('partition_by', 'sort_by'):
+            columns = [column.strip() for column in value.split(',')] if isinstance(value, str) else []
+            if not columns or not all(column.isidentifier() for column in columns):
+                raise ValueError(f"Error: '{key}' of sink '{name}' must name columns, e.g. {key}: \"status\" or \"year,month\".")
+            options[key] = columns
+        elif key == 'compression':
+            codecs = PARQUET_CODECS if kind == 'Parquet' else tuple(CSV_CODECS)
+            if value not in codecs:
+                raise ValueError(f"Error: 'compression' of {kind} sink '{name}' must be one of: {', '.join(codecs)}.")
+            options[key] = value
+        else:
+            size = int(value) if kind == 'Parquet' and isinstance(value, str) and value.isdigit() else 0
+            if size < 1:
+                raise ValueError(f"Error: 'row_group_size' of sink '{name}' must be a positive number of rows, "
+                                 f"and only Parquet sinks have row groups.")
+            options[key] = size
+    codec = options.get('compression') if kind == 'File' and 'partition_by' not in options else None
+    if codec and not args['path'].endswith(CSV_CODECS[codec]):
+        raise ValueError(f"Error: Sink '{name}' writes {codec}-compressed CSV; its path must end in "
+                         f"'{CSV_CODECS[codec]}' so readers detect the compression.")
+    return options
+
+
+def expression_columns(tree):
+    """Returns the column names referenced anywhere in an expression subtree."""
+    return [ref.children[1].value for ref in tree.find_data('column_ref')]
+
+
+def _canonical(value):
+    """
+    A parse-tree-free copy of step arguments for hashing. Lark's Tree.data is a plain
+    string or a Token depending on whether the parser came from its cache, so repr()
+    of a tree is not stable between runs.
+    """
+    if isinstance(value, Tree): return (str(value.data), [_canonical(child) for child in value.children])
+    if isinstance(value, Token): return (value.type, value.value)
+    if isinstance(value, (list, tuple)): return [_canonical(item) for item in value]
+    if isinstance(value, dict): return [(key, _canonical(item)) for key, item in value.items()]
+    return value
+
+
+def _literal(token):
+    if token.type == 'STRING': return token.value[1:-1]
+    number = float(token.value)
+    return int(number) if number.is_integer() and "." not in token.value else number
+
+
+def _operand(node):
+    """Classifies a comparison operand as ('column', name), ('literal', value) or None."""
+    if not (isinstance(node, Tree) and node.data == 'factor'): return None
+    child = node.children[0]
+    if isinstance(child, Tree) and child.data == 'column_ref': return ('column', child.children[1].value)
+    if isinstance(child, Token) and child.type in ('STRING', 'SIGNED_NUMBER'): return ('literal', _literal(child))
+    return None
+
+
+def pushable_predicates(bool_expression):
+    """
+    Returns the `column op literal` conjuncts of a filter that a reader can evaluate,
+    or an empty list when the filter uses 'or' (a partial pushdown would drop rows).
+    """
+    parts = bool_expression.children
+    if any(isinstance(p, Token) and p.type == 'OR' for p in parts): return []
+    flipped = {">": "<", "<": ">", "==": "==", "!=": "!="}
+    predicates = []
+    for part in parts:
+        if not (isinstance(part, Tree) and part.data == 'comparison'): continue
+        left, op, right = part.children
+        if op.value not in PUSHABLE_OPERATORS: continue
+        left, right = _operand(left), _operand(right)
+        if not left or not right: continue
+        if left[0] == 'column' and right[0] == 'literal':
+            predicates.append((left[1], op.value, right[1]))
+        elif left[0] == 'literal' and right[0] == 'column':
+            predicates.append((right[1], flipped[op.value], left[1]))
+    return predicates
+
+
+def sql_predicate(predicate, fields):
+    """
+    True if Postgres evaluates `column op literal` as pandas does. Strings compare by
+    the database's collation rather than by code point, so only their equality is
+    pushed; the literal must also match the column's declared type.
+    """
+    column, op, value = predicate
+    flow_type = (fields or {}).get(column)
+    if isinstance(value, str): return op in ('==', '!=') and flow_type in (None, 'string')
+    return flow_type in (None, 'int', 'float')
+
+
+class QueryPlanner:
+    """
+    Builds a LogicalPlan from a Flow parse tree and pushes projections and filters
+    down into the sources, so readers only load the columns and rows that some
+    downstream step actually uses.
+    """
+    def __init__(self, parse_tree, chunk_size=None, workers=None, join_strategies=True, up_to_date=()):
+        self.parse_tree = parse_tree
+        self.plan = LogicalPlan(chunk_size, workers)
+        # Only backends with the runtime join strategies (pandas) get them planned.
+        self.join_strategies = join_strategies
+        # Indexes into plan.nodes of sink-writing nodes whose outputs are current.
+        self.up_to_date = set(up_to_date)
+
+    def build(self):
+        for node in self.parse_tree.iter_subtrees_topdown():
+            if node.data == 'schema_decl': self._add_schema(node)
+            elif node.data == 'source_decl': self._add_source(node)
+            elif node.data == 'sink_decl': self._add_sink(node)
+            elif node.data == 'assignment': self._add_assignment(node)
+            elif node.data == 'execution': self.plan.nodes.append(self._pipeline(node.children[0], line=line_of(node)))
+        self._plan_definitions()
+        self._plan_increments()
+        self._eliminate_dead_nodes()
+        for node in self.plan.nodes:
+            if not node.live: continue
+            for name in node.inputs():
+                if name in self.plan.sources: self.plan.sources[name].consumers.append(node)
+        for source in self.plan.sources.values():
+            if not source.consumers: source.materialize = False  # Nothing live reads it.
+        self._push_down_projections()
+        self._push_down_filters()
+        self._push_down_aggregates()
+        # Partitioned execution has the same eligibility rules as streaming.
+        if self.plan.chunk_size or self.plan.workers: self._plan_streaming()
+        if self.join_strategies: self._plan_joins()
+        self._plan_ingestion()
+        return self.plan
+
+    # --- Building the logical plan ---
+
+    def _function_call(self, tree):
+        name = tree.children[0].value
+        args = {}
+        if len(tree.children) > 1:
+            values = tree.children[1].children
+            for i in range(0, len(values), 2):
+                value = values[i + 1]
+                if isinstance(value, Tree):  # env("VAR")
+                    args[values[i].value] = ('env', value.children[0].value[1:-1])
+                elif value.type == 'BOOLEAN':
+                    args[values[i].value] = value.value == 'true'
+                else:
+                    args[values[i].value] = value.value[1:-1] if value.type == 'STRING' else value.value
+        return name, args
+
+    def _add_schema(self, tree):
+        name, *fields = tree.children
+        self.plan.schemas[name.value] = {field.children[0].value: field.children[1].value for field in fields}
+
+    def _add_source(self, tree):
+        flow_var = tree.children[0].value
+        kind, args = self._function_call(tree.children[1])
+        schema_name = tree.children[2].value if len(tree.children) > 2 else None
+        incremental = args.get('incremental', False)
+        if kind in STREAMABLE_IO and incremental not in (True, False):
+            raise ValueError(f"Error: 'incremental' on {kind} source '{flow_var}' must be true or false; "
+                             f"new rows are found by byte offset and new files.")
+        if kind == 'Postgres' and (incremental is True or not isinstance(incremental, (str, bool))):
+            raise ValueError(f"Error: 'incremental' on Postgres source '{flow_var}' names the column that "
+                             f"grows with every row, e.g. incremental: \"id\".")
+        if kind in STREAMABLE_IO and not incremental and glob.has_magic(args.get('path', '')):
+            raise ValueError(f"Error: Source '{flow_var}' reads the pattern '{args['path']}'; only incremental "
+                             f"sources can read several files.")
+        if kind == 'File' and incremental and compressed(args.get('path', '')):
+            raise ValueError(f"Error: Incremental source '{flow_var}' reads the compressed file '{args['path']}'; "
+                             f"new lines are found by byte offset, so it must be uncompressed.")
+        self.plan.sources[flow_var] = SourcePlan(flow_var, kind, args, schema_name, line_of(tree))
+
+    def _add_sink(self, tree):
+        kind, args = self._function_call(tree.children[1])
+        sink_options(tree.children[0].value, kind, args)  # Rejects options the sink cannot honour.
+        self.plan.sinks[tree.children[0].value] = {'name': kind, 'args': args}
+
+    def _sink_options(self, sink):
+        info = self.plan.sinks.get(sink, {})
+        return sink_options(sink, info.get('name'), info.get('args', {}))
+
+    def _add_assignment(self, tree):
+        target, rhs = tree.children[0].value, tree.children[1]
+        if rhs.data == 'join_expr':
+            left, right, condition = rhs.children
+            left_ref, _, right_ref = condition.children
+            self.plan.nodes.append(JoinPlan(left.value, right.value, left_ref.children[1].value,
+                                            right_ref.children[1].value, target, line_of(tree)))
+        else:
+            self.plan.nodes.append(self._pipeline(rhs, target, line_of(tree)))
+
+    def _pipeline(self, tree, target=None, line=None):
+        start, *pipe_steps = tree.children
+        steps, step_lines = [], []
+        sorted_by = None  # Filters and row-local steps keep a sort; it is lost when its column is.
+        for pipe_step in pipe_steps:
+            step_lines.append(line_of(pipe_step))
+            item = pipe_step.children[0]
+            if isinstance(item, Token):
+                steps.append(('sink', item.value))
+                continue
+            op = item.children[0]
+            if op.data == 'filter':
+                steps.append(('filter', op.children[0]))
+            elif op.data == 'select':
+                steps.append(('select', [t.value for t in op.children]))
+                if sorted_by not in steps[-1][1]: sorted_by = None
+            elif op.data == 'sort':
+                columns = [t.value for t in op.children if t.type == 'NAME']
+                steps.append(('sort', columns))
+                ascending = all(t.value[1:-1] == 'asc' for t in op.children if t.type == 'STRING')
+                sorted_by = columns[0] if ascending else None
+            elif op.data == 'mutate':
+                steps.append(('mutate', {m.children[0].value: m.children[1] for m in op.children}))
+                if sorted_by in steps[-1][1]: sorted_by = None
+            elif op.data == 'group_by':
+                steps.append(('group_by', [t.value for t in op.children]))
+                sorted_by = None
+            elif op.data == 'aggregate':
+                aggs = {}
+                for agg_expr in op.children:
+                    new_col, agg_function = agg_expr.children
+                    func, *col = agg_function.children
+                    aggs[new_col.value] = (col[0].value if col else None, func.value)
+                steps.append(('aggregate', aggs))
+        pipeline = PipelinePlan(start.value, steps, target, line, step_lines)
+        pipeline.sorted_by = sorted_by
+        return pipeline
+
+    # --- Definitions ---
+
+    def _plan_definitions(self):
+        """
+        Hashes every node's definition: its own steps and sinks, and the definitions of
+        the sources and variables it reads, so a change anywhere upstream changes it.
+        Also records the source files upstream of each node.
+        """
+        current = {}  # Flow variable -> definition
+        for name, source in self.plan.sources.items():
+            declaration = repr((source.kind, source.args, self.plan.schemas.get(source.schema_name)))
+            source.definition = hashlib.sha256(declaration.encode()).hexdigest()
+            current[name] = source.definition
+        for node in self.plan.nodes:
+            if isinstance(node, JoinPlan): own = ('join', node.left_on, node.right_on)
+            else: own = ('pipeline', _canonical(node.steps), [self.plan.sinks.get(sink) for sink in node.sinks()])
+            upstream = [current.get(name) for name in node.inputs()]
+            if all(definition is not None for definition in upstream):
+                node.definition = hashlib.sha256(repr((upstream, own)).encode()).hexdigest()
+            if node.target: current[node.target] = node.definition
+        resolve_source_files(self.plan)
+
+    # --- Incremental sources ---
+
+    def _delta_blocker(self, node):
+        """Returns why `node` cannot work on just the new rows of its input, or None if it can."""
+        if isinstance(node, JoinPlan): return f"the join on line {node.line} needs all of its rows"
+        ops = [op_type for op_type, _ in node.steps]
+        at = ops.index('group_by') if 'group_by' in ops else len(ops)
+        if at < len(ops) and ops[at + 1:at + 2] != ['aggregate']:
+            return "group_by is not followed by aggregate"
+        for op_type, args in node.steps[:at]:
+            if op_type == 'sink':
+                if self.plan.sinks.get(args, {}).get('name') not in STREAMABLE_IO:
+                    return f"sink '{args}' is not a File or Parquet sink the new rows can be appended to"
+                if self._sink_options(args):
+                    return f"sink '{args}' has write options ({', '.join(self._sink_options(args))}) and is rewritten in full"
+            elif op_type not in ROW_LOCAL_STEPS:
+                return f"'{op_type}' on line {node.line} needs all of its rows"
+        return None
+
+    def _plan_increments(self):
+        """
+        Decides which incremental sources only have their new rows read. That works when
+        every pipeline reading them is row-local up to an optional group_by/aggregate:
+        sinks before the group_by append the new rows, and the aggregate merges them into
+        the partial states saved by earlier runs. A variable such a pipeline assigns
+        without aggregating holds new rows as well. If any reader of a source, or of a
+        variable holding its new rows, needs all of them, the source is read in full.
+        """
+        origin = {name: name for name, source in self.plan.sources.items() if source.incremental}
+        readers = {name: [] for name in origin}  # Source -> indexes of the nodes reading its new rows.
+        for index, node in enumerate(self.plan.nodes):
+            sources = {origin[name] for name in node.inputs() if name in origin}
+            blocker = self._delta_blocker(node) if sources else None
+            for name in sources:
+                readers[name].append(index)
+                source = self.plan.sources[name]
+                source.delta_blocker = source.delta_blocker or blocker
+            if node.target: origin.pop(node.target, None)  # Reassigned.
+            if sources and not blocker and node.target and 'group_by' not in [op for op, _ in node.steps]:
+                origin[node.target] = sources.pop()
+        for name in self._asserted_variables() & set(origin):
+            source = self.plan.sources[origin[name]]
+            source.delta_blocker = source.delta_blocker or f"'{name}' is checked by an assert"
+        for name, indexes in readers.items():
+            source = self.plan.sources[name]
+            if source.delta_blocker: continue
+            source.delta = True
+            nodes = [self.plan.nodes[index] for index in indexes]
+            for node in nodes:
+                node.delta = name
+                at = next((i for i, (op_type, _) in enumerate(node.steps) if op_type == 'group_by'), len(node.steps))
+                source.appended_sinks += [self.plan.sinks[args]['args']['path'] for op_type, args in node.steps[:at]
+                                          if op_type == 'sink']
+            source.state_key = hashlib.sha256(repr([source.definition] + [n.definition for n in nodes]).encode()).hexdigest()
+            # Skipping some readers would leave their saved state behind the others'.
+            if not {index for index in indexes if self.plan.nodes[index].sinks()} <= self.up_to_date:
+                self.up_to_date -= set(indexes)
+
+    # --- Dead pipeline elimination ---
+
+    def _asserted_variables(self):
+        return {ref.children[0].value for stmt in self.parse_tree.find_data('assert_statement')
+                for ref in stmt.find_data('column_ref')}
+
+    def _eliminate_dead_nodes(self):
+        """
+        Marks pipelines and joins whose result never reaches a sink or an assert as
+        dead. Walking backwards means a variable read only by dead nodes is dead too.
+        Nodes only needed for sinks that are up to date are marked up_to_date as well.
+        """
+        asserted = self._asserted_variables()
+        used, needed = set(asserted), set(asserted)  # Without and with the up-to-date sinks.
+        for index in reversed(range(len(self.plan.nodes))):
+            node = self.plan.nodes[index]
+            writes_sink = bool(node.sinks())
+            if writes_sink or (node.target and node.target in needed): needed.update(node.inputs())
+            if (writes_sink and index not in self.up_to_date) or (node.target and node.target in used):
+                used.update(node.inputs())
+            else:
+                node.live = False
+                node.up_to_date = writes_sink or (node.target is not None and node.target in needed)
+
+    # --- Pushdown passes ---
+
+    @staticmethod
+    def required_columns(steps, needed):
+        """
+        Walks a pipeline backwards from the set of columns needed after its last step
+        and returns the set needed from its input (ALL_COLUMNS if unbounded).
+        """
+        agg_inputs = None
+        for op_type, args in reversed(steps):
+            if op_type == 'sink':
+                needed = ALL_COLUMNS
+            elif op_type == 'select':
+                needed = set(args)
+            elif op_type == 'aggregate':
+                agg_inputs = {col for col, _ in args.values() if col is not None}
+            elif op_type == 'group_by':
+                # The aggregate fixes the output columns, whatever comes after it.
+                needed = set(args) | agg_inputs if agg_inputs is not None else ALL_COLUMNS
+                agg_inputs = None
+            elif needed is ALL_COLUMNS:
+                continue
+            elif op_type == 'filter':
+                needed = needed | set(expression_columns(args))
+            elif op_type == 'sort':
+                needed = needed | set(args)
+            elif op_type == 'mutate':
+                created = set(args)
+                used = {col for expr in args.values() for col in expression_columns(expr)}
+                needed = (needed - created) | used
+        return needed
+
+    def _push_down_projections(self):
+        # Visit consumers before producers so every variable's requirement is known
+        # by the time the pipeline that assigns it is analysed.
+        needs = {}
+        def require(name, columns):
+            if name in needs and needs[name] is ALL_COLUMNS: return
+            needs[name] = ALL_COLUMNS if columns is ALL_COLUMNS else needs.get(name, set()) | columns
+        for node in reversed(self.plan.nodes):
+            if not node.live: continue
+            if isinstance(node, JoinPlan):
+                require(node.left, ALL_COLUMNS)
+                require(node.right, ALL_COLUMNS)
+            else:
+                needed_after = needs.get(node.target, set()) if node.target else set()
+                require(node.start, self.required_columns(node.steps, needed_after))
+        for name, source in self.plan.sources.items():
+            if source.consumers and needs.get(name, ALL_COLUMNS) is not ALL_COLUMNS:
+                # The watermark of an incremental table is the largest value of its key.
+                key = [source.incremental] if source.delta and source.kind == 'Postgres' else []
+                source.columns = sorted(needs[name] | set(key))
+
+    def _push_down_filters(self):
+        # Parquet readers and Postgres queries evaluate predicates, only when a single
+        # pipeline reads the source; the pandas filter still runs afterwards, so this is
+        # purely an I/O cut. New rows of an incremental table are found by their key alone.
+        for source in self.plan.sources.values():
+            if source.kind not in ('Parquet', 'Postgres') or len(source.consumers) != 1: continue
+            if source.kind == 'Postgres' and source.delta: continue
+            consumer = source.consumers[0]
+            if not isinstance(consumer, PipelinePlan): continue
+            fields = self.plan.schemas.get(source.schema_name)
+            for op_type, args in consumer.steps:
+                if op_type != 'filter': break
+                predicates = pushable_predicates(args)
+                if source.kind == 'Postgres': predicates = [p for p in predicates if sql_predicate(p, fields)]
+                else: predicates = [p for p in predicates if p[1] in PARQUET_OPERATORS]
+                source.filters.extend(predicates)
+
+    def _push_down_aggregates(self):
+        """
+        Lets the database compute `filter* -> group_by -> aggregate` at the start of the
+        one pipeline reading a schema-bound Postgres source, so only the groups cross the
+        network. Every leading filter must have been pushed down whole, since the steps
+        the query ran are not run again.
+        """
+        for source in self.plan.sources.values():
+            fields = self.plan.schemas.get(source.schema_name)
+            if source.kind != 'Postgres' or source.delta or not fields or len(source.consumers) != 1: continue
+            consumer = source.consumers[0]
+            if not isinstance(consumer, PipelinePlan): continue
+            ops = [op_type for op_type, _ in consumer.steps]
+            at = ops.index('group_by') if 'group_by' in ops else None
+            if at is None or ops[at + 1:at + 2] != ['aggregate'] or set(ops[:at]) - {'filter'}: continue
+            filters = [args for _, args in consumer.steps[:at]]
+            pushed = sum(len(pushable_predicates(args)) for args in filters)
+            terms = sum(len([part for part in args.children if not isinstance(part, Token)]) for args in filters)
+            if pushed != len(source.filters) or pushed != terms: continue  # Some filter stays in pandas.
+            group_by, aggs = consumer.steps[at][1], {}
+            if not set(group_by) <= set(fields): continue
+            for new_col, (column, func) in consumer.steps[at + 1][1].items():
+                func = 'mean' if func == 'avg' else func
+                column = column or group_by[0]  # count() counts the first group_by column.
+                aggs[new_col] = (column, func)
+                if column not in fields or (SQL_AGGREGATES[func] and fields[column] not in SQL_AGGREGATES[func]):
+                    aggs = None
+                    break
+            if aggs is None: continue
+            source.aggregate = (group_by, aggs)
+            consumer.pushed_steps = at + 2
+
+    # --- Join strategies ---
+
+    def _plan_joins(self):
+        """
+        Records what joins.join() needs to pick a strategy: a File/Parquet source read
+        only by the join is left on disk so the join can stream it past an index of the
+        other side, and a side produced by an ascending sort on its key is pre-sorted.
+        """
+        producers, sizes = {}, {}
+        for name, source in self.plan.sources.items():
+            path = source.args.get('path')
+            if isinstance(path, str) and os.path.isfile(path): sizes[name] = os.path.getsize(path)
+        for node in self.plan.nodes:
+            if isinstance(node, JoinPlan) and node.live:
+                other = {node.left: sizes.get(node.right), node.right: sizes.get(node.left)}
+                for side, key, attr in ((node.left, node.left_on, 'left_sorted'), (node.right, node.right_on, 'right_sorted')):
+                    producer = producers.get(side)
+                    if isinstance(producer, PipelinePlan) and producer.sorted_by == key: setattr(node, attr, True)
+                    source = self.plan.sources.get(side) if producer is None else None
+                    # Only the bigger side is worth streaming past an index of the other.
+                    smaller = side in sizes and other[side] is not None and sizes[side] < other[side]
+                    if (source and source.kind in STREAMABLE_IO and source.consumers == [node]
+                            and node.left != node.right and not smaller and not glob.has_magic(source.args['path'])):
+                        node.streamed.append(side)
+                        source.materialize = False
+                    if side in sizes: node.estimated_bytes[side] = sizes[side]
+            if node.target:
+                producers[node.target] = node
+                # A result is estimated by the files it is computed from; unknown stays unknown.
+                inputs = [sizes.get(name) for name in node.inputs()]
+                if None in inputs: sizes.pop(node.target, None)
+                else: sizes[node.target] = sum(inputs)
+
+    # --- Typed ingestion ---
+
+    def _column_uses(self):
+        """
+        Returns (columns used in arithmetic, columns used other than by equality with a
+        literal), by name across the whole script. A name covers its '_x'/'_y' join
+        suffixed copies, so a value cannot escape the analysis through a join.
+        """
+        arithmetic, not_categorical = set(), set()
+        def add(target, names):
+            for name in names:
+                target.add(name)
+                if name.endswith(('_x', '_y')): target.add(name[:-2])
+        tree = self.parse_tree
+        for node in tree.find_pred(lambda t: t.data in ('arith_expr', 'term', 'mutate')):
+            add(arithmetic, expression_columns(node))
+            add(not_categorical, expression_columns(node))
+        for node in tree.find_data('comparison'):
+            left, op, right = node.children
+            sides = [_operand(left), _operand(right)]
+            if op.value in ('==', '!=') and sorted(side[0] if side else '' for side in sides) == ['column', 'literal']: continue
+            add(not_categorical, expression_columns(node))
+        for node in tree.find_pred(lambda t: t.data in ('sort', 'group_by')):
+            add(not_categorical, [t.value for t in node.children if t.type == 'NAME'])
+        for node in tree.find_data('join_condition'):
+            add(not_categorical, expression_columns(node))
+        for node in tree.find_data('agg_function'):
+            func, *col = node.children
+            if col and func.value in ('sum', 'avg', 'mean'): add(arithmetic, [col[0].value])
+            if col: add(not_categorical, [col[0].value])
+        return arithmetic, not_categorical
+
+    def _plan_ingestion(self):
+        """Binds schema-bound File/Parquet sources to their declared types and picks compact storage."""
+        arithmetic, not_categorical = self._column_uses()
+        for source in self.plan.sources.values():
+            fields = self.plan.schemas.get(source.schema_name)
+            if source.kind not in STREAMABLE_IO or not fields: continue
+            source.fields = fields
+            source.downcast = [c for c, t in fields.items() if t == 'int' and c not in arithmetic]
+            source.categorical = [c for c, t in fields.items() if t == 'string' and c not in not_categorical]
+
+    # --- Streaming ---
+
+    def _stream_blocker(self, pipeline):
+        """Returns why `pipeline` cannot run chunk by chunk, or None if it can."""
+        source = self.plan.sources.get(pipeline.start)
+        if not source or source.kind not in STREAMABLE_IO:
+            return f"'{pipeline.start}' is not a File or Parquet source"
+        if source.delta:
+            return f"only the new rows of incremental source '{pipeline.start}' are read"
+        if glob.has_magic(source.args['path']):
+            return f"'{pipeline.start}' reads several files"
+        if self.plan.workers and source.kind == 'File' and compressed(source.args['path']):
+            return f"'{pipeline.start}' is a compressed CSV, which cannot be split into byte ranges"
+        ops = [op_type for op_type, _ in pipeline.steps]
+        streamed = pipeline.steps[:ops.index('group_by')] if 'group_by' in ops else pipeline.steps
+        for op_type, args in streamed:
+            if op_type == 'sink' and 'sort_by' in self._sink_options(args):
+                return f"sink '{args}' sorts its whole output"
+        if 'group_by' in ops:
+            return self._aggregate_stream_blocker(ops)
+        if pipeline.target:
+            return f"its result is assigned to '{pipeline.target}' and kept for later pipelines"
+        sinks = [args for op_type, args in pipeline.steps if op_type == 'sink']
+        if not sinks:
+            return "it does not end in a sink"
+        for sink in sinks:
+            if self.plan.sinks.get(sink, {}).get('name') not in STREAMABLE_IO:
+                return f"sink '{sink}' is not a File or Parquet sink"
+        if ops.count('sort') > 1:
+            return "it sorts more than once"
+        for op_type in ops:
+            if op_type not in ROW_LOCAL_STEPS | {'sort', 'sink'}:
+                return f"'{op_type}' needs the whole input"
+        return None
+
+    @staticmethod
+    def _aggregate_stream_blocker(ops):
+        """
+        A `... -> group_by -> aggregate -> ...` pipeline streams its input into mergeable
+        partial aggregates; only the (small) aggregated frame is materialized, so the
+        result may be assigned and the steps after the aggregate run in memory.
+        """
+        at = ops.index('group_by')
+        if ops.count('group_by') > 1:
+            return "it groups more than once"
+        if at + 1 >= len(ops) or ops[at + 1] != 'aggregate':
+            return "group_by is not followed by aggregate"
+        for op_type in ops[:at]:
+            if op_type not in ROW_LOCAL_STEPS:
+                return f"'{op_type}' before group_by needs the whole input"
+        return None
+
+    def _plan_streaming(self):
+        for pipeline in self.plan.pipelines():
+            if not pipeline.live: continue
+            blocker = self._stream_blocker(pipeline)
+            if blocker is None: pipeline.streaming = True
+            # Only report pipelines that read a source directly; plain variable
+            # pipelines are in memory by construction.
+            elif pipeline.start in self.plan.sources: pipeline.stream_blocker = blocker
+        for source in self.plan.sources.values():
+            if all(getattr(c, 'streaming', False) for c in source.consumers):
+                source.materialize = False
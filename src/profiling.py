@@ -0,0 +1,127 @@
+# src/profiling.py
+#
+# Runtime helpers imported by scripts compiled for `flow explain --analyze`. The
+# transpiler brackets every source read, step, sink write and join with begin()
+# and end(), and each end() appends one record that points back at the .flow
+# line the work came from. Brackets nest: a record's time leaves out the records
+# inside it, so the times of a run add up to its total.
+
+import os
+import re
+import sys
+import time
+
+_records = []
+_started = []
+_accumulated = {}  # (node, node_line, step) -> the record end(accumulate=True) adds to.
+
+
+def _current_rss():
+    """The process's resident set size in bytes, or None where it cannot be read."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def reset_peak_rss():
+    """Resets the process's peak RSS where the OS allows it (Linux); elsewhere the peak is per process."""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f: f.write('5')
+    except OSError:
+        pass
+
+
+def peak_rss():
+    """Returns the process's peak resident set size in bytes, or None if unknown."""
+    try:
+        with open('/proc/self/status') as f:
+            return int(re.search(r'VmHWM:\s+(\d+) kB', f.read()).group(1)) * 1024
+    except (OSError, AttributeError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024  # macOS reports bytes, Linux kB.
+
+
+def _rows(value):
+    """Row count of a DataFrame, Table or grouped frame; a tuple sums its parts (join inputs)."""
+    if value is None: return None
+    if isinstance(value, tuple):
+        counts = [_rows(v) for v in value]
+        return None if None in counts else sum(counts)
+    if hasattr(value, 'num_rows'): return value.num_rows
+    if hasattr(value, 'ngroups'): return value.ngroups
+    try:
+        return len(value)
+    except TypeError:
+        return None
+
+
+def _file_bytes(paths):
+    total = 0
+    for path in paths:
+        if os.path.isdir(path):
+            total += sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+        elif os.path.exists(path):
+            total += os.path.getsize(path)
+    return total
+
+
+def reset():
+    _records.clear()
+    _started.clear()
+    _accumulated.clear()
+
+
+def records():
+    return list(_records)
+
+
+def begin():
+    _started.append([time.perf_counter(), _current_rss(), 0.0])
+
+
+def _add(total, value):
+    return None if total is None or value is None else total + value
+
+
+def end(node, node_line, step, lines, rows_in=None, rows_out=None, read=(), written=(), accumulate=False):
+    """
+    Closes the innermost begin(). `node` names the statement (a source, pipeline or
+    join), `step` the work inside it, and `lines` the .flow lines it came from.
+    `read`/`written` are the files the step loaded or produced. With `accumulate`,
+    a step run once per chunk adds its time and rows to the record of its first run.
+    """
+    start, rss_before, inner = _started.pop()
+    elapsed = time.perf_counter() - start
+    if _started: _started[-1][2] += elapsed
+    rss_after = _current_rss()
+    record = {
+        'node': node,
+        'node_line': node_line,
+        'step': step,
+        'lines': [line for line in lines if line is not None],
+        'seconds': elapsed - inner,
+        'rows_in': _rows(rows_in),
+        'rows_out': _rows(rows_out),
+        'memory_delta_bytes': rss_after - rss_before if rss_before is not None and rss_after is not None else None,
+        'bytes_read': _file_bytes(read) if read else None,
+        'bytes_written': _file_bytes(written) if written else None,
+    }
+    key = (node, node_line, step)
+    if accumulate and key in _accumulated:
+        total = _accumulated[key]
+        total['seconds'] += record['seconds']
+        total['rows_in'] = _add(total['rows_in'], record['rows_in'])
+        total['rows_out'] = _add(total['rows_out'], record['rows_out'])
+        # Memory grows and shrinks chunk by chunk; the largest change is the one that matters.
+        if record['memory_delta_bytes'] is not None and total['memory_delta_bytes'] is not None:
+            total['memory_delta_bytes'] = max(total['memory_delta_bytes'], record['memory_delta_bytes'])
+        return
+    if accumulate: _accumulated[key] = record
+    _records.append(record)
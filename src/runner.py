@@ -1,51 +1,166 @@
 # src/runner.py
 
+import fnmatch
+import marshal
+import time
+import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor
 from lark import Tree
+from . import profiling, sources
+from .planner import QueryPlanner
 from .transpiler import FlowTranspiler
 
+
+def _init_worker(budget_mb, spill):
+    # Spawned workers do not inherit the parent's source cache settings.
+    sources.configure(budget_mb, spill)
+
+
+def _run_test(task):
+    """
+    Runs one compiled test in a fresh namespace, so nothing leaks between tests.
+    Returns a picklable result with the wall time and the peak resident memory.
+    """
+    name, code_bytes = task
+    cache = sources.get_cache()
+    reused, loads = cache.hits + cache.spill_hits, cache.misses
+    result = {'name': name, 'status': 'passed', 'message': None}
+    profiling.reset_peak_rss()
+    start = time.perf_counter()
+    try:
+        exec(marshal.loads(code_bytes), {'__name__': '__flow_test__'})
+    except AssertionError as e:
+        result['status'], result['message'] = 'failed', f"Assertion failed. {e}"
+    except Exception as e:
+        result['status'], result['message'] = 'error', f"An unexpected error occurred. {e}"
+    result['time'] = time.perf_counter() - start
+    result['peak_bytes'] = profiling.peak_rss()
+    result['cache_reuses'] = cache.hits + cache.spill_hits - reused
+    result['cache_loads'] = cache.misses - loads
+    return result
+
+
 class TestRunner:
-    def __init__(self, parse_tree):
+    def __init__(self, parse_tree, jobs=1, fail_fast=False, name_filters=None, junit_path=None, suite_name='flow'):
         self.parse_tree = parse_tree
         self.test_blocks = []
+        self.jobs = jobs
+        self.fail_fast = fail_fast
+        self.name_filters = name_filters or []
+        self.junit_path = junit_path
+        self.suite_name = suite_name
+
+    def _selected(self, name):
+        """A filter matches as a glob if it has wildcards, otherwise as a substring."""
+        if not self.name_filters: return True
+        for pattern in self.name_filters:
+            if not any(c in pattern for c in "*?["): pattern = f"*{pattern}*"
+            if fnmatch.fnmatchcase(name, pattern): return True
+        return False
 
     def find_test_blocks(self):
         """Finds all `test_block` nodes in the parse tree."""
         for node in self.parse_tree.children:
             if isinstance(node, Tree) and node.data == 'test_block':
                 test_name = node.children[0].value[1:-1]
+                if not self._selected(test_name): continue
                 # The actual statements are the rest of the children
                 statements_tree = Tree('start', node.children[1:])
                 self.test_blocks.append({'name': test_name, 'tree': statements_tree})
 
+    def compile_test(self, test):
+        """Plans, transpiles and compiles a test block once, in the parent; workers only execute it."""
+        # Each test gets its own plan and a fresh, isolated transpiler, so tests read
+        # only what they use, as scripts compiled by `flow run` do.
+        plan = QueryPlanner(test['tree']).build()
+        python_script = FlowTranspiler(plan).transform(test['tree'])
+        return marshal.dumps(compile(python_script, f"<flow test '{test['name']}'>", "exec"))
+
+    def _results(self, tasks):
+        """Yields results in test order; with fail_fast, tests not yet started are skipped."""
+        if self.jobs <= 1:
+            stop = False
+            for task in tasks:
+                if stop: yield {'name': task[0], 'status': 'skipped', 'message': "Skipped after an earlier failure."}
+                else:
+                    result = task[1] if isinstance(task[1], dict) else _run_test(task)
+                    stop = self.fail_fast and result['status'] != 'passed'
+                    yield result
+            return
+        cache = sources.get_cache()
+        with ProcessPoolExecutor(max_workers=self.jobs, initializer=_init_worker,
+                                 initargs=(cache.budget_bytes / sources.MB, cache.spill_dir is not None)) as pool:
+            futures = [None if isinstance(code, dict) else pool.submit(_run_test, (name, code)) for name, code in tasks]
+            for (name, code), future in zip(tasks, futures):
+                if future is None: result = code
+                elif future.cancelled(): result = {'name': name, 'status': 'skipped', 'message': "Skipped after an earlier failure."}
+                else: result = future.result()
+                if self.fail_fast and result['status'] in ('failed', 'error'):
+                    for pending in futures:
+                        if pending: pending.cancel()
+                yield result
+
     def run(self):
         """Runs all the tests that were found."""
         self.find_test_blocks()
         print(f"Found {len(self.test_blocks)} test(s).\n")
-        
-        passed_count = 0
-        failed_count = 0
 
+        tasks = []
         for test in self.test_blocks:
-            print(f"▶️  Running test: '{test['name']}'")
             try:
-                # Each test gets a fresh, isolated transpiler
-                transpiler = FlowTranspiler()
-                python_script = transpiler.transform(test['tree'])
-
-                # The generated assert statements are handled by python's exec
-                exec(python_script, globals())
-
-                print(f"✅ PASSED: '{test['name']}'\n")
-                passed_count += 1
-            except AssertionError as e:
-                print(f"❌ FAILED: '{test['name']}'")
-                print(f"   Reason: Assertion failed. {e}\n")
-                failed_count += 1
+                tasks.append((test['name'], self.compile_test(test)))
             except Exception as e:
-                print(f"❌ ERROR: '{test['name']}'")
-                print(f"   Reason: An unexpected error occurred. {e}\n")
-                failed_count += 1
+                # Compile errors are reported in order, like any other error.
+                tasks.append((test['name'], {'name': test['name'], 'status': 'error',
+                                             'message': f"Could not compile the test. {e}"}))
 
+        results = []
+        for result in self._results(tasks):
+            results.append(result)
+            name, status = result['name'], result['status']
+            timing = f" ({result['time']:.2f}s" if 'time' in result else ""
+            if result.get('peak_bytes'): timing += f", peak RSS {result['peak_bytes'] / sources.MB:.0f} MB"
+            if timing: timing += ")"
+            if status == 'passed':
+                print(f"✅ PASSED: '{name}'{timing}\n")
+            elif status == 'skipped':
+                print(f"⏭️  SKIPPED: '{name}'\n")
+            else:
+                print(f"❌ {'FAILED' if status == 'failed' else 'ERROR'}: '{name}'{timing}")
+                print(f"   Reason: {result['message']}\n")
+
+        passed_count = sum(r['status'] == 'passed' for r in results)
+        failed_count = sum(r['status'] in ('failed', 'error') for r in results)
+        skipped_count = sum(r['status'] == 'skipped' for r in results)
         print("-" * 20)
-        print(f"Test Summary: {passed_count} passed, {failed_count} failed.")
-        return failed_count == 0
\ No newline at end of file
+        summary = f"Test Summary: {passed_count} passed, {failed_count} failed"
+        print(summary + (f", {skipped_count} skipped." if skipped_count else "."))
+        reuses = sum(r.get('cache_reuses', 0) for r in results)
+        if reuses:
+            loads = sum(r.get('cache_loads', 0) for r in results)
+            print(f"Source cache: {loads} load(s), {reuses} reuse(s).")
+        if self.junit_path:
+            self.write_junit(results, self.junit_path)
+            print(f"JUnit report written to {self.junit_path}")
+        return failed_count == 0
+
+    def write_junit(self, results, path):
+        """Writes the results as a JUnit XML report, which CI systems can aggregate."""
+        suite = ET.Element('testsuite', {
+            'name': self.suite_name,
+            'tests': str(len(results)),
+            'failures': str(sum(r['status'] == 'failed' for r in results)),
+            'errors': str(sum(r['status'] == 'error' for r in results)),
+            'skipped': str(sum(r['status'] == 'skipped' for r in results)),
+            'time': f"{sum(r.get('time', 0) for r in results):.3f}",
+        })
+        for result in results:
+            case = ET.SubElement(suite, 'testcase', {'classname': self.suite_name, 'name': result['name'],
+                                                     'time': f"{result.get('time', 0):.3f}"})
+            if result['status'] == 'failed': ET.SubElement(case, 'failure', {'message': result['message']})
+            elif result['status'] == 'error': ET.SubElement(case, 'error', {'message': result['message']})
+            elif result['status'] == 'skipped': ET.SubElement(case, 'skipped', {'message': result['message']})
+            if result.get('peak_bytes'):
+                properties = ET.SubElement(case, 'properties')
+                ET.SubElement(properties, 'property', {'name': 'peak_memory_bytes', 'value': str(result['peak_bytes'])})
+        ET.ElementTree(suite).write(path, encoding='utf-8', xml_declaration=True)
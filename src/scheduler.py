@@ -0,0 +1,104 @@
+# src/scheduler.py
+#
+# Runtime helpers that overlap I/O with computation in compiled scripts. When a
+# script reads several sources, each is loaded on a shared thread pool as soon as
+# it is declared, and the script only waits for it right before the first
+# statement that uses it. File and Parquet sink writes run in the background
+# while later pipelines compute; writes to the same path keep their order, and the
+# script waits for all of them at its end. Errors surface in script order: a
+# failed load where the source is first used, and a failed write at the end,
+# the first one issued winning.
+
+import contextvars
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+IO_THREADS_ENV = "FLOW_IO_THREADS"
+DEFAULT_IO_THREADS = 8
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def io_threads():
+    """Threads for loads and writes, from FLOW_IO_THREADS; 1 runs everything in order on the caller."""
+    return max(1, int(os.environ.get(IO_THREADS_ENV, DEFAULT_IO_THREADS)))
+
+
+def _executor():
+    global _pool
+    with _pool_lock:
+        if _pool is None: _pool = ThreadPoolExecutor(io_threads(), thread_name_prefix="flow-io")
+        return _pool
+
+
+class _Done:
+    """A finished task, for running without threads; it mirrors the Future methods used here."""
+    def __init__(self, task):
+        self.value, self.error = None, None
+        try:
+            self.value = task()
+        except Exception as e:
+            self.error = e
+
+    def result(self):
+        if self.error: raise self.error
+        return self.value
+
+    def cancel(self): return False
+
+
+class Scheduler:
+    """The loads and writes one run of a script started."""
+    def __init__(self):
+        self.loads = {}        # Variable -> future of its source
+        self.writes = []       # (path, future) in the order the writes were issued
+        self.last_write = {}   # Path -> future of the last write issued for it
+
+    def _submit(self, task):
+        # Tasks run in the context of the script that started them, so what they print
+        # goes where the script's output goes (see server.py).
+        return _Done(task) if io_threads() == 1 else _executor().submit(contextvars.copy_context().run, task)
+
+    def load(self, name, loader):
+        """Starts loading the source assigned to `name`."""
+        self.loads[name] = self._submit(loader)
+
+    def result(self, name):
+        """Waits for the source assigned to `name`; if it failed, the loads not started yet are dropped."""
+        try:
+            return self.loads.pop(name).result()
+        except Exception:
+            for future in self.loads.values(): future.cancel()
+            raise
+
+    def write(self, path, writer):
+        """Starts `writer()` once the writes already issued for `path` are done."""
+        previous = self.last_write.get(path)
+        def task():
+            if previous is not None:
+                try:
+                    previous.result()
+                except Exception:
+                    pass  # Reported by wait(); this write still replaces it.
+            writer()
+        future = self.last_write[path] = self._submit(task)
+        self.writes.append((path, future))
+
+    def wait(self):
+        """
+        Waits for every write. The first failure in the order the writes were issued is
+        raised, after the others are reported, so the error does not depend on timing.
+        """
+        for future in self.loads.values(): future.cancel()  # Sources nothing used after all.
+        errors = []
+        for path, future in self.writes:
+            try:
+                future.result()
+            except Exception as e:
+                errors.append((path, e))
+        self.loads, self.writes, self.last_write = {}, [], {}
+        for path, error in errors[1:]:
+            print(f"❌ Writing '{path}' failed as well: {error}")
+        if errors: raise errors[0][1]
@@ -0,0 +1,257 @@
+# src/server.py
+#
+# `flow serve` and `flow submit`. The server is one long-lived interpreter that
+# keeps pandas, pyarrow and the parser loaded, compiled scripts in memory, pooled
+# database engines open and loaded sources in the source cache between jobs, so a
+# small job pays for its own work only. Clients send one JSON request per
+# connection over a Unix socket and get one JSON reply back.
+#
+# Jobs run on the server's threads, at most `jobs` at a time; the rest wait for a
+# free slot. Each runs in a fresh namespace, and what it prints, on its own thread
+# or on the I/O threads it starts, is captured and sent back with its timings.
+# Jobs cannot use --workers: forking worker processes from a threaded server is
+# not safe.
+
+import contextvars
+import io
+import json
+import os
+import signal
+import socket
+import socketserver
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from . import incremental, sources
+from .cache import CompileCache, get_cache_dir
+from .compiler import compile_flow, load_plan, preload
+
+SOCKET_ENV = "FLOW_SOCKET"
+SOCKET_NAME = "flow.sock"
+DEFAULT_JOBS = 1
+DEFAULT_MAX_QUEUED = 64
+# Sources stay loaded between jobs, so the server caches them unless told otherwise.
+DEFAULT_SERVE_SOURCE_CACHE_MB = 1024
+
+
+def socket_path():
+    """The server's socket: FLOW_SOCKET, else flow.sock in the Flow cache directory."""
+    return os.environ.get(SOCKET_ENV) or os.path.join(get_cache_dir(), SOCKET_NAME)
+
+
+class _JobOutput:
+    """
+    Sends what a job prints to that job's buffer, and everything else on to `stream`.
+    The buffer is a context variable, which the scheduler's I/O threads inherit.
+    """
+    def __init__(self, stream):
+        self.stream = stream
+        self.buffer = contextvars.ContextVar('flow_job_output', default=None)
+
+    def _target(self):
+        buffer = self.buffer.get()
+        return self.stream if buffer is None else buffer
+
+    def write(self, text): return self._target().write(text)
+    def flush(self): self._target().flush()
+    def __getattr__(self, name): return getattr(self.stream, name)
+
+    @contextmanager
+    def capture(self):
+        buffer = io.StringIO()
+        token = self.buffer.set(buffer)
+        try:
+            yield buffer
+        finally:
+            self.buffer.reset(token)
+
+
+class _WorkingDirectory:
+    """
+    Scripts name their files relative to the directory they were submitted from, and
+    a process has one working directory: jobs from the same directory run side by
+    side, a job from another one waits until they are done.
+    """
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.current = None
+        self.users = 0
+
+    @contextmanager
+    def use(self, path):
+        with self.condition:
+            self.condition.wait_for(lambda: self.users == 0 or self.current == path)
+            if self.users == 0 and self.current != path:
+                os.chdir(path)
+                self.current = path
+            self.users += 1
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.users -= 1
+                self.condition.notify_all()
+
+
+def run_job(request, compile_cache, output):
+    """
+    Runs one submitted script the way `flow run` does, skipping up-to-date pipelines,
+    and returns the reply: status, captured output, planner notes and timings.
+    """
+    options = request.get('options', {})
+    chunk_size, workers = options.get('chunk_size'), options.get('workers')
+    engine, force = options.get('engine', 'pandas'), options.get('force', False)
+    reply = {'status': 'ok', 'error': None, 'notes': [], 'from_cache': False, 'timings': {}}
+    with output.capture() as buffer:
+        start = time.perf_counter()
+        try:
+            if workers:
+                raise ValueError("Error: --workers is not supported by `flow serve`; run the script with `flow run`.")
+            with open(request['path']) as f: flow_code = f.read()
+            use_cache, materialize = not options.get('no_cache', False), options.get('materialize', False)
+            plan = load_plan(flow_code, use_cache, compile_cache, chunk_size, workers, engine, materialize=materialize)
+            state = incremental.BuildState.load(request['path'])
+            hashes = incremental.source_hashes(plan, state)
+            reasons = incremental.outdated(plan, state, hashes, engine, force)
+            compiled = compile_flow(flow_code, use_cache=use_cache, cache=compile_cache, chunk_size=chunk_size,
+                                    workers=workers, engine=engine, materialize=materialize,
+                                    up_to_date=incremental.up_to_date(plan, reasons))
+        except Exception as e:
+            reply.update(status='error', error=str(e))
+        else:
+            reply.update(notes=compiled.notes, from_cache=compiled.from_cache)
+            reply['timings']['compile'] = time.perf_counter() - start
+            start = time.perf_counter()
+            try:
+                exec(compiled.code, {'__name__': '__flow__'})
+                incremental.record(plan, state, hashes, reasons, engine)
+            except Exception as e:
+                reply.update(status='error', error=f"An error occurred during script execution: {e}")
+            reply['timings']['run'] = time.perf_counter() - start
+    reply['output'] = buffer.getvalue()
+    return reply
+
+
+class FlowServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path, jobs=DEFAULT_JOBS, max_queued=DEFAULT_MAX_QUEUED):
+        self.jobs, self.max_queued = jobs, max_queued
+        self.slots = threading.BoundedSemaphore(jobs)
+        self.lock = threading.Lock()
+        self.queued = self.running = self.completed = self.failed = 0
+        self.started = time.time()
+        self.compile_cache = CompileCache(memory=True)
+        self.workdir = _WorkingDirectory()
+        self.script_locks = {}  # Script path -> lock; runs of one script never overlap.
+        self.output = _JobOutput(sys.stdout)
+        super().__init__(path, _Handler)
+
+    def _script_lock(self, path):
+        with self.lock:
+            return self.script_locks.setdefault(path, threading.Lock())
+
+    def submit(self, request):
+        received = time.perf_counter()
+        with self.lock:
+            if self.queued >= self.max_queued:
+                return {'status': 'error', 'error': f"Error: The server's queue is full ({self.max_queued} jobs waiting)."}
+            self.queued += 1
+        with self.slots, self._script_lock(request['path']), self.workdir.use(request['cwd']):
+            with self.lock: self.queued, self.running = self.queued - 1, self.running + 1
+            queued = time.perf_counter() - received
+            try:
+                reply = run_job(request, self.compile_cache, self.output)
+            finally:
+                with self.lock: self.running -= 1
+        with self.lock:
+            self.completed += 1
+            self.failed += reply['status'] != 'ok'
+        reply['timings'].update(queued=queued, total=time.perf_counter() - received)
+        return reply
+
+    def status(self):
+        cache = sources.get_cache()
+        with self.lock:
+            return {'status': 'ok', 'pid': os.getpid(), 'uptime': time.time() - self.started, 'jobs': self.jobs,
+                    'running': self.running, 'queued': self.queued, 'completed': self.completed,
+                    'failed': self.failed, 'compiled_scripts': len(self.compile_cache.entries),
+                    'source_cache_bytes': cache.used_bytes}
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        try:
+            request = json.loads(self.rfile.readline())
+            op = request.get('op')
+            if op == 'run': reply = self.server.submit(request)
+            elif op == 'status': reply = self.server.status()
+            elif op == 'stop':
+                reply = {'status': 'ok'}
+                threading.Thread(target=self.server.shutdown, daemon=True).start()
+            else: reply = {'status': 'error', 'error': f"Error: Unknown request '{op}'."}
+        except Exception as e:
+            reply = {'status': 'error', 'error': f"Error: Bad request. {e}"}
+        try:
+            self.wfile.write(json.dumps(reply).encode() + b"\n")
+        except OSError:
+            pass  # The client went away; the job has still run.
+
+
+def request(message, path=None):
+    """Sends one request to the server and returns its reply. Raises OSError if none is listening."""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(path or socket_path())
+        sock.sendall(json.dumps(message).encode() + b"\n")
+        with sock.makefile('rb') as f:
+            line = f.readline()
+    if not line: raise ConnectionError("The server closed the connection without replying.")
+    return json.loads(line)
+
+
+def _warm():
+    preload()
+    try:
+        import sqlalchemy  # noqa: F401  Only Postgres sources need it.
+    except ImportError:
+        pass
+
+
+def bind(path, jobs=DEFAULT_JOBS, max_queued=DEFAULT_MAX_QUEUED):
+    """
+    Creates the server and its socket. Jobs run with the server's permissions, so the
+    socket is created accessible to its user only, never briefly open to others.
+    """
+    umask = os.umask(0o177)
+    try:
+        return FlowServer(path, jobs, max_queued)
+    finally:
+        os.umask(umask)
+
+
+def serve(path=None, jobs=DEFAULT_JOBS, max_queued=DEFAULT_MAX_QUEUED):
+    """Runs the server until it is stopped, interrupted or terminated."""
+    path = path or socket_path()
+    if os.path.exists(path):
+        try:
+            request({'op': 'status'}, path)
+        except OSError:
+            os.remove(path)  # Left behind by a server that did not shut down cleanly.
+        else:
+            raise RuntimeError(f"Error: A Flow server is already listening on {path}.")
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    _warm()
+    server = bind(path, jobs, max_queued)
+    sys.stdout = server.output
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    print(f"✅ Flow server listening on {path} (pid {os.getpid()}, {jobs} concurrent job(s)).")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        sys.stdout = server.output.stream
+        if os.path.exists(path): os.remove(path)
+        print("🧹 Flow server stopped.")
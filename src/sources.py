@@ -0,0 +1,184 @@
+# src/sources.py
+#
+# Runtime helpers for loading sources. Compiled scripts read File and Parquet
+# sources through the process-wide SourceCache, so pipelines, test blocks and
+# repeated runs in one process that read the same unchanged file load it once.
+# Database tables are read on every run, and Postgres connections are pooled per
+# connection string.
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from .cache import get_cache_dir
+
+SOURCE_CACHE_ENV = "FLOW_SOURCE_CACHE_MB"
+MB = 1024 * 1024
+SPILL_FRAME_KEY = b'flow_frame'
+SPILL_SUBDIR = "sources"
+
+
+def stamp(path):
+    """
+    [mtime_ns, size] of a file; for a dataset directory, the latest mtime of the
+    directory and everything in it, and the total size of its files.
+    """
+    stat = os.stat(path)
+    if not os.path.isdir(path): return [stat.st_mtime_ns, stat.st_size]
+    mtime_ns, size = stat.st_mtime_ns, 0
+    for root, dirs, names in os.walk(path):
+        for name in dirs + names:
+            entry = os.stat(os.path.join(root, name))
+            mtime_ns = max(mtime_ns, entry.st_mtime_ns)
+            if name in names: size += entry.st_size
+    return [mtime_ns, size]
+
+
+def _nbytes(value):
+    """Approximate in-memory size of a pandas DataFrame or pyarrow Table."""
+    if hasattr(value, 'memory_usage'): return int(value.memory_usage(deep=True).sum())
+    return value.nbytes
+
+
+class SourceCache:
+    """
+    An LRU cache of loaded sources bounded by `budget_bytes`. Entries evicted from
+    memory are written to `spill_dir` as Feather files when a spill directory is set,
+    and read back (memory-mapped) instead of re-parsing the source. Spill files are
+    named after the entry's key, which includes the file's mtime and size, so a file
+    that changes on disk is never served stale.
+    """
+    def __init__(self, budget_bytes=0, spill_dir=None):
+        self.budget_bytes = budget_bytes
+        self.spill_dir = spill_dir
+        self.entries = OrderedDict()   # key -> (value, size in bytes)
+        self.used_bytes = 0
+        self.hits = self.misses = self.spill_hits = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def file_key(path, reader):
+        mtime_ns, size = stamp(path)
+        return ('file', os.path.abspath(path), mtime_ns, size, reader)
+
+    def _spillable(self, key):
+        return self.spill_dir is not None and key[0] == 'file'
+
+    def _spill_path(self, key):
+        return os.path.join(self.spill_dir, hashlib.sha256(repr(key).encode()).hexdigest() + ".feather")
+
+    def _spill(self, key, value):
+        import pyarrow as pa
+        import pyarrow.feather as feather
+        path = self._spill_path(key)
+        if os.path.exists(path): return
+        os.makedirs(self.spill_dir, exist_ok=True)
+        if isinstance(value, pa.Table): table = value
+        else:
+            # Marked so the entry is read back as a DataFrame rather than a Table.
+            table = pa.Table.from_pandas(value, preserve_index=False)
+            table = table.replace_schema_metadata({**(table.schema.metadata or {}), SPILL_FRAME_KEY: b'pandas'})
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        feather.write_feather(table, tmp_path, compression='uncompressed')  # Uncompressed files can be memory-mapped.
+        os.replace(tmp_path, path)
+
+    def _unspill(self, key):
+        import pyarrow.feather as feather
+        path = self._spill_path(key)
+        if not os.path.exists(path): return None
+        table = feather.read_table(path, memory_map=True)
+        if SPILL_FRAME_KEY in (table.schema.metadata or {}): return table.to_pandas()
+        return table
+
+    def _insert(self, key, value):
+        size = _nbytes(value)
+        if size > self.budget_bytes:
+            if self._spillable(key): self._spill(key, value)
+            return
+        self.entries[key] = (value, size)
+        self.used_bytes += size
+        while self.used_bytes > self.budget_bytes:
+            old_key, (old_value, old_size) = self.entries.popitem(last=False)
+            self.used_bytes -= old_size
+            if self._spillable(old_key): self._spill(old_key, old_value)
+
+    def get(self, key, loader):
+        """Returns the cached value for `key`, calling `loader()` on a miss."""
+        if not self.budget_bytes and not self.spill_dir: return loader()
+        with self._lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key][0]
+        value = self._unspill(key) if self._spillable(key) else None
+        with self._lock:
+            if value is not None: self.spill_hits += 1
+            else: self.misses += 1
+        if value is None: value = loader()
+        with self._lock:
+            if key not in self.entries: self._insert(key, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self.entries.clear()
+            self.used_bytes = 0
+
+
+def default_budget_bytes(default_mb=0):
+    return int(float(os.environ.get(SOURCE_CACHE_ENV, default_mb)) * MB)
+
+
+_cache = SourceCache(default_budget_bytes())
+_engines = {}
+
+
+def configure(budget_mb=None, spill=False, default_mb=0):
+    """
+    Replaces the process-wide cache. Without `budget_mb` the budget comes from
+    FLOW_SOURCE_CACHE_MB, else `default_mb`; `spill` keeps evicted files in the
+    Flow cache directory.
+    """
+    global _cache
+    budget_bytes = default_budget_bytes(default_mb) if budget_mb is None else int(budget_mb * MB)
+    spill_dir = os.path.join(get_cache_dir(), SPILL_SUBDIR) if spill else None
+    _cache = SourceCache(budget_bytes, spill_dir)
+    return _cache
+
+
+def get_cache():
+    return _cache
+
+
+def clear_spilled():
+    """Deletes every spilled source file and returns how many were removed."""
+    spill_dir = os.path.join(get_cache_dir(), SPILL_SUBDIR)
+    if not os.path.isdir(spill_dir): return 0
+    removed = 0
+    for name in os.listdir(spill_dir):
+        if name.endswith(".feather"):
+            os.remove(os.path.join(spill_dir, name))
+            removed += 1
+    return removed
+
+
+def read_file(path, reader, loader):
+    """Loads a File/Parquet source. `reader` is the source of the reader call, part of the key."""
+    return _cache.get(SourceCache.file_key(path, reader), loader)
+
+
+def read_table(location, reader, loader):
+    """
+    Loads a database table; `location` identifies the server, database and table.
+    A table has no stamp to tell that it changed, so it is never served from the cache.
+    """
+    return loader()
+
+
+def get_engine(conn_str):
+    """Returns one pooled SQLAlchemy engine per connection string for the whole process."""
+    if conn_str not in _engines:
+        from sqlalchemy import create_engine
+        # A pooled connection the server dropped is replaced rather than failing a query.
+        _engines[conn_str] = create_engine(conn_str, pool_pre_ping=True)
+    return _engines[conn_str]
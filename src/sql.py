@@ -0,0 +1,133 @@
+# src/sql.py
+#
+# Runtime helpers for Postgres sources and sinks in compiled scripts. A source runs
+# one query built from what the planner pushed down: the columns the script uses,
+# the filters the database evaluates exactly as pandas would and, for a pipeline
+# that only filters and aggregates, the group_by/aggregate itself. Results arrive
+# in batches from a server-side cursor, or through COPY when psycopg2 is the
+# driver and the schema gives the column types. Sinks bulk load with COPY and fall
+# back to batched inserts on other databases (SQLite stands in for tests).
+
+import csv
+import io
+import os
+import pandas as pd
+from .sources import get_engine
+
+# Rows fetched per round trip from a server-side cursor, and rows per COPY or INSERT batch.
+SQL_BATCH_ROWS = 50_000
+
+SQL_OPERATORS = {'>': '>', '<': '<', '==': '=', '!=': '<>'}
+SQL_AGGREGATES = {'count': 'COUNT', 'sum': 'SUM', 'mean': 'AVG', 'min': 'MIN', 'max': 'MAX'}
+SQL_TYPES = {'int': 'BIGINT', 'float': 'DOUBLE PRECISION'}
+
+
+def postgres_engine(user, host, database, password_env):
+    """The pooled engine for a Postgres server whose password is in `password_env`."""
+    password = os.getenv(password_env)
+    if password is None:
+        raise ValueError(f"Flow Execution Error: Environment variable '{password_env}' for the database password is not set.")
+    return get_engine(f'postgresql+psycopg2://{user}:{password}@{host}/{database}')
+
+
+def quote(identifier):
+    """Quotes a column or a (schema-qualified) table name."""
+    return '.'.join('"' + part.replace('"', '""') + '"' for part in identifier.split('.'))
+
+
+def query(table, columns=None, filters=(), group_by=None, aggs=None, fields=None):
+    """
+    Returns (SQL, bound parameters). `filters` are (column, op, literal) conjuncts;
+    `aggs` maps output column -> (input column, func) as in aggregation.py.
+    """
+    select = [quote(c) for c in columns] if columns else ['*']
+    where, params = [], {}
+    for i, (column, op, value) in enumerate(filters):
+        condition = f"{quote(column)} {SQL_OPERATORS[op]} :p{i}"
+        # pandas keeps rows whose value is missing when filtering on '!='.
+        if op == '!=': condition = f"({condition} OR {quote(column)} IS NULL)"
+        where.append(condition)
+        params[f"p{i}"] = value
+    if group_by:
+        where += [f"{quote(c)} IS NOT NULL" for c in group_by]  # pandas drops missing keys.
+        select = [quote(c) for c in group_by]
+        for new_col, (column, func) in aggs.items():
+            expr = f"{SQL_AGGREGATES[func]}({quote(column)})"
+            # pandas sums an empty group to 0, and keeps sums and means in the column's type.
+            if func == 'sum': expr = f"CAST(COALESCE({expr}, 0) AS {SQL_TYPES[(fields or {}).get(column, 'float')]})"
+            elif func == 'mean': expr = f"CAST({expr} AS DOUBLE PRECISION)"
+            select.append(f"{expr} AS {quote(new_col)}")
+    sql = f"SELECT {', '.join(select)} FROM {quote(table)}"
+    if where: sql += " WHERE " + " AND ".join(where)
+    if group_by: sql += " GROUP BY " + ", ".join(quote(c) for c in group_by)
+    return sql, params
+
+
+def _copy_read(engine, sql, params, fields):
+    """
+    Reads a query's result with COPY ... TO STDOUT, parsed straight into the declared
+    types; None when the driver has no COPY support.
+    """
+    import sqlalchemy as sa
+    import pyarrow.csv as pa_csv
+    from .ingest import ARROW_TYPES
+    raw = engine.raw_connection()
+    try:
+        cursor = raw.cursor()
+        if not hasattr(cursor, 'copy_expert'): return None
+        # COPY takes no bound parameters, so the dialect renders them as escaped literals.
+        literal = sa.text(sql).bindparams(**params).compile(dialect=engine.dialect, compile_kwargs={'literal_binds': True})
+        buffer = io.BytesIO()
+        cursor.copy_expert(f"COPY ({literal}) TO STDOUT WITH (FORMAT csv, HEADER)", buffer)
+    finally:
+        raw.close()
+    buffer.seek(0)
+    # Unquoted empty fields are NULL; a quoted "" is an empty string.
+    options = pa_csv.ConvertOptions(column_types={c: ARROW_TYPES[t] for c, t in fields.items()},
+                                    null_values=[''], strings_can_be_null=True, quoted_strings_can_be_null=False,
+                                    true_values=['t'], false_values=['f'])
+    return pa_csv.read_csv(buffer, convert_options=options).to_pandas()
+
+
+def read_table(engine, table, columns=None, filters=(), group_by=None, aggs=None, fields=None):
+    """
+    Reads a table (or its aggregate) with the pushed-down columns, filters and
+    group_by/aggregate. `fields` are the declared column types, if the source has a schema.
+    """
+    import sqlalchemy as sa
+    sql, params = query(table, columns, filters, group_by, aggs, fields)
+    frame = None
+    if engine.dialect.name == 'postgresql' and fields and not group_by:
+        frame = _copy_read(engine, sql, params, fields)
+    if frame is None:
+        with engine.connect() as conn:
+            # stream_results makes psycopg2 use a server-side cursor, fetched in batches.
+            conn = conn.execution_options(stream_results=True, max_row_buffer=SQL_BATCH_ROWS)
+            frames = list(pd.read_sql(sa.text(sql), conn, params=params, chunksize=SQL_BATCH_ROWS))
+        frame = pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+    if group_by:
+        # pandas returns groups sorted by their keys, in Python's ordering rather than the database's collation.
+        frame = frame.sort_values(group_by, kind='stable', ignore_index=True)
+    return frame
+
+
+def write_table(df, engine, table, mode='replace'):
+    """
+    Writes a frame to a table, replacing it (and its definition) or appending to it.
+    Postgres rows are bulk loaded with COPY ... FROM STDIN in batches.
+    """
+    schema, _, name = table.rpartition('.')
+    with engine.begin() as conn:
+        # Creates or replaces the table from the frame's columns and types, without rows.
+        df.head(0).to_sql(name, conn, schema=schema or None, if_exists='append' if mode == 'append' else 'replace', index=False)
+        cursor = conn.connection.cursor()
+        if engine.dialect.name != 'postgresql' or not hasattr(cursor, 'copy_expert'):
+            df.to_sql(name, conn, schema=schema or None, if_exists='append', index=False, chunksize=SQL_BATCH_ROWS)
+            return
+        copy = f"COPY {quote(table)} ({', '.join(quote(c) for c in df.columns)}) FROM STDIN WITH (FORMAT csv, NULL '\\N')"
+        for start in range(0, len(df), SQL_BATCH_ROWS):
+            buffer = io.StringIO()
+            df.iloc[start:start + SQL_BATCH_ROWS].to_csv(buffer, index=False, header=False, na_rep='\\N',
+                                                          quoting=csv.QUOTE_MINIMAL)
+            buffer.seek(0)
+            cursor.copy_expert(copy, buffer)
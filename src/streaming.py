@@ -0,0 +1,155 @@
+# src/streaming.py
+#
+# Runtime helpers imported by scripts compiled with `flow run --stream`. They keep
+# memory bounded by the chunk size rather than by the size of the input.
+
+import os
+import shutil
+import tempfile
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from .datasets import dataset
+from .planner import DEFAULT_CHUNK_SIZE, compressed
+
+
+# The pandas types a schema-bound CSV is read with; ints and bools stay nullable
+# until a chunk shows they have no missing values.
+CSV_DTYPES = {'int': 'Int64', 'float': 'float64', 'string': 'str', 'bool': 'boolean'}
+NON_NULLABLE = {pd.Int64Dtype(): 'int64', pd.BooleanDtype(): 'bool'}
+
+
+def _csv_chunks(source, chunk_size, columns, fields):
+    """
+    CSV chunks with the same column types in every chunk. Declared types are fixed
+    before reading; otherwise an int column of the first chunk stays an int when a
+    later chunk has missing values in it, rather than turning into floats there.
+    """
+    dtype = None
+    if fields:
+        # Only declared columns are read, as in eager typed reads.
+        columns = [c for c in fields if columns is None or c in columns]
+        dtype = {c: CSV_DTYPES[fields[c]] for c in columns}
+    ints = None
+    for chunk in pd.read_csv(source, chunksize=chunk_size, usecols=columns, dtype=dtype):
+        if dtype is None:
+            if ints is None: ints = [c for c, t in chunk.dtypes.items() if t == 'int64']
+            for name in ints:
+                if chunk[name].dtype == 'float64' and chunk[name].hasnans and (chunk[name].dropna() % 1 == 0).all():
+                    chunk[name] = chunk[name].astype('Int64')
+        else:
+            for name, column in chunk.items():
+                if column.dtype in NON_NULLABLE and not column.hasnans:
+                    chunk[name] = column.astype(NON_NULLABLE[column.dtype])
+        yield chunk
+
+
+def read_chunks(path, kind, chunk_size=DEFAULT_CHUNK_SIZE, columns=None, filters=None, fields=None):
+    """
+    Yields a source (a Parquet file or dataset directory) as DataFrames of at most
+    `chunk_size` rows. `fields` are a schema-bound CSV's declared types.
+    """
+    if kind == 'File':
+        # pyarrow decompresses any codec a sink writes; pandas needs an extra package for zstd.
+        source = pa.input_stream(path, compression='detect') if compressed(path) else path
+        yield from _csv_chunks(source, chunk_size, columns, fields)
+    elif kind == 'Parquet':
+        expression = pq.filters_to_expression(filters) if filters else None
+        scanner = dataset(path).scanner(columns=columns, filter=expression, batch_size=chunk_size)
+        for batch in scanner.to_batches():
+            if batch.num_rows: yield batch.to_pandas()
+    else:
+        raise ValueError(f"Flow Execution Error: '{kind}' sources cannot be streamed.")
+
+
+class ChunkWriter:
+    """Appends DataFrame chunks to a CSV ('File') or Parquet sink."""
+    def __init__(self, path, kind):
+        self.path = path
+        self.kind = kind
+        self.rows_written = 0
+        self._started = False
+        self._parquet_writer = None
+
+    def write(self, df):
+        # An empty chunk only matters as the CSV header, and it would give a Parquet
+        # file a schema of untyped columns.
+        if df.empty and (self._started or self.kind == 'Parquet'): return
+        if self.kind == 'File':
+            df.to_csv(self.path, index=False, mode='a' if self._started else 'w', header=not self._started)
+        elif self.kind == 'Parquet':
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            if self._parquet_writer is None:
+                self._parquet_writer = pq.ParquetWriter(self.path, table.schema)
+            else:
+                # Each chunk infers its own types; keep the file's schema from the first one.
+                table = table.cast(self._parquet_writer.schema)
+            self._parquet_writer.write_table(table)
+        else:
+            raise ValueError(f"Flow Execution Error: '{self.kind}' sinks cannot be streamed.")
+        self._started = True
+        self.rows_written += len(df)
+
+    def close(self):
+        if self._parquet_writer is not None:
+            self._parquet_writer.close()
+        elif not self._started and self.kind == 'File':
+            open(self.path, 'w').close()  # An empty input still produces the sink file.
+
+    def __enter__(self): return self
+    def __exit__(self, *exc_info): self.close()
+
+
+class ExternalSorter:
+    """
+    Sorts data larger than memory: every added chunk is sorted and spilled to a
+    Parquet run file, and sorted_chunks() k-way merges the runs back in batches.
+    """
+    def __init__(self, by, ascending=True, spill_dir=None):
+        self.by = by
+        self.ascending = ascending
+        self.spill_dir = tempfile.mkdtemp(prefix='flow-sort-', dir=spill_dir)
+        self.runs = []
+
+    def _sort(self, df):
+        return df.sort_values(by=self.by, ascending=self.ascending, kind='mergesort')
+
+    def _merge_sort(self, df):
+        # Ties across runs go to the earlier run, so the merge is as stable as one in-memory sort.
+        ascending = self.ascending if isinstance(self.ascending, list) else [self.ascending] * len(self.by)
+        return df.sort_values(by=self.by + ['_flow_run'], ascending=ascending + [True], kind='mergesort')
+
+    def add(self, df):
+        if df.empty: return
+        run_path = os.path.join(self.spill_dir, f"run_{len(self.runs)}.parquet")
+        self._sort(df).to_parquet(run_path, index=False)
+        self.runs.append(run_path)
+
+    def sorted_chunks(self, chunk_size=DEFAULT_CHUNK_SIZE):
+        if not self.runs: return
+        # Buffers shrink as runs multiply so the merge holds about one chunk in memory.
+        batch_size = max(1024, chunk_size // len(self.runs))
+        readers = {i: pq.ParquetFile(path).iter_batches(batch_size=batch_size) for i, path in enumerate(self.runs)}
+        buffers = {}
+        while readers or buffers:
+            for run_id in list(readers):
+                if run_id in buffers: continue
+                batch = next(readers[run_id], None)
+                if batch is None: del readers[run_id]
+                else: buffers[run_id] = batch.to_pandas().assign(_flow_run=run_id)
+            if not buffers: return
+            # Everything up to the last buffered row of the run whose tail sorts first
+            # is final: no row still on disk can sort before it.
+            tails = pd.concat([buf.iloc[[-1]] for buf in buffers.values()])
+            bound_run = self._merge_sort(tails)['_flow_run'].iloc[0]
+            merged = self._merge_sort(pd.concat(buffers.values(), ignore_index=True))
+            cut = int((merged['_flow_run'] == bound_run).to_numpy().nonzero()[0][-1]) + 1
+            ready, rest = merged.iloc[:cut], merged.iloc[cut:]
+            buffers = {run_id: group for run_id, group in rest.groupby('_flow_run', sort=False)}
+            yield ready.drop(columns='_flow_run').reset_index(drop=True)
+
+    def close(self):
+        shutil.rmtree(self.spill_dir, ignore_errors=True)
+
+    def __enter__(self): return self
+    def __exit__(self, *exc_info): self.close()
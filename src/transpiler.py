@@ -1,28 +1,153 @@
 # src/transpiler.py
 
-from lark import Transformer, v_args
+import ast
+import fnmatch
+import hashlib
+import os
+import re
+from lark import Token, Transformer, v_args
+from . import expressions
+from .backends import PandasBackend
+from .planner import DEFAULT_CHUNK_SIZE, STREAMABLE_IO, JoinPlan, sink_options
+
+# Variables holding frames: sources and assignments ('users_df') and pipeline temporaries.
+FRAME_VAR = re.compile(r"^(temp_df_\d+|\w+_df)$")
 
 class FlowTranspiler(Transformer):
-    def __init__(self):
+    def __init__(self, plan=None, backend=None, profile=False, materialize=False):
+        # An optional LogicalPlan from the QueryPlanner; without one every source
+        # is read in full, exactly as written.
+        self.plan = plan
+        # The backend supplies the code templates; streaming and partitioned
+        # pipelines are only planned for backends that support chunking.
+        self.backend = backend or PandasBackend()
+        # Profiling brackets every read, step, write and join with flow_profile calls.
+        self.profile = profile
+        # Materializing stores assigned variables in the work directory (see materialize.py).
+        self.materialize = materialize
         self.code_blocks = []
         self.sinks = {}
         self.variables = {} 
         self.schemas = {}
         self.variable_schemas = {}
+        # Flow variable -> {column: Flow type} as far as schemas tell, for typing expressions.
+        self.variable_types = {}
+        self.result_types = {}   # Column types of the pipeline or join transformed last.
         self.temp_var_count = 0
-        self.imports = {"pandas as pd", "os"}
+        self.node_count = 0
+        # (input variable, op_type, args) -> variable holding that step's result, so
+        # pipelines that start with the same steps on the same input share them.
+        self.step_cache = {}
+        # Flow variable -> (kind, path) and (path, reader call) of File/Parquet sources,
+        # for joins that stream a source or keep a key index for it.
+        self.source_files = {}
+        self.source_readers = {}
+        self.result_node = None  # The plan of the pipeline or join transformed last.
+        self.imports = self.backend.imports() | {"os"}
+        # Sources loaded together on the I/O pool, and the File/Parquet paths the script
+        # reads, which are never written in the background (see scheduler.py).
+        self.scheduled_sources, self.read_paths = self._io_schedule()
+        self.scheduled_loads = []  # Variables whose loads were started, waited for before first use.
+
+    def _io_schedule(self):
+        """
+        Returns the sources to load on the I/O pool and the paths the script reads, or
+        None when sink writes are not run in the background. Profiled runs keep every
+        read and write in its own measured step, and partitioned runs fork worker
+        processes, which must not happen while I/O threads are running.
+        """
+        if not self.plan or self.profile or self.plan.workers: return set(), None
+        read = {os.path.normpath(s.args['path']) for s in self.plan.sources.values() if s.kind in STREAMABLE_IO}
+        written = {os.path.normpath(s['args']['path']) for s in self.plan.sinks.values() if s['name'] in STREAMABLE_IO}
+        loads = set()
+        for name, source in self.plan.sources.items():
+            if not source.materialize or source.incremental: continue
+            if source.kind in STREAMABLE_IO and os.path.normpath(source.args['path']) in written: continue
+            if source.kind == 'Postgres' and not isinstance(source.args.get('password'), tuple): continue
+            loads.add(name)
+        # A single source has nothing to load alongside, and a single sink write nothing to run behind.
+        writes = sum(len(node.sinks()) for node in self.plan.nodes if node.live)
+        return (loads if len(loads) > 1 else set()), (read if writes > 1 else None)
+
+    def _load(self, flow_var, python_var, statements, expr, line, step, read=()):
+        """Emits a source read: in place, or as a function started on the I/O pool."""
+        if flow_var not in self.scheduled_sources:
+            code = self._profiled(statements + [f"{python_var} = {expr}"], f"source '{flow_var}'", line, step,
+                                  [line], rows_out=python_var, read=read)
+            self.code_blocks.append("\n".join(code))
+            return
+        self.imports.add(f"scheduler as flow_scheduler from {__package__}")
+        function = f"flow_load_{flow_var}"
+        body = statements + [f"return {expr}"]
+        self.code_blocks.append("\n".join([f"def {function}():"] + [f"    {line}" for line in body]
+                                          + [f"flow_tasks.load('{python_var}', {function})"]))
+        self.scheduled_loads.append(python_var)
+
+    def _write(self, py_var, kind, path, options=None):
+        """A File/Parquet sink write, run in the background unless the script reads the path."""
+        if options: self.imports.add(f"datasets as flow_datasets from {__package__}")
+        py_var = self._sink_frame(py_var)
+        if self.read_paths is None or any(fnmatch.fnmatch(os.path.normpath(path), p) for p in self.read_paths):
+            return self.backend.write(py_var, kind, path, options)
+        self.imports.add(f"scheduler as flow_scheduler from {__package__}")
+        # The frame is bound now; the variable may be released before the write runs.
+        return f"flow_tasks.write('{path}', lambda df={py_var}: {self.backend.write('df', kind, path, options)})"
+
+    def _sink_frame(self, py_var):
+        """The frame a sink writes: with compact columns widened back when the script read any."""
+        if not self.plan or not self.backend.supports_compact_storage: return py_var
+        if not any(source.fields and (source.downcast or source.categorical) for source in self.plan.sources.values()):
+            return py_var
+        self.imports.add(f"ingest as flow_ingest from {__package__}")
+        return f"flow_ingest.widen({py_var})"
+
+    def _sink_options(self, sink_name):
+        """The write options of a sink (see datasets.py); its arguments here keep their quotes."""
+        sink_info = self.sinks[sink_name]
+        args = {key: value[1:-1] if isinstance(value, str) and value[:1] in '"\'' else value
+                for key, value in sink_info['args'].items()}
+        return sink_options(sink_name, sink_info['name'], args)
+
+    def _chunk_writer(self, sink_name):
+        """The writer a streamed pipeline appends a sink's chunks to."""
+        sink_info = self.sinks[sink_name]
+        path, kind, options = sink_info['args']['path'][1:-1], sink_info['name'], self._sink_options(sink_name)
+        if not options: return f"flow_streaming.ChunkWriter('{path}', '{kind}')"
+        self.imports.add(f"datasets as flow_datasets from {__package__}")
+        return f"flow_datasets.SinkWriter('{path}', '{kind}'{''.join(f', {k}={v!r}' for k, v in options.items())})"
 
     def _new_temp_var(self):
         self.temp_var_count += 1
         return f"temp_df_{self.temp_var_count}"
 
+    def _profiled(self, code, node, node_line, step, lines, rows_in=None, rows_out=None, read=(), written=(),
+                  accumulate=False):
+        """
+        Wraps a list of statements in flow_profile.begin()/end() when profiling is on.
+        `accumulate` adds each run to one record, for steps run once per chunk.
+        """
+        if not self.profile or not code: return code
+        self.imports.add(f"profiling as flow_profile from {__package__}")
+        end = (f"flow_profile.end({node!r}, {node_line}, {step!r}, {list(lines)}, {rows_in}, {rows_out}, "
+               f"read={list(read)}, written={list(written)}{', accumulate=True' if accumulate else ''})")
+        return ["flow_profile.begin()"] + code + [end]
+
+    def _pushdown(self, flow_var):
+        """Returns the (columns, filters) the planner pushed into a source's reader."""
+        source_plan = self.plan.sources.get(flow_var) if self.plan else None
+        if not source_plan: return None, None
+        return source_plan.columns, source_plan.filters
+
     # --- Methods for grammar rules ---
     
     def NAME(self, n): return n.value
     def STRING(self, s): return s
     def SIGNED_NUMBER(self, n): return n.value
+    def BOOLEAN(self, b): return b.value == 'true'
     def BOOL_OPERATOR(self, op): return op.value
     def AGG_FUNC_NAME(self, n): return n.value
+    def AND(self, _): return "&"
+    def OR(self, _): return "|"
     def TYPE(self, t): return t.value
     @v_args(inline=True)
     def op(self, o): return o.value
@@ -40,35 +165,22 @@ class FlowTranspiler(Transformer):
         return None
     @v_args(inline=True)
     def column_ref(self, table, column): return (table, column)
-    def arith_expr(self, items):
-        s = str(items[0])
-        for i in range(1, len(items), 2):
-            op = str(items[i])
-            val = str(items[i+1])
-            s += f" {op} {val}"
-        return f"({s})"
-    def term(self, items):
-        s = str(items[0])
-        for i in range(1, len(items), 2):
-            op = str(items[i])
-            val = str(items[i+1])
-            s += f" {op} {val}"
-        return s
+    # Expressions become the typed IR of expressions.py; the backend renders them.
+    def arith_expr(self, items): return expressions.Arith('arith_expr', [item if i % 2 == 0 else str(item) for i, item in enumerate(items)])
+    def term(self, items): return expressions.Arith('term', [item if i % 2 == 0 else str(item) for i, item in enumerate(items)])
     def factor(self, items):
         if isinstance(items[0], tuple):
             table, column = items[0]
-            return f"{{df}}['{column}']"
-        return str(items[0])
-    def bool_expression(self, items):
-        s = str(items[0])
-        for i in range(1, len(items), 2):
-            op = str(items[i])
-            val = str(items[i+1])
-            s += f" {op} {val}"
-        return s
+            return expressions.Column(column)
+        if isinstance(items[0], str): return expressions.Literal(str(items[0]))
+        return items[0]
+    def comparison(self, items):
+        left, op, right = items
+        return expressions.Comparison(left, op, right)
+    def bool_expression(self, items): return expressions.BoolExpr(items)
     
     def assert_statement(self, a):
-        condition_str = a[0]
+        condition_str = expressions.render(a[0], self.backend)
         final_condition = condition_str.replace("{df}", "df")
         self.code_blocks.append(f"assert {final_condition}")
         return None
@@ -78,7 +190,8 @@ class FlowTranspiler(Transformer):
     def sort(self, s):
         columns, order = [], 'asc'
         for item in s:
-            if item in ('asc', 'desc'): order = item
+            # The order is the only STRING argument; column names arrive as plain str.
+            if isinstance(item, Token): order = item[1:-1]
             else: columns.append(item)
         return ('sort', {'by': columns, 'ascending': (order == 'asc')})
     def mutate_expr(self, m): return {m[0]: m[1]}
@@ -101,14 +214,44 @@ class FlowTranspiler(Transformer):
         agg_dict = {new_col: (col, func) for new_col, (col, func) in a}
         return ('aggregate', agg_dict)
     def join_condition(self, j):
-        left_col_ref, right_col_ref = j
+        left_col_ref, _, right_col_ref = j
         return {'left_on': left_col_ref[1], 'right_on': right_col_ref[1]}
     def join_expr(self, j):
         left_source, right_source, condition_result = j
+        node_plan = self.result_node = self._next_node_plan()
+        if node_plan and not node_plan.live: return ([], None)
         left_df, right_df = self.variables.get(left_source), self.variables.get(right_source)
         left_on, right_on = condition_result['left_on'], condition_result['right_on']
+        self.result_types = {**self.variable_types.get(left_source, {}), **self.variable_types.get(right_source, {})}
         new_py_var = self._new_temp_var()
-        code_line = f"{new_py_var} = pd.merge({left_df}, {right_df}, left_on='{left_on}', right_on='{right_on}')"
+        read = []
+        if node_plan and self.backend.supports_chunking:
+            # joins.join() picks broadcast, sort-merge, partitioned or hash from the plan and the input sizes.
+            self.imports.add(f"joins as flow_joins from {__package__}")
+            inputs, options = [], []
+            for side, flow_var, py_var in (('left', left_source, left_df), ('right', right_source, right_df)):
+                if flow_var in node_plan.streamed:
+                    kind, path = self.source_files[flow_var]
+                    fields = self.plan.sources[flow_var].fields
+                    inputs.append(f"flow_joins.Scan('{path}', '{kind}', {self.plan.chunk_size or DEFAULT_CHUNK_SIZE}"
+                                  + (f", fields={fields})" if fields else ")"))
+                    read.append(path)
+                else:
+                    inputs.append(py_var)
+                    if flow_var in self.source_readers: options.append(f"{side}_source={self.source_readers[flow_var]!r}")
+                if getattr(node_plan, f"{side}_sorted"): options.append(f"{side}_sorted=True")
+            if self.plan.workers: options.append(f"workers={self.plan.workers}")
+            args = ", ".join(inputs + [f"'{left_on}'", f"'{right_on}'"] + options)
+            code_line = f"{new_py_var} = flow_joins.join({args})"
+        else:
+            code_line = self.backend.join(new_py_var, left_df, right_df, left_on, right_on)
+        if node_plan:
+            # Streamed sides never exist as frames; their bytes are reported as read instead.
+            loaded = [py_var for flow_var, py_var in ((left_source, left_df), (right_source, right_df))
+                      if flow_var not in node_plan.streamed]
+            rows_in = f"({', '.join(loaded)},)" if loaded else None
+            return (self._profiled([code_line], f"join '{node_plan.target}'", node_plan.line, 'join', [node_plan.line],
+                                   rows_in, new_py_var, read=read), new_py_var)
         return ([code_line], new_py_var)
     def source_decl(self, s):
         flow_var, func_call, *schema_name_list = s
@@ -116,101 +259,560 @@ class FlowTranspiler(Transformer):
         self.variables[flow_var] = python_var
         if schema_name_list:
             schema_name = schema_name_list[0]
-            if schema_name in self.schemas: self.variable_schemas[flow_var] = schema_name
+            if schema_name in self.schemas:
+                self.variable_schemas[flow_var] = schema_name
+                self.variable_types[flow_var] = dict(self.schemas[schema_name])
             else: raise Exception(f"Error: Schema '{schema_name}' not defined.")
-        if func_call['name'] == 'File':
+        if func_call['name'] in ('File', 'Parquet'):
+            self.source_files[flow_var] = (func_call['name'], func_call['args']['path'][1:-1])
+        source_plan = self.plan.sources.get(flow_var) if self.plan else None
+        if source_plan and not source_plan.materialize:
+            return  # Every consumer streams this source straight from disk.
+        columns, filters = self._pushdown(flow_var)
+        line = source_plan.line if source_plan else None
+        # Sources load through the process-wide source cache, keyed on the reader call.
+        if not (source_plan and source_plan.incremental and func_call['name'] != 'Postgres'):
+            self.imports.add(f"sources as flow_sources from {__package__}")
+        if func_call['name'] in ('File', 'Parquet') and source_plan and source_plan.incremental:
+            self.imports.add(f"watermarks as flow_watermarks from {__package__}")
+            kind, pattern = func_call['name'], func_call['args']['path'][1:-1]
+            # The reader is a template over the file to read and the source file its rows came from.
+            reader = self._file_reader(kind, '{path}', source_plan, columns, filters, 'source').replace("'{path}'", "path")
+            if source_plan.delta:
+                code = [f"{python_var} = flow_increments.read_files('{flow_var}', '{source_plan.state_key}', '{kind}', "
+                        f"'{pattern}', {source_plan.appended_sinks}, lambda path, source: {reader})"]
+            else:
+                code = [f"{python_var} = flow_watermarks.read_all('{pattern}', lambda path, source: {reader})"]
+            self.code_blocks.append("\n".join(self._profiled(code, f"source '{flow_var}'", line, f"read {kind}",
+                                                             [line], rows_out=python_var)))
+        elif func_call['name'] in ('File', 'Parquet'):
             path = func_call['args']['path'][1:-1]
-            self.code_blocks.append(f"{python_var} = pd.read_csv('{path}')")
-        elif func_call['name'] == 'Parquet':
-            path = func_call['args']['path'][1:-1]
-            self.code_blocks.append(f"{python_var} = pd.read_parquet('{path}')")
+            reader = self._file_reader(func_call['name'], path, source_plan, columns, filters)
+            self.source_readers[flow_var] = (path, reader)
+            self._load(flow_var, python_var, [], f"flow_sources.read_file('{path}', {reader!r}, lambda: {reader})",
+                       line, f"read {func_call['name']}", read=[path])
         elif func_call['name'] == 'Postgres':
-            self.imports.add("create_engine from sqlalchemy")
-            args = func_call['args']
-            password = args['password']
-            if isinstance(password, tuple) and password[0] == 'env':
-                env_var_name = password[1]
+            self.imports.add("pandas as pd")  # Every backend reads tables through pandas.
+            self.imports.add(f"sql as flow_sql from {__package__}")
+            engine = self._sql_engine(func_call['args'])
+            if engine:
+                args = func_call['args']
                 user, host = args['user'][1:-1], args['host'][1:-1]
                 database, table = args['database'][1:-1], args['table'][1:-1]
-                code = f"""
-password = os.getenv('{env_var_name}')
-if password is None:
-    raise ValueError("Flow Execution Error: Environment variable '{env_var_name}' for the database password is not set.")
-conn_str = f'postgresql+psycopg2://{user}:{{password}}@{host}/{database}'
-engine = create_engine(conn_str)
-{python_var} = pd.read_sql_table('{table}', engine)
-"""
-                self.code_blocks.append(code.strip())
+                aggregate = source_plan.aggregate if source_plan else None
+                fields = self.schemas.get(self.variable_schemas.get(flow_var))
+                reader = self.backend.read_sql(table, 'engine', columns, filters, aggregate, fields)
+                read = f"flow_sources.read_table('postgresql://{user}@{host}/{database}/{table}', {reader!r}, lambda: {reader})"
+                if source_plan and source_plan.delta:
+                    self.imports.add(f"watermarks as flow_watermarks from {__package__}")
+                    read = (f"flow_increments.read_table('{flow_var}', '{source_plan.state_key}', engine, '{table}', "
+                            f"'{source_plan.incremental}', {columns}, {source_plan.appended_sinks})")
+                self._load(flow_var, python_var, [f"engine = {engine}"], read, line, "read Postgres")
+
+    @staticmethod
+    def _sql_engine(args):
+        """The call returning the pooled engine for Postgres arguments, or None without an env() password."""
+        password = args['password']
+        if not (isinstance(password, tuple) and password[0] == 'env'): return None
+        return f"flow_sql.postgres_engine('{args['user'][1:-1]}', '{args['host'][1:-1]}', '{args['database'][1:-1]}', '{password[1]}')"
+    def _file_reader(self, kind, path, source_plan, columns, filters, source=None):
+        if source_plan and source_plan.fields and self.backend.supports_typed_reads:
+            self.imports.add(f"ingest as flow_ingest from {__package__}")
+            return self.backend.read_typed(kind, path, source_plan.fields, columns, filters,
+                                           source_plan.downcast, source_plan.categorical, source)
+        if kind == 'Parquet': self.imports.add(f"datasets as flow_datasets from {__package__}")
+        return self.backend.read(kind, path, columns, filters)
+
     def sink_decl(self, s):
         name, func_call = s[0], s[1]
         self.sinks[name] = func_call
-    def pipeline(self, p):
-        start_flow_var, *steps = p
-        start_py_var = self.variables.get(start_flow_var)
-        if not start_py_var: raise Exception(f"Error: Variable '{start_flow_var}' not defined.")
-        code, current_py_var, is_grouped = [], start_py_var, False
-        self.group_by_cols = [] 
+    def _transformation_code(self, op_type, op_args, current_py_var, next_py_var):
+        """Code for one filter/select/sort/mutate step; these never depend on other rows' groups."""
+        if op_type == 'filter': return self.backend.filter(next_py_var, current_py_var, self._expression(op_args))
+        elif op_type == 'select': return self.backend.select(next_py_var, current_py_var, op_args)
+        elif op_type == 'sort': return self.backend.sort(next_py_var, current_py_var, op_args['by'], op_args['ascending'])
+        elif op_type == 'mutate':
+            assignments = {name: self._expression(expr) for name, expr in op_args.items()}
+            return self.backend.mutate(next_py_var, current_py_var, assignments)
+
+    def _expression(self, expr):
+        code = self.backend.expression(expr)
+        if "flow_kernels." in code: self.imports.add(f"kernels as flow_kernels from {__package__}")
+        return code
+
+    @staticmethod
+    def _bind_types(steps, types):
+        """
+        Binds the schema types of the pipeline's input to every expression in `steps`
+        and returns the column types of the pipeline's output (None where unknown).
+        """
+        types, group_by_cols = dict(types), []
+        for item in steps:
+            if not isinstance(item, tuple): continue
+            op_type, op_args = item
+            if op_type == 'filter': expressions.bind_types(op_args, types)
+            elif op_type == 'mutate':
+                # Every expression reads the mutate's input, so bind them all first.
+                created = {name: expressions.bind_types(expr, types) for name, expr in op_args.items()}
+                types.update(created)
+            elif op_type == 'select': types = {col: types.get(col) for col in op_args}
+            elif op_type == 'group_by': group_by_cols = op_args
+            elif op_type == 'aggregate':
+                result = {col: types.get(col) for col in group_by_cols}
+                for new_col, (col, func) in op_args.items():
+                    if func == 'count': result[new_col] = 'int'
+                    elif func == 'mean': result[new_col] = 'float'
+                    elif func == 'sum' and types.get(col) == 'bool': result[new_col] = 'int'
+                    else: result[new_col] = types.get(col)
+                types = result
+        return types
+
+    def _next_node_plan(self):
+        """Pipelines and joins are transformed in document order, the same order the planner lists them in."""
+        if not self.plan: return None
+        self.node_count += 1
+        return self.plan.nodes[self.node_count - 1]
+
+    def _fuse_steps(self, steps):
+        """
+        Merges runs of filters into one filter, and runs of mutates into one mutate
+        when the later one does not read a column the earlier one creates. Also
+        returns, for each fused step, the indices of the original steps it covers.
+        """
+        fused, origins = [], []
+        for i, item in enumerate(steps):
+            prev = fused[-1] if fused and isinstance(fused[-1], tuple) else None
+            if isinstance(item, tuple) and prev and prev[0] == item[0] == 'filter':
+                fused[-1] = ('filter', expressions.conjunction([prev[1], item[1]]))
+                origins[-1].append(i)
+            elif isinstance(item, tuple) and prev and prev[0] == item[0] == 'mutate' and not any(
+                    col in expr.columns() for col in prev[1] for expr in item[1].values()):
+                fused[-1] = ('mutate', {**prev[1], **item[1]})
+                origins[-1].append(i)
+            else:
+                fused.append(item)
+                origins.append([i])
+        return fused, origins
+
+    def _chunk_loop(self, iterable, steps, managers, profile=None):
+        """
+        Emits a `for` loop applying `steps` to each chunk; sinks become ChunkWriters in
+        `managers`. With `profile` (node, node_line, lines of each step), every step adds
+        its time and rows over all chunks to one record.
+        """
+        chunk_py_var = self._new_temp_var()
+        body, current_py_var = [], chunk_py_var
+        for index, item in enumerate(steps):
+            if isinstance(item, tuple):
+                next_py_var = self._new_temp_var()
+                code, step, rows_out = [self._transformation_code(*item, current_py_var, next_py_var)], item[0], next_py_var
+            else:
+                writer = f"{item}_writer"
+                managers.append((self._chunk_writer(item), writer))
+                code, step, next_py_var, rows_out = [f"{writer}.write({current_py_var})"], f"sink {item}", current_py_var, None
+            if profile:
+                code = self._profiled(code, profile[0], profile[1], step, profile[2][index], current_py_var, rows_out,
+                                      accumulate=True)
+            body += code
+            current_py_var = next_py_var
+        return [f"for {chunk_py_var} in {iterable}:"] + [f"    {line}" for line in body], current_py_var
+
+    @staticmethod
+    def _with_block(managers, body):
+        if not managers: return body
+        header = "with " + ", ".join(f"{expr} as {name}" for expr, name in managers) + ":"
+        return [header] + [f"    {line}" for line in body]
+
+    def _reader_call(self, start_flow_var):
+        source_plan = self.plan.sources[start_flow_var]
+        reader = f"flow_streaming.read_chunks('{source_plan.args['path']}', '{source_plan.kind}', {self.plan.chunk_size}"
+        if source_plan.columns is not None: reader += f", columns={source_plan.columns}"
+        if source_plan.filters: reader += f", filters={source_plan.filters}"
+        if source_plan.fields and source_plan.kind == 'File': reader += f", fields={source_plan.fields}"
+        return reader + ")"
+
+    @staticmethod
+    def _resolve_aggs(op_args, group_by_cols):
+        """Fills in the column for count(), which counts the first group_by column."""
+        col_for_count = group_by_cols[0] if group_by_cols else 'UNKNOWN_COLUMN'
+        return {new_col: (src_col if src_col is not None else col_for_count, func)
+                for new_col, (src_col, func) in op_args.items()}
+
+    def _streaming_pipeline(self, start_flow_var, steps, profile=None):
+        """
+        Compiles a File/Parquet -> ... -> sink pipeline into a loop over chunks. A sort
+        splits it in two: chunks are spilled to an ExternalSorter, and the steps after
+        the sort run over the merged output. `profile` is as in _chunk_loop().
+        """
+        self.imports.add(f"streaming as flow_streaming from {__package__}")
+        chunk_size = self.plan.chunk_size
+        reader = self._reader_call(start_flow_var)
+        comment = f"# Streaming '{start_flow_var}' in chunks of {chunk_size} rows"
+        group_at = next((i for i, item in enumerate(steps) if isinstance(item, tuple) and item[0] == 'group_by'), None)
+        if group_at is not None:
+            code, last_py_var = self._streaming_aggregate(reader, steps, group_at, profile)
+            return ([comment] + code, last_py_var)
+
+        sort_at = next((i for i, item in enumerate(steps) if isinstance(item, tuple) and item[0] == 'sort'), None)
+        managers = []
+        if sort_at is None:
+            loop, _ = self._chunk_loop(reader, steps, managers, profile)
+            code = self._with_block(managers, loop)
+        else:
+            sort_args = steps[sort_at][1]
+            self.temp_var_count += 1
+            sorter = f"temp_sorter_{self.temp_var_count}"
+            managers.append((f"flow_streaming.ExternalSorter(by={sort_args['by']}, ascending={sort_args['ascending']})", sorter))
+            loop, last_py_var = self._chunk_loop(reader, steps[:sort_at], managers, self._slice(profile, 0, sort_at))
+            add = [f"{sorter}.add({last_py_var})"]
+            if profile: add = self._profiled(add, profile[0], profile[1], 'sort', profile[2][sort_at], last_py_var,
+                                             accumulate=True)
+            loop += [f"    {line}" for line in add]
+            merge_managers = []
+            merge_loop, _ = self._chunk_loop(f"{sorter}.sorted_chunks({chunk_size})", steps[sort_at + 1:], merge_managers,
+                                             self._slice(profile, sort_at + 1, len(steps)))
+            code = self._with_block(managers, loop + self._with_block(merge_managers, merge_loop))
+        return ([comment] + code, None)
+
+    @staticmethod
+    def _slice(profile, start, stop):
+        """The profile of steps[start:stop]."""
+        return profile and (profile[0], profile[1], profile[2][start:stop])
+
+    def _streaming_aggregate(self, reader, steps, group_at, profile=None):
+        """
+        Folds every chunk into a PartialAggregator, then runs the steps after the
+        aggregate in memory on the aggregated frame.
+        """
+        self.imports.add(f"aggregation as flow_aggregation from {__package__}")
+        group_by_cols, aggs = steps[group_at][1], steps[group_at + 1][1]
+        self.temp_var_count += 1
+        aggregator = f"temp_aggregator_{self.temp_var_count}"
+        code = [f"{aggregator} = flow_aggregation.PartialAggregator(by={group_by_cols}, aggs={self._resolve_aggs(aggs, group_by_cols)})"]
+        loop, last_py_var = self._chunk_loop(reader, steps[:group_at], [], self._slice(profile, 0, group_at))
+        add = [f"{aggregator}.add({last_py_var})"]
+        if profile: add = self._profiled(add, profile[0], profile[1], 'partial aggregate',
+                                         profile[2][group_at] + profile[2][group_at + 1], last_py_var, accumulate=True)
+        result_py_var = self._new_temp_var()
+        code += loop + [f"    {line}" for line in add] + [f"{result_py_var} = {aggregator}.result()"]
+        suffix_code, last_py_var = self._eager_steps(steps[group_at + 2:], result_py_var,
+                                                     self._slice(profile, group_at + 2, len(steps)))
+        return code + suffix_code, last_py_var
+
+    def _delta_pipeline(self, start_flow_var, steps, node):
+        """
+        Compiles a pipeline over the new rows of an incremental source. Sinks before a
+        group_by append to what earlier runs wrote, and the aggregate merges the new rows
+        into the partial states the last run saved; the steps after it see every group.
+        """
+        source = node.delta
+        self.imports.add(f"watermarks as flow_watermarks from {__package__}")
+        group_at = next((i for i, item in enumerate(steps) if isinstance(item, tuple) and item[0] == 'group_by'), len(steps))
+        code, current_py_var = [], self.variables[start_flow_var]
+        for item in steps[:group_at]:
+            if isinstance(item, tuple):
+                next_py_var = self._new_temp_var()
+                code.append(self._transformation_code(*item, current_py_var, next_py_var))
+                current_py_var = next_py_var
+            else:
+                sink_info = self.sinks[item]
+                code.append(f"flow_increments.append('{source}', {current_py_var}, '{sink_info['name']}', "
+                            f"'{sink_info['args']['path'][1:-1]}')")
+        if group_at == len(steps): return code, current_py_var
+        self.imports.add(f"aggregation as flow_aggregation from {__package__}")
+        group_by_cols = steps[group_at][1]
+        aggs = self._resolve_aggs(steps[group_at + 1][1], group_by_cols)
+        self.temp_var_count += 1
+        aggregator = f"temp_aggregator_{self.temp_var_count}"
+        result_py_var = self._new_temp_var()
+        code += [f"{aggregator} = flow_increments.aggregator('{source}', '{node.definition[:16]}', by={group_by_cols}, aggs={aggs})",
+                 f"{aggregator}.add({current_py_var})",
+                 f"{result_py_var} = {aggregator}.result()"]
+        suffix_code, last_py_var = self._eager_steps(steps[group_at + 2:], result_py_var)
+        return code + suffix_code, last_py_var
+
+    def _partition_body(self, steps, input_py_var):
+        """Worker-side code for row-local steps; each sink becomes an output of the worker."""
+        body, outputs, current_py_var = [], [], input_py_var
         for item in steps:
-            next_py_var = self._new_temp_var()
+            if isinstance(item, tuple):
+                next_py_var = self._new_temp_var()
+                body.append(self._transformation_code(*item, current_py_var, next_py_var))
+                current_py_var = next_py_var
+            else:
+                outputs.append((item, current_py_var))
+        return body, outputs, current_py_var
+
+    def _parallel_pipeline(self, start_flow_var, steps):
+        """
+        Compiles an eligible pipeline to run on a process pool, one source partition per
+        task. Workers run the row-local prefix; a group_by/aggregate is reduced to partial
+        states in the workers and merged here, and a sort merges through an ExternalSorter.
+        """
+        self.imports.add(f"parallel as flow_parallel from {__package__}")
+        self.imports.add(f"streaming as flow_streaming from {__package__}")
+        source_plan, workers = self.plan.sources[start_flow_var], self.plan.workers
+        chunk_size = self.plan.chunk_size or DEFAULT_CHUNK_SIZE
+        ops = [item[0] if isinstance(item, tuple) else 'sink' for item in steps]
+        group_at = ops.index('group_by') if 'group_by' in ops else None
+        sort_at = ops.index('sort') if group_at is None and 'sort' in ops else None
+        split_at = group_at if group_at is not None else sort_at
+        prefix = steps if split_at is None else steps[:split_at]
+
+        input_py_var = self._new_temp_var()
+        body, outputs, last_py_var = self._partition_body(prefix, input_py_var)
+        if group_at is not None:
+            self.imports.add(f"aggregation as flow_aggregation from {__package__}")
+            group_by_cols = steps[group_at][1]
+            aggs = self._resolve_aggs(steps[group_at + 1][1], group_by_cols)
+            state_py_var = self._new_temp_var()
+            body.append(f"{state_py_var} = flow_aggregation.partial_aggregate({last_py_var}, {group_by_cols}, {aggs})")
+            last_py_var = state_py_var
+        output_vars = [py_var for _, py_var in outputs] + ([last_py_var] if split_at is not None else [])
+
+        self.temp_var_count += 1
+        results = f"temp_results_{self.temp_var_count}"
+        call = (f"flow_parallel.map_partitions('{source_plan.args['path']}', '{source_plan.kind}', "
+                f"{chr(10).join(body)!r}, '{input_py_var}', {output_vars}, workers={workers}")
+        if source_plan.columns is not None: call += f", columns={source_plan.columns}"
+        if source_plan.filters: call += f", filters={source_plan.filters}"
+        call += ")"
+
+        managers, loop_body = [], []
+        for i, (sink_name, _) in enumerate(outputs):
+            managers.append((self._chunk_writer(sink_name), f"{sink_name}_writer"))
+            loop_body.append(f"{sink_name}_writer.write({results}[{i}])")
+        comment = f"# Running '{start_flow_var}' on {workers} worker processes"
+        if group_at is not None:
+            self.temp_var_count += 1
+            aggregator = f"temp_aggregator_{self.temp_var_count}"
+            loop_body.append(f"{aggregator}.merge({results}[-1])")
+            result_py_var = self._new_temp_var()
+            code = [f"{aggregator} = flow_aggregation.PartialAggregator(by={group_by_cols}, aggs={aggs})"]
+            code += self._with_block(managers, [f"for {results} in {call}:"] + [f"    {line}" for line in loop_body])
+            code.append(f"{result_py_var} = {aggregator}.result()")
+            suffix_code, last_py_var = self._eager_steps(steps[group_at + 2:], result_py_var)
+            return ([comment] + code + suffix_code, last_py_var)
+        if sort_at is not None:
+            sort_args = steps[sort_at][1]
+            self.temp_var_count += 1
+            sorter = f"temp_sorter_{self.temp_var_count}"
+            managers.insert(0, (f"flow_streaming.ExternalSorter(by={sort_args['by']}, ascending={sort_args['ascending']})", sorter))
+            loop_body.append(f"{sorter}.add({results}[-1])")
+            merge_managers = []
+            merge_loop, _ = self._chunk_loop(f"{sorter}.sorted_chunks({chunk_size})", steps[sort_at + 1:], merge_managers)
+            loop = [f"for {results} in {call}:"] + [f"    {line}" for line in loop_body]
+            return ([comment] + self._with_block(managers, loop + self._with_block(merge_managers, merge_loop)), None)
+        loop = [f"for {results} in {call}:"] + [f"    {line}" for line in loop_body]
+        return ([comment] + self._with_block(managers, loop), None)
+
+    def _eager_steps(self, steps, current_py_var, profile=None):
+        """
+        Emits one in-memory statement per step, starting from `current_py_var`.
+        `profile` is (node, node_line, lines of each step) when steps are profiled.
+        """
+        code, is_grouped = [], False
+        self.group_by_cols = [] 
+        for index, item in enumerate(steps):
+            step_start, input_py_var = len(code), current_py_var
             if isinstance(item, tuple):
                 op_type, op_args = item
-                if op_type == 'filter': code.append(f"{next_py_var} = {current_py_var}[{op_args.replace('{df}', current_py_var)}]")
-                elif op_type == 'select': code.append(f"{next_py_var} = {current_py_var}[{op_args}]")
-                elif op_type == 'sort': code.append(f"{next_py_var} = {current_py_var}.sort_values(by={op_args['by']}, ascending={op_args['ascending']})")
-                elif op_type == 'mutate':
-                    assign_args = ", ".join([f"{k}={v.replace('{df}', current_py_var)}" for k,v in op_args.items()])
-                    code.append(f"{next_py_var} = {current_py_var}.assign({assign_args})")
+                key = (current_py_var, op_type, repr(op_args))
+                if key in self.step_cache:
+                    current_py_var = self.step_cache[key]
+                    if op_type == 'group_by': self.group_by_cols, is_grouped = op_args, True
+                    elif op_type == 'aggregate': is_grouped = False
+                    continue
+                next_py_var = self.step_cache[key] = self._new_temp_var()
+                if op_type in ('filter', 'select', 'sort', 'mutate'):
+                    code.append(self._transformation_code(op_type, op_args, current_py_var, next_py_var))
                 elif op_type == 'group_by':
                     self.group_by_cols = op_args
-                    code.append(f"{next_py_var} = {current_py_var}.groupby({op_args})")
+                    code.append(self.backend.group_by(next_py_var, current_py_var, op_args))
                     is_grouped = True
                 elif op_type == 'aggregate':
                     if not is_grouped: raise Exception("Error: 'aggregate' must be preceded by a 'group_by'.")
-                    agg_args_list = []
-                    for new_col, (src_col, func) in op_args.items():
-                        col_for_count = self.group_by_cols[0] if self.group_by_cols else 'UNKNOWN_COLUMN'
-                        agg_col = src_col if src_col is not None else col_for_count
-                        agg_args_list.append(f"{new_col}=pd.NamedAgg(column='{agg_col}', aggfunc='{func}')")
-                    agg_args = ", ".join(agg_args_list)
-                    code.append(f"{next_py_var} = {current_py_var}.agg({agg_args}).reset_index()")
+                    aggs = self._resolve_aggs(op_args, self.group_by_cols)
+                    code.append(self.backend.aggregate(next_py_var, current_py_var, aggs))
                     is_grouped = False
                 current_py_var = next_py_var
             elif isinstance(item, str):
                 sink_name = item
                 sink_info = self.sinks.get(sink_name)
-                if sink_info and sink_info['name'] == 'File':
-                    path = sink_info['args']['path'][1:-1]
-                    code.append(f"{current_py_var}.to_csv('{path}', index=False)")
-                elif sink_info and sink_info['name'] == 'Parquet':
-                    path = sink_info['args']['path'][1:-1]
-                    code.append(f"{current_py_var}.to_parquet('{path}', index=False)")
-        return (code, current_py_var)
+                if sink_info and sink_info['name'] in ('File', 'Parquet'):
+                    written = [sink_info['args']['path'][1:-1]]
+                    code.append(self._write(current_py_var, sink_info['name'], written[0], self._sink_options(sink_name)))
+                elif sink_info and sink_info['name'] == 'Postgres':
+                    written = []
+                    code.append(self._sql_write(current_py_var, sink_name, sink_info['args']))
+                else:
+                    continue
+                if profile:
+                    node, node_line, step_lines = profile
+                    code[step_start:] = self._profiled(code[step_start:], node, node_line, f"sink {sink_name}",
+                                                       step_lines[index], rows_in=current_py_var, written=written)
+                continue
+            if profile:
+                node, node_line, step_lines = profile
+                code[step_start:] = self._profiled(code[step_start:], node, node_line, item[0], step_lines[index],
+                                                   input_py_var, current_py_var)
+        return code, current_py_var
+
+    def _sql_write(self, py_var, sink_name, args):
+        """A Postgres sink: `mode: "replace"` (the default) recreates the table, `"append"` adds to it."""
+        engine = self._sql_engine(args)
+        if engine is None: raise Exception(f"Error: Postgres sink '{sink_name}' must take its password from env(...).")
+        mode = args.get('mode', '"replace"')[1:-1]
+        if mode not in ('replace', 'append'):
+            raise Exception(f"Error: 'mode' of Postgres sink '{sink_name}' must be \"replace\" or \"append\".")
+        self.imports.add(f"sql as flow_sql from {__package__}")
+        return self.backend.write_sql(self._sink_frame(py_var), engine, args['table'][1:-1], mode)
+
+    def pipeline(self, p):
+        start_flow_var, *steps = p
+        pipeline_plan = self.result_node = self._next_node_plan()
+        self.result_types = self._bind_types(steps, self.variable_types.get(start_flow_var, {}))
+        if pipeline_plan and not pipeline_plan.live: return ([], None)
+        pushed = pipeline_plan.pushed_steps if pipeline_plan else 0  # Already run by the source's query.
+        steps, origins = self._fuse_steps(steps[pushed:])
+        profile = None
+        if pipeline_plan:
+            node = f"pipeline '{pipeline_plan.target}'" if pipeline_plan.target else f"pipeline from '{start_flow_var}'"
+            profile = (node, pipeline_plan.line, [[pipeline_plan.step_lines[pushed + i] for i in origin] for origin in origins])
+        if pipeline_plan and pipeline_plan.streaming:
+            if self.plan.workers:
+                # Workers run the steps in other processes, so only the whole pipeline is timed.
+                code, last_py_var = self._parallel_pipeline(start_flow_var, steps)
+                step = f"whole pipeline, partitioned on {self.plan.workers} workers"
+            else:
+                # Each step adds up its chunks; this record keeps the rest (reading, merging, writing out).
+                code, last_py_var = self._streaming_pipeline(start_flow_var, steps, profile if self.profile else None)
+                step = "streamed: reading and merging chunks"
+            sink_paths = [self.sinks[item]['args']['path'][1:-1] for item in steps if isinstance(item, str)]
+            source_path = self.plan.sources[start_flow_var].args['path']
+            code = self._profiled(code, profile[0], profile[1], step, pipeline_plan.step_lines,
+                                  rows_out=last_py_var, read=[source_path], written=sink_paths)
+            return code, last_py_var
+        start_py_var = self.variables.get(start_flow_var)
+        if not start_py_var: raise Exception(f"Error: Variable '{start_flow_var}' not defined.")
+        if pipeline_plan and pipeline_plan.delta:
+            code, last_py_var = self._delta_pipeline(start_flow_var, steps, pipeline_plan)
+            sink_paths = [self.sinks[item]['args']['path'][1:-1] for item in steps if isinstance(item, str)]
+            code = self._profiled(code, profile[0], profile[1], f"new rows of '{pipeline_plan.delta}'",
+                                  pipeline_plan.step_lines, rows_out=last_py_var, written=sink_paths)
+            return code, last_py_var
+        return self._eager_steps(steps, start_py_var, profile if self.profile else None)
 
     def assignment(self, a):
         flow_var, expression_result = a
         pipeline_code, last_py_var = expression_result
         new_py_var = f"{flow_var}_df"
         self.variables[flow_var] = new_py_var
-        if pipeline_code:
+        # A reassigned variable invalidates the steps cached against its old value.
+        self.step_cache = {key: var for key, var in self.step_cache.items() if key[0] != new_py_var}
+        self.source_readers.pop(flow_var, None)  # It no longer holds the file as read.
+        self.variable_types[flow_var] = self.result_types
+        if last_py_var is None: return  # A dead pipeline.
+        if self.materialize and self._materializable(self.result_node):
+            pipeline_code = self._materialized(flow_var, pipeline_code, last_py_var, self.result_node)
+        else:
             pipeline_code.append(f"{new_py_var} = {last_py_var}")
         comment = f"# Pipeline for '{flow_var}'"
         self.code_blocks.append(f"\n{comment}\n" + "\n".join(pipeline_code))
         
+    @staticmethod
+    def _materializable(node):
+        """
+        Variables computed from files by a join or by steps that write nothing; aliases
+        and pipelines that only read their input are not worth a copy.
+        """
+        if node is None or node.definition is None or node.source_files is None: return False
+        if getattr(node, 'delta', None): return False  # Holds only this run's new rows.
+        return isinstance(node, JoinPlan) or (not node.sinks() and bool(node.steps))
+
+    def _materialized(self, flow_var, pipeline_code, last_py_var, node):
+        """
+        Wraps a variable's pipeline in a function that flow_materialize calls only when the
+        work directory has no current copy of the variable. The frames the pipeline reads
+        are passed in, so the script releases them at the same point as before.
+        """
+        self.imports.add(f"materialize as flow_materialize from {__package__}")
+        # The backend decides whether the variable is a frame or a table.
+        definition = hashlib.sha256(f"{type(self.backend).__name__}:{node.definition}".encode()).hexdigest()
+        body = self._release_intermediates("\n".join(pipeline_code), keep={last_py_var})
+        stored, loaded = set(), set()
+        for name in ast.walk(ast.parse(body)):
+            if isinstance(name, ast.Name) and FRAME_VAR.match(name.id):
+                (loaded if isinstance(name.ctx, ast.Load) else stored).add(name.id)
+        inputs = sorted(loaded - stored)
+        # Steps computed inside the function cannot be shared with later pipelines.
+        self.step_cache = {key: var for key, var in self.step_cache.items() if var not in stored}
+        function = f"flow_compute_{flow_var}"
+        call = ", ".join([f"'{flow_var}'", f"'{definition}'", repr(node.source_files), function] + inputs)
+        return ([f"def {function}({', '.join(inputs)}):"] + [f"    {line}" for line in body.split("\n")]
+                + [f"    return {last_py_var}", f"{flow_var}_df = flow_materialize.materialized({call})"])
+
     def execution(self, e):
         pipeline_result, = e
         pipeline_code, _ = pipeline_result
+        if not pipeline_code: return
         comment = f"# Standalone pipeline execution"
         self.code_blocks.append(f"\n{comment}\n" + "\n".join(pipeline_code))
 
+    @staticmethod
+    def _release_intermediates(body, keep=()):
+        """
+        Adds a `del` after the last statement that reads each frame variable (except the
+        ones in `keep`), so peak memory follows the frames still in use rather than every
+        frame the script built.
+        """
+        stores, last_use = {}, {}
+        for stmt in ast.parse(body).body:
+            if isinstance(stmt, ast.Assign):
+                for target in stmt.targets:
+                    if isinstance(target, ast.Name): stores.setdefault(target.id, []).append(stmt)
+            for node in ast.walk(stmt):
+                if isinstance(node, ast.Name) and isinstance(node.ctx, ast.Load): last_use[node.id] = stmt
+        releases = {}
+        for name, stored_at in stores.items():
+            # Variables assigned more than once are left alone rather than tracked per definition.
+            if len(stored_at) != 1 or not FRAME_VAR.match(name) or name in keep: continue
+            stmt = max(last_use.get(name, stored_at[0]), stored_at[0], key=lambda st: st.end_lineno)
+            releases.setdefault(stmt.end_lineno, []).append(name)
+        lines = []
+        for lineno, line in enumerate(body.split("\n"), 1):
+            lines.append(line)
+            if lineno in releases: lines.append(f"del {', '.join(releases[lineno])}")
+        return "\n".join(lines)
+
+    def _schedule_io(self, blocks):
+        """
+        Waits for each started load right before the first block that uses its variable,
+        so later sources keep loading while earlier pipelines run, and waits for the
+        background writes at the end.
+        """
+        for py_var in self.scheduled_loads:
+            started = next(i for i, block in enumerate(blocks) if f"flow_tasks.load('{py_var}'," in block)
+            for i in range(started + 1, len(blocks)):
+                if any(isinstance(node, ast.Name) and node.id == py_var for node in ast.walk(ast.parse(blocks[i]))):
+                    blocks.insert(i, f"{py_var} = flow_tasks.result('{py_var}')")
+                    break
+        return ["flow_tasks = flow_scheduler.Scheduler()"] + blocks + ["flow_tasks.wait()"]
+
     # UPDATED: This is the corrected 'start' method
     def start(self, s):
         # The child nodes in 's' have already been transformed, and their methods
         # (like assert_statement) have populated self.code_blocks.
         # This method's only job is to assemble the final script.
-        import_statements = sorted(list(self.imports), key=lambda x: " from " in x)
+        import_statements = sorted(self.imports, key=lambda x: (" from " in x, x))
         header = "\n".join(f"import {imp}" if " from " not in imp else f"from {imp.split(' from ')[1]} import {imp.split(' from ')[0]}" for imp in import_statements)
         
         final_blocks = [b.strip() for b in self.code_blocks if b]
-        body = "\n\n".join(final_blocks)
+        if f"scheduler as flow_scheduler from {__package__}" in self.imports:
+            final_blocks = self._schedule_io(final_blocks)
+        if f"watermarks as flow_watermarks from {__package__}" in self.imports:
+            # Watermarks only move once every pipeline has seen the new rows.
+            final_blocks = ["flow_increments = flow_watermarks.Run()"] + final_blocks + ["flow_increments.commit()"]
+        body = self._release_intermediates("\n\n".join(final_blocks))
 
         return header + "\n\n" + body
\ No newline at end of file
@@ -46,8 +46,9 @@ class Validator(Visitor):
         }
 
         # 3. Directly validate the join condition
-        left_col_ref = join_condition_node.children[0]
-        right_col_ref = join_condition_node.children[1]
+        left_col_ref, operator, right_col_ref = join_condition_node.children
+        if operator.value != "==":
+            raise ValueError(f"Validation Error: Join condition must use '==', found '{operator.value}'.")
 
         for col_ref in [left_col_ref, right_col_ref]:
             table_prefix = col_ref.children[0].value
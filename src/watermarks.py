@@ -0,0 +1,286 @@
+# src/watermarks.py
+#
+# Runtime helpers for incremental sources in compiled pandas scripts:
+# `incremental: true` on a File or Parquet source (whose path may be a glob
+# pattern), or `incremental: "key"` on a Postgres source. Such a source is assumed
+# to only grow: CSV files by appended lines, patterns by new files, tables by rows
+# with a larger key. A run reads what was added since the last successful run; the
+# sinks of its pipelines get the new rows appended, and their aggregates merge the
+# new rows into the partial states saved by earlier runs (see aggregation.py).
+#
+# A compiled script keeps what it reads in a Run, which saves the high watermarks
+# (byte offset of every file read, largest key read) and the aggregate states with
+# commit() at the end of the script. A run that fails is dropped with its Run and
+# never commits, so its rows are read again next time. Whatever breaks the
+# assumption, such as a file that shrank or changed before its watermark or an
+# appended sink that changed since it was written, makes the source start over
+# and be read in full.
+
+import hashlib
+import json
+import os
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from . import sql
+from .aggregation import PartialAggregator
+from .cache import get_cache_dir
+from .planner import source_paths
+
+STATE_SUBDIR = "watermarks"
+STATE_FILE = "state.json"
+# The bytes before a file's watermark that are hashed to notice it being rewritten.
+TAIL_BYTES = 4096
+
+
+def _stamp(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+def _tail(path, offset):
+    with open(path, 'rb') as f:
+        f.seek(max(0, offset - TAIL_BYTES))
+        return hashlib.sha256(f.read(offset - f.tell())).hexdigest()
+
+
+def _write_atomically(path, write):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    write(tmp_path)
+    os.replace(tmp_path, path)
+
+
+class SourceState:
+    """
+    What earlier runs read of one incremental source, and the aggregate states of the
+    pipelines reading it. The state directory is named after the source, its readers
+    (see QueryPlanner._plan_increments) and the working directory, so editing any of
+    them starts from scratch.
+    """
+    def __init__(self, name, key, appended_sinks):
+        self.name = name
+        self.dir = os.path.join(get_cache_dir(), STATE_SUBDIR,
+                                hashlib.sha256(f"{os.getcwd()}:{key}".encode()).hexdigest()[:32])
+        self.appended_sinks = [os.path.abspath(path) for path in appended_sinks]
+        self.aggregators = {}  # State id -> PartialAggregator
+        self.full = True       # Read in full: sinks are overwritten and aggregates start empty.
+        self.files, self.watermark, self.sinks, self.aggregates = {}, None, {}, []
+        # Aggregates are saved under a new generation each run, so a run that fails while
+        # saving leaves the last complete state in place.
+        self.generation = 0
+        try:
+            with open(os.path.join(self.dir, STATE_FILE)) as f:
+                state = json.load(f)
+            files, watermark, sinks = state['files'], state['watermark'], state['sinks']
+            aggregates, generation = state['aggregates'], state['generation']
+        except (OSError, ValueError, KeyError):
+            return  # First run, or unreadable: read everything.
+        self.full = False
+        self.files, self.watermark, self.sinks = files, watermark, sinks
+        self.aggregates, self.generation = aggregates, generation
+        changed = [path for path, stamp in self.sinks.items() if _stamp(path) != stamp]
+        missing = [key for key in self.aggregates if not os.path.exists(self._aggregate_path(key))]
+        if changed: self.reset(f"'{changed[0]}' changed after the last run appended to it")
+        elif missing: self.reset("its saved aggregates are missing")
+
+    def reset(self, reason):
+        print(f"ℹ️  Reading incremental source '{self.name}' in full: {reason}.")
+        self.full = True
+        self.files, self.watermark, self.aggregates = {}, None, []
+
+    def _aggregate_path(self, key, generation=None):
+        generation = self.generation if generation is None else generation
+        return os.path.join(self.dir, f"aggregate-{key}-{generation}.parquet")
+
+    def load_states(self, key):
+        """The aggregate states the last run saved under `key`, or None."""
+        if key not in self.aggregates: return None
+        return pq.read_table(self._aggregate_path(key)).to_pandas()
+
+    def save(self):
+        os.makedirs(self.dir, exist_ok=True)
+        generation, aggregates = self.generation + 1, []
+        for key, aggregator in self.aggregators.items():
+            if aggregator.states is None: continue
+            table = pa.Table.from_pandas(aggregator.states, preserve_index=False)
+            pq.write_table(table, self._aggregate_path(key, generation))
+            aggregates.append(key)
+        self.sinks = {path: _stamp(path) for path in self.appended_sinks}
+        state = {'files': self.files, 'watermark': self.watermark, 'sinks': self.sinks,
+                 'aggregates': aggregates, 'generation': generation}
+        def write(path):
+            with open(path, 'w') as f: json.dump(state, f)
+        _write_atomically(os.path.join(self.dir, STATE_FILE), write)
+        for name in os.listdir(self.dir):
+            if name.startswith("aggregate-") and not name.endswith(f"-{generation}.parquet"):
+                os.remove(os.path.join(self.dir, name))
+
+
+def _unchanged(path, seen, appendable):
+    """True if the first seen['offset'] bytes of `path` are still the ones read before."""
+    size = os.path.getsize(path)
+    if size < seen['offset'] or (size != seen['offset'] and not appendable): return False
+    return _tail(path, seen['offset']) == seen['tail']
+
+
+def _csv_delta(state, path, seen, reader):
+    """
+    Reads the complete lines of a CSV after its watermark, or all of it on first sight.
+    The lines are copied, under the file's header, to a scratch file in the state
+    directory for `reader`; a last line still being written is left for the next run.
+    """
+    with open(path, 'rb') as f:
+        header = f.readline()
+        start = max(seen['offset'] if seen else 0, len(header))
+        f.seek(start)
+        data = f.read()
+    end = start + data.rfind(b'\n') + 1 if b'\n' in data else start
+    if seen is None and end == start + len(data):
+        frame = reader(path, path)  # A whole file needs no copy.
+    else:
+        os.makedirs(state.dir, exist_ok=True)
+        scratch = os.path.join(state.dir, f"{state.name}.new.csv")
+        with open(scratch, 'wb') as f:
+            f.write(header if header.endswith(b'\n') else header + b'\n')
+            f.write(data[:end - start])
+        del data
+        frame = reader(scratch, path)
+    state.files[os.path.abspath(path)] = {'offset': end, 'tail': _tail(path, end)}
+    return frame
+
+
+def _empty(state, kind, path, reader):
+    """An empty frame with the columns and types `reader` gives `path`."""
+    os.makedirs(state.dir, exist_ok=True)
+    if kind == 'Parquet':
+        scratch = os.path.join(state.dir, f"{state.name}.new.parquet")
+        pq.write_table(pq.read_schema(path).empty_table(), scratch)
+    else:
+        scratch = os.path.join(state.dir, f"{state.name}.new.csv")
+        with open(path, 'rb') as f: header = f.readline()
+        with open(scratch, 'wb') as f: f.write(header)
+    return reader(scratch, path)
+
+
+def _paths(pattern):
+    paths = source_paths(pattern)
+    if not paths: raise FileNotFoundError(f"Flow Execution Error: No files match '{pattern}'.")
+    return paths
+
+
+def read_all(pattern, reader):
+    """Reads every file matching `pattern`, for an incremental source that is read in full."""
+    frames = [reader(path, path) for path in _paths(pattern)]
+    return pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+
+
+def _json_value(value):
+    if isinstance(value, pd.Timestamp): return value.isoformat()
+    return value.item() if hasattr(value, 'item') else value
+
+
+def _decode_dictionaries(table):
+    for i, field in enumerate(table.schema):
+        if pa.types.is_dictionary(field.type):
+            table = table.set_column(i, field.name, table.column(i).cast(field.type.value_type))
+    return table
+
+
+class Run:
+    """
+    The incremental sources one run of a script read. The script creates it first and
+    commits it last, so a failed run saves nothing and a later run never saves state
+    read by another one.
+    """
+    def __init__(self):
+        self.sources = {}  # Source name -> SourceState
+
+    def read_files(self, name, key, kind, pattern, appended_sinks, reader):
+        """
+        Returns the rows a File or Parquet source gained since the last run: new files
+        matching `pattern` in full, and the lines appended to CSV files already read.
+        `reader(path, source)` reads one file the way the source is declared; `path` is a
+        scratch copy of the new lines of `source` when only some of them are new.
+        """
+        state = self.sources[name] = SourceState(name, key, appended_sinks)
+        paths = _paths(pattern)
+        if os.path.isdir(paths[0]):
+            raise ValueError(f"Flow Execution Error: Incremental source '{name}' reads the dataset directory "
+                             f"'{pattern}'; only files, or patterns matching files, can be read incrementally.")
+        # A file that was read and then removed is forgotten; its rows stay in the outputs.
+        state.files = {path: seen for path, seen in state.files.items() if os.path.exists(path)}
+        for path, seen in state.files.items():
+            if not _unchanged(path, seen, kind == 'File'):
+                state.reset(f"'{path}' changed before the part already read")
+                break
+        frames = []
+        for path in paths:
+            seen = state.files.get(os.path.abspath(path))
+            if kind == 'File':
+                frames.append(_csv_delta(state, path, seen, reader))
+            elif seen is None:  # Parquet files are only ever added, never appended to.
+                frames.append(reader(path, path))
+                size = os.path.getsize(path)
+                state.files[os.path.abspath(path)] = {'offset': size, 'tail': _tail(path, size)}
+        frames = [frame for frame in frames if len(frame)] or frames[:1] or [_empty(state, kind, paths[0], reader)]
+        frame = pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+        if not state.full: print(f"ℹ️  Incremental source '{name}': {len(frame):,} new row(s) since the last run.")
+        return frame
+
+    def read_table(self, name, key, engine, table, key_column, columns, appended_sinks):
+        """Returns the rows of a table whose `key_column` is above the largest value read before."""
+        state = self.sources[name] = SourceState(name, key, appended_sinks)
+        filters = [(key_column, '>', state.watermark)] if state.watermark is not None else []
+        frame = sql.read_table(engine, table, columns, filters)
+        if len(frame): state.watermark = _json_value(frame[key_column].max())
+        if not state.full: print(f"ℹ️  Incremental source '{name}': {len(frame):,} new row(s) since the last run.")
+        return frame
+
+    def append(self, name, df, kind, path):
+        """
+        Writes the new rows of source `name` to a sink, after the rows earlier runs wrote.
+        A Parquet file cannot be appended to, so it is rewritten with the new rows added.
+        """
+        appending = not self.sources[name].full and os.path.exists(path)
+        if kind == 'File':
+            df.to_csv(path, index=False, mode='a' if appending else 'w', header=not appending)
+            return
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        if appending:
+            tables = [pq.read_table(path), table]
+            if tables[0].schema != table.schema:
+                # Compact reads can give a column of the new rows a narrower or categorical type.
+                tables = [_decode_dictionaries(t) for t in tables]
+            table = pa.concat_tables(tables, promote_options='permissive')
+        _write_atomically(path, lambda tmp_path: pq.write_table(table, tmp_path))
+
+    def aggregator(self, name, key, by, aggs):
+        """A PartialAggregator starting from the states saved for it by the last run of source `name`."""
+        state = self.sources[name]
+        result = state.aggregators[key] = PartialAggregator(by, aggs)
+        result.states = state.load_states(key)
+        return result
+
+    def commit(self):
+        """Saves the watermarks and aggregate states of the sources this run read, once the whole script succeeded."""
+        for state in self.sources.values():
+            try:
+                state.save()
+            except OSError:
+                pass  # An unwritable cache only costs a full read next time.
+        self.sources.clear()
+
+
+def clear():
+    """Deletes the saved state of every incremental source and returns how many were removed."""
+    import shutil
+    state_dir = os.path.join(get_cache_dir(), STATE_SUBDIR)
+    if not os.path.isdir(state_dir): return 0
+    removed = 0
+    for name in os.listdir(state_dir):
+        shutil.rmtree(os.path.join(state_dir, name), ignore_errors=True)
+        removed += 1
+    return removed
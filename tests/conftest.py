@@ -0,0 +1,63 @@
+# tests/conftest.py
+#
+# Every test runs in its own temporary directory with its own Flow cache, so
+# compiled scripts, run state and spilled files never leak between tests.
+
+import glob
+import os
+import re
+import pandas as pd
+import pytest
+from src import sources
+from src.compiler import compile_flow
+
+EXAMPLES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "examples")
+SINK_PATTERN = re.compile(r'sink\s+\w+\s*->\s*(File|Parquet)\(path:\s*"([^"]+)"')
+
+
+def runnable_examples():
+    """The bundled examples that write files and need no database."""
+    names = []
+    for path in sorted(glob.glob(os.path.join(EXAMPLES_DIR, "*.flow"))):
+        with open(path) as f: code = f.read()
+        if 'Postgres(' not in code and SINK_PATTERN.search(code): names.append(os.path.basename(path))
+    return names
+
+
+def sink_outputs(flow_code, **options):
+    """Runs a script and returns {sink path: its output}, removing the outputs afterwards."""
+    exec(compile_flow(flow_code, use_cache=False, **options).code, {'__name__': '__flow__'})
+    outputs = {}
+    for kind, path in SINK_PATTERN.findall(flow_code):
+        if kind == 'Parquet':
+            outputs[path] = pd.read_parquet(path)
+        else:
+            with open(path, 'rb') as f: outputs[path] = f.read()
+        os.remove(path)
+    return outputs
+
+
+def assert_same_outputs(expected, actual):
+    """CSVs must match byte for byte, Parquet files as the frames pandas reads back."""
+    assert expected.keys() == actual.keys()
+    for path, output in expected.items():
+        if isinstance(output, pd.DataFrame): pd.testing.assert_frame_equal(actual[path], output)
+        else: assert actual[path] == output, path
+
+
+@pytest.fixture(autouse=True)
+def workdir(tmp_path, monkeypatch):
+    monkeypatch.setenv("FLOW_CACHE_DIR", str(tmp_path / "cache"))
+    monkeypatch.chdir(tmp_path)
+    sources.configure(0)
+    return tmp_path
+
+
+@pytest.fixture
+def run_flow():
+    """Compiles a script without the compile cache and runs it in a fresh namespace."""
+    def run(flow_code, **options):
+        compiled = compile_flow(flow_code, use_cache=False, **options)
+        exec(compiled.code, {'__name__': '__flow__'})
+        return compiled
+    return run
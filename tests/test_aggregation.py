@@ -0,0 +1,52 @@
+# tests/test_aggregation.py
+#
+# Partial aggregates folded chunk by chunk, and merged across partitions, must
+# give exactly the frame one eager groupby gives.
+
+import numpy as np
+import pandas as pd
+import pytest
+from src.aggregation import PartialAggregator
+
+AGGS = {'n': ('age', 'count'), 'mean_age': ('age', 'mean'), 'total': ('age', 'sum'), 'youngest': ('age', 'min'),
+        'oldest': ('age', 'max'), 'mean_score': ('score', 'mean'), 'top_score': ('score', 'max')}
+
+
+@pytest.fixture(scope='module')
+def users():
+    rng = np.random.default_rng(1)
+    size = 60
+    score = rng.normal(50, 20, size)
+    score[rng.random(size) < 0.1] = np.nan
+    return pd.DataFrame({'status': rng.choice(['active', 'inactive', 'banned'], size),
+                         'city': rng.choice(['Oslo', 'Lima', 'Pune', 'Kyiv'], size),
+                         'age': rng.integers(18, 80, size), 'score': score})
+
+
+def _eager(df, by):
+    named = {new_col: pd.NamedAgg(column=col, aggfunc=func) for new_col, (col, func) in AGGS.items()}
+    return df.groupby(by).agg(**named).reset_index()
+
+
+def _partial(df, by, chunk_size, partitions):
+    merged = PartialAggregator(by, AGGS)
+    for partition in np.array_split(np.arange(len(df)), partitions):
+        aggregator = PartialAggregator(by, AGGS)
+        part = df.iloc[partition]
+        for start in range(0, len(part), chunk_size):
+            aggregator.add(part.iloc[start:start + chunk_size])
+        merged.merge(aggregator.states)
+    return merged.result()
+
+
+@pytest.mark.parametrize("partitions", [1, 3])
+@pytest.mark.parametrize("chunk_size", [2, 9, 1000])
+@pytest.mark.parametrize("by", [['status'], ['status', 'city']])
+def test_partial_aggregates_match_eager(users, by, chunk_size, partitions):
+    pd.testing.assert_frame_equal(_partial(users, by, chunk_size, partitions), _eager(users, by))
+
+
+def test_groups_first_seen_in_a_later_chunk(users):
+    late = pd.concat([users, pd.DataFrame({'status': ['new'], 'city': ['Oslo'], 'age': [30], 'score': [np.nan]})],
+                     ignore_index=True)
+    pd.testing.assert_frame_equal(_partial(late, ['status'], 10, 2), _eager(late, ['status']))
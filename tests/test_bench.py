@@ -0,0 +1,84 @@
+# tests/test_bench.py
+#
+# `flow bench`: reproducible synthetic datasets with the columns of the examples,
+# scenarios that run on them, and regressions flagged against a baseline.
+
+import filecmp
+import os
+import pandas as pd
+import pyarrow.parquet as pq
+import pytest
+from src import bench
+from src.compiler import compile_flow
+from conftest import EXAMPLES_DIR
+
+ROWS = 50
+DATA_FILES = ['cities.csv', 'users.csv', 'users.parquet', 'users_names.csv']
+
+
+def test_datasets_are_reproducible_and_match_the_examples(monkeypatch):
+    monkeypatch.setattr(bench, 'GENERATE_CHUNK_ROWS', 20)  # Several chunks, each with its own seed.
+    bench.generate("a", ROWS)
+    bench.generate("b", ROWS)
+    bench.generate("c", ROWS, seed=1)
+    assert sorted(os.listdir("a")) == DATA_FILES
+    assert not filecmp.cmpfiles("a", "b", DATA_FILES, shallow=False)[1]
+    assert not filecmp.cmp("a/users_names.csv", "c/users_names.csv", shallow=False)
+    for name in ['cities.csv', 'users.csv', 'users_names.csv']:
+        expected = pd.read_csv(os.path.join(EXAMPLES_DIR, name)).columns
+        assert list(pd.read_csv(os.path.join("a", name)).columns) == list(expected)
+    users = pd.read_csv("a/users.csv")
+    assert users['id'].tolist() == list(range(1, ROWS + 1))
+    assert users['city_id'].isin(pd.read_csv("a/cities.csv")['city_id']).all()
+
+
+def test_ensure_data_generates_a_dataset_once():
+    directory = bench.ensure_data("data", ROWS)
+    stamp = os.stat(os.path.join(directory, 'users.csv')).st_mtime_ns
+    assert bench.ensure_data("data", ROWS) == directory
+    assert os.stat(os.path.join(directory, 'users.csv')).st_mtime_ns == stamp
+    assert os.listdir("data") == [os.path.basename(directory)]
+
+
+@pytest.mark.parametrize("scenario", list(bench.SCENARIOS))
+def test_every_scenario_runs_on_a_generated_dataset(scenario):
+    data = bench.ensure_data("data", ROWS)
+    os.makedirs("out")
+    compiled = compile_flow(bench.scenario_script(scenario, data, "out"), use_cache=False)
+    exec(compiled.code, {'__name__': '__flow__'})
+    assert pq.read_metadata("out/out.parquet").num_rows > 0
+
+
+def test_the_compile_script_is_valid():
+    compile_flow(bench.compile_script(), use_cache=False)
+
+
+def test_run_suite_records_time_throughput_and_memory():
+    results = bench.run_suite([ROWS], scenarios=['select'], repeat=2, data_dir="data", report=lambda line: None)
+    result, = results['results']
+    assert result['scenario'] == 'select' and result['rows'] == ROWS and len(result['times']) == 2
+    assert result['wall_time'] == min(result['times']) and result['throughput'] == ROWS / result['wall_time']
+    assert result['peak_rss'] > 0
+    bench.save(results, "results.json")
+    assert bench.load("results.json") == results
+
+
+def run(wall_time, peak_rss, scenario='sort'):
+    return {'results': [{'scenario': scenario, 'rows': ROWS, 'wall_time': wall_time, 'peak_rss': peak_rss}]}
+
+
+def test_compare_flags_regressions_above_the_threshold_and_noise_floor():
+    mb = 1024 * 1024
+    baseline = run(1.0, 100 * mb)
+    assert bench.compare(baseline, run(1.05, 105 * mb))[0]['regressions'] == []
+    assert bench.compare(baseline, run(1.5, 200 * mb))[0]['regressions'] == ['time', 'memory']
+    # Small absolute changes are noise, however large relative to a tiny baseline.
+    assert bench.compare(run(0.01, mb), run(0.03, 3 * mb))[0]['regressions'] == []
+    entry, = bench.compare(baseline, run(1.0, 100 * mb, scenario='join'))
+    assert entry['baseline'] is None and "no baseline" in bench.format_comparison([entry])
+
+
+def test_compile_stages_are_timed_in_compile_order():
+    measured = bench._measure_compile((bench.compile_script(), 'pandas', None, None))
+    assert list(measured['stages']) == ['parse', 'plan', 'validate', 'transpile']
+    assert measured['wall_time'] == sum(measured['stages'].values())
@@ -0,0 +1,44 @@
+# tests/test_compiler.py
+#
+# Compiling a script: an invalid one fails before any code is generated, and a
+# cached one is neither parsed nor planned again.
+
+import pytest
+from src import cli, compiler
+from src.compiler import compile_flow
+from src.transpiler import FlowTranspiler
+
+INVALID = """schema Users { id: int; name: string; }
+source users <- File(path: "users.csv") using Users;
+sink out -> File(path: "out.csv");
+users -> select(id, email) -> out;
+"""
+COPY = """source users <- File(path: "users.csv");
+sink out -> File(path: "out.csv");
+users -> out;
+"""
+
+
+def test_invalid_scripts_fail_validation_before_any_code_is_generated(monkeypatch):
+    def transform(self, tree): raise AssertionError("transpiled an invalid script")
+    monkeypatch.setattr(FlowTranspiler, 'transform', transform)
+    with pytest.raises(ValueError, match="email"):
+        compile_flow(INVALID, use_cache=False)
+
+
+def test_a_cached_script_is_run_again_without_being_parsed(monkeypatch, capsys):
+    with open("users.csv", "w") as f: f.write("id,name\n1,a\n2,b\n")
+    with open("copy.flow", "w") as f: f.write(COPY)
+    cli.run_flow_script("copy.flow")
+    cli.run_flow_script("copy.flow")  # Builds the variant that skips the up-to-date pipeline.
+    def parse(flow_code): raise AssertionError("parsed a cached script")
+    monkeypatch.setattr(compiler, 'parse_flow', parse)
+    capsys.readouterr()
+    cli.run_flow_script("copy.flow")
+    out = capsys.readouterr().out
+    assert "(cached)" in out and "up to date and was skipped" in out
+
+    with open("users.csv", "a") as f: f.write("3,c\n")
+    cli.run_flow_script("copy.flow")
+    assert "Script finished successfully" in capsys.readouterr().out
+    with open("out.csv") as f: assert f.read().splitlines()[-1] == "3,c"
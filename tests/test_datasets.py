@@ -0,0 +1,74 @@
+# tests/test_datasets.py
+#
+# Sinks with write options: Hive-partitioned datasets, compressed CSVs, Parquet row
+# groups and sorted output, written the same eagerly and chunk by chunk, and read
+# back by Parquet sources with partition pruning.
+
+import gzip
+import os
+import pandas as pd
+import pyarrow.parquet as pq
+import pytest
+from src import datasets
+
+ORDERS = pd.DataFrame({'id': range(1, 31), 'status': ['new', 'paid', 'sent'] * 10, 'amount': [n * 1.5 for n in range(30)]})
+PARTITIONED = """source orders <- File(path: "orders.csv");
+sink out -> Parquet(path: "by_status", partition_by: "status", compression: "zstd");
+orders -> out;
+"""
+OPTIONS = """source orders <- File(path: "orders.csv");
+sink csv -> File(path: "orders.csv.gz", compression: "gzip", sort_by: "amount");
+sink table -> Parquet(path: "orders.parquet", row_group_size: 8);
+orders -> csv;
+orders -> table;
+"""
+PRUNED = """source orders <- Parquet(path: "by_status");
+sink out -> File(path: "paid.csv");
+orders -> filter(orders.status == "paid") -> out;
+"""
+
+
+@pytest.fixture(autouse=True)
+def orders():
+    ORDERS.to_csv("orders.csv", index=False)
+
+
+def read_partitioned(path):
+    return datasets.read_parquet(path).sort_values('id').reset_index(drop=True)[list(ORDERS.columns)]
+
+
+@pytest.mark.parametrize("options", [{}, {'chunk_size': 7}], ids=["eager", "streamed"])
+def test_partitioned_sinks_write_one_directory_per_key(run_flow, options):
+    run_flow(PARTITIONED, **options)
+    assert sorted(os.listdir("by_status")) == ["status=new", "status=paid", "status=sent"]
+    part = pq.ParquetFile(os.path.join("by_status", "status=paid", "part-0.parquet"))
+    assert part.schema_arrow.names == ['id', 'amount']
+    assert part.metadata.row_group(0).column(0).compression == 'ZSTD'
+    result = read_partitioned("by_status")
+    pd.testing.assert_frame_equal(result, ORDERS, check_dtype=False)
+
+
+def test_parquet_sources_read_datasets_with_partition_pruning(run_flow):
+    run_flow(PARTITIONED)
+    compiled = run_flow(PRUNED)
+    assert "filters=" in compiled.python_script
+    paid = pd.read_csv("paid.csv")
+    assert paid['id'].tolist() == ORDERS[ORDERS['status'] == 'paid']['id'].tolist()
+
+
+def test_compressed_sorted_csvs_and_parquet_row_groups(run_flow):
+    run_flow(OPTIONS)
+    with gzip.open("orders.csv.gz", "rt") as f: csv = pd.read_csv(f)
+    pd.testing.assert_frame_equal(csv, ORDERS.sort_values('amount', kind='stable').reset_index(drop=True))
+    metadata = pq.ParquetFile("orders.parquet").metadata
+    assert [metadata.row_group(i).num_rows for i in range(metadata.num_row_groups)] == [8, 8, 8, 6]
+
+
+def test_a_failed_partitioned_write_keeps_the_previous_output():
+    datasets.write(ORDERS, 'Parquet', "by_status", partition_by=['status'])
+    with pytest.raises(RuntimeError):
+        with datasets.SinkWriter("by_status", 'Parquet', partition_by=['status']) as writer:
+            writer.write(ORDERS.head(3))
+            raise RuntimeError("the pipeline failed")
+    pd.testing.assert_frame_equal(read_partitioned("by_status"), ORDERS, check_dtype=False)
+    assert not [name for name in os.listdir(".") if name.endswith(".tmp")]
@@ -0,0 +1,72 @@
+# tests/test_engines.py
+#
+# The pandas and Arrow engines must write the same files for the same script:
+# the same missing values, the same types, the same CSV quoting and formatting.
+
+import os
+import shutil
+import pytest
+from conftest import EXAMPLES_DIR, assert_same_outputs, runnable_examples, sink_outputs
+
+USERS_CSV = """id,name,age,score,status,city_id
+1,Ann,34,1.5,active,10
+2,"Lee, Jr.",,2.0,,20
+3,"Bo ""B"" Ng",51,,inactive,10
+4,Cy,28,4.25,active,30
+5,,62,3.0,NA,20
+6,Dee,45,0.1,active,
+"""
+CITIES_CSV = "city_id,city_name\n10,Oslo\n20,\n30,Lima\n"
+
+PIPELINES = {
+    'filter_select': ('users -> filter(users.age > 30) -> select(id, name, age, score) -> out;', 'out.csv'),
+    'mutate': ('users -> mutate(twice = users.age * 2, ratio = users.score / users.age, label = users.name + "!") '
+               '-> out;', 'out.csv'),
+    'sort': ('users -> sort(status, age, order: "desc") -> out;', 'out.parquet'),
+    'aggregate': ('users -> group_by(status) -> aggregate(n = count(), mean_age = avg(age), total = sum(score), '
+                  'oldest = max(age)) -> out;', 'out.csv'),
+    'join': ('joined = join(users, cities, on: users.city_id == cities.city_id);\njoined -> out;', 'out.csv'),
+}
+SCHEMAS = ("schema Users { id: int; name: string; age: int; score: float; status: string; city_id: int; }\n"
+           "schema Cities { city_id: int; city_name: string; }\n")
+
+
+def _script(name, typed):
+    pipeline, sink = PIPELINES[name]
+    kind = 'Parquet' if sink.endswith('.parquet') else 'File'
+    using = (" using Users", " using Cities") if typed else ("", "")
+    return ((SCHEMAS if typed else "") +
+            f'source users <- File(path: "users.csv"){using[0]};\n'
+            f'source cities <- File(path: "cities.csv"){using[1]};\n'
+            f'sink out -> {kind}(path: "{sink}");\n{pipeline}\n')
+
+
+@pytest.fixture
+def data():
+    with open("users.csv", "w") as f: f.write(USERS_CSV)
+    with open("cities.csv", "w") as f: f.write(CITIES_CSV)
+
+
+# Joins need schemas.
+@pytest.mark.parametrize("name, typed", [(name, typed) for name in sorted(PIPELINES) for typed in (False, True)
+                                         if typed or name != 'join'])
+def test_engines_write_the_same_files(data, name, typed):
+    flow_code = _script(name, typed)
+    assert_same_outputs(sink_outputs(flow_code), sink_outputs(flow_code, engine='arrow'))
+
+
+def test_empty_strings_are_missing_values_under_arrow(data):
+    outputs = sink_outputs(_script('aggregate', typed=False), engine='arrow')
+    assert outputs['out.csv'].decode().splitlines()[1:] == ['active,3,35.666666666666664,5.85,45.0',
+                                                              'inactive,1,51.0,0.0,51.0']
+
+
+@pytest.mark.parametrize("name", runnable_examples())
+def test_examples_run_the_same_on_both_engines(name):
+    shutil.copytree(EXAMPLES_DIR, "examples")
+    with open(os.path.join("examples", name)) as f: flow_code = f.read()
+    try:
+        expected = sink_outputs(flow_code)
+    except Exception as e:
+        pytest.skip(f"{name} does not run on the bundled example data: {e}")
+    assert_same_outputs(expected, sink_outputs(flow_code, engine='arrow'))
@@ -0,0 +1,62 @@
+# tests/test_ingest.py
+#
+# Typed reads of schema-bound sources: declared types, compact storage, rejected
+# rows, and sinks that write the same types however their input was read.
+
+import pandas as pd
+import pyarrow.parquet as pq
+import pytest
+from src import ingest
+
+SCHEMA = "schema Users { id: int; name: string; score: int; }\n"
+SCRIPT = """source users <- File(path: "users.csv"){using};
+sink out -> File(path: "out.csv");
+sink table -> Parquet(path: "out.parquet");
+users -> filter(users.name == "a") -> out;
+users -> sort(id) -> table;
+"""
+
+
+@pytest.fixture
+def users():
+    pd.DataFrame({'id': range(1, 21), 'name': ['a', 'b'] * 10, 'score': [300, 5] * 10}).to_csv("users.csv", index=False)
+
+
+def test_small_ints_and_repeated_strings_are_stored_compactly(users):
+    df = ingest.read_csv("users.csv", {'id': 'int', 'name': 'string', 'score': 'int'},
+                         downcast=['id', 'score'], categorical=['name'])
+    assert df.dtypes.to_dict() == {'id': 'int8', 'name': 'category', 'score': 'int16'}
+
+
+def test_missing_ints_stay_integers():
+    with open("users.csv", "w") as f: f.write("id,score\n1,10\n2,\n")
+    df = ingest.read_csv("users.csv", {'id': 'int', 'score': 'int'}, downcast=['score'])
+    assert str(df['score'].dtype) == 'Int8'
+    assert df['score'].isna().tolist() == [False, True]
+
+
+def test_rows_that_do_not_match_the_schema_are_rejected(capsys):
+    with open("users.csv", "w") as f: f.write("id,score\n1,10\nx,20\n3,30,extra\n4,40\n")
+    df = ingest.read_csv("users.csv", {'id': 'int', 'score': 'int'})
+    assert df['id'].tolist() == [1, 4]
+    rejects = pd.read_csv(ingest.rejects_path("users.csv"))
+    assert rejects[ingest.REJECT_REASON_COLUMN].tolist() == ["id is not int", "expected 2 fields, got 3"]
+    assert "2 row(s) of 'users.csv'" in capsys.readouterr().out
+
+
+def test_widen_restores_the_types_of_an_untyped_read():
+    df = pd.DataFrame({'a': pd.Series([1, 2], dtype='int8'), 'b': pd.Series([1, None], dtype='Int16'),
+                       'c': pd.Series(['x', 'y'], dtype='category'), 'd': [1.5, 2.5]})
+    assert ingest.widen(df).dtypes.to_dict() == {'a': 'int64', 'b': 'Int64', 'c': df['c'].cat.categories.dtype,
+                                                 'd': 'float64'}
+
+
+def test_sink_types_do_not_depend_on_typed_ingestion(users, run_flow):
+    typed = run_flow(SCHEMA + SCRIPT.format(using=" using Users"))
+    assert "downcast=" in typed.python_script and "categorical=" in typed.python_script
+    with open("out.csv", "rb") as f: typed_csv = f.read()
+    typed_parquet = pq.read_table("out.parquet")
+
+    run_flow(SCRIPT.format(using=""))
+    with open("out.csv", "rb") as f: assert f.read() == typed_csv
+    assert pq.read_table("out.parquet").equals(typed_parquet, check_metadata=True)
@@ -0,0 +1,41 @@
+# tests/test_joins.py
+#
+# Every join strategy must return exactly what pd.merge returns, and two frames
+# already in memory are joined by pd.merge itself.
+
+import pandas as pd
+import pytest
+from src import joins
+
+LEFT = pd.DataFrame({'id': [3, 1, 2, 3, 5, 1], 'city': ['b', 'a', None, 'b', 'z', 'c'], 'n': range(6)})
+RIGHT = pd.DataFrame({'city': ['a', 'b', 'b', 'c', 'd'], 'id': [1, 3, 3, 9, 2], 'name': ['v', 'w', 'x', 'y', 'z']})
+
+
+@pytest.fixture
+def files():
+    LEFT.to_csv("left.csv", index=False)
+    RIGHT.to_csv("right.csv", index=False)
+
+
+def test_frames_in_memory_are_joined_by_pd_merge(monkeypatch):
+    def index_join(*args, **kwargs): raise AssertionError("built a key index for two frames in memory")
+    monkeypatch.setattr(joins, '_index_join', index_join)
+    assert joins.choose_strategy(LEFT, RIGHT) == 'hash'
+    pd.testing.assert_frame_equal(joins.join(LEFT, RIGHT, 'city', 'city'), pd.merge(LEFT, RIGHT, on='city'))
+
+
+def test_a_streamed_side_is_probed_against_the_other_sides_index(files):
+    scan = joins.Scan("left.csv", 'File', chunk_size=2)
+    assert joins.choose_strategy(scan, RIGHT) == 'broadcast'
+    # Make the file look big enough to stay streamed.
+    scan.size_on_disk = lambda: 1 << 40
+    for key in ('id', 'city'):
+        expected = pd.merge(pd.read_csv("left.csv"), RIGHT, left_on=key, right_on=key)
+        pd.testing.assert_frame_equal(joins.join(scan, RIGHT, key, key), expected)
+
+
+def test_a_presorted_side_is_used_as_the_index():
+    right = RIGHT.sort_values('id', kind='stable').reset_index(drop=True)
+    assert joins.choose_strategy(LEFT, right, right_sorted=True) == 'sort-merge'
+    expected = pd.merge(LEFT, right, left_on='id', right_on='id')
+    pd.testing.assert_frame_equal(joins.join(LEFT, right, 'id', 'id', right_sorted=True), expected)
@@ -0,0 +1,46 @@
+# tests/test_kernels.py
+#
+# Filters and mutates evaluated by kernels.py must give exactly what the plain
+# pandas operators give, on NumPy and numexpr paths alike, with missing values.
+
+import numpy as np
+import pandas as pd
+import pytest
+from src import backends, compiler, kernels
+
+SCHEMA = "schema Users { id: int; age: int; score: float; bonus: int; name: string; status: string; }\n"
+PIPELINES = {
+    'filter': 'users -> filter(users.age * 2 + users.score > 60 and users.status == "active" or users.age < 20) -> out;',
+    'mutate': ('users -> mutate(x = users.age * users.score - users.age / 3, y = users.age + users.bonus * 2 - 1, '
+               'z = users.score / users.bonus, label = users.name + "_" + users.status) -> out;'),
+    'filter_mutate': ('users -> filter(users.bonus - users.age < 0) -> mutate(r = (users.age + users.score) * 2 / 5)'
+                      ' -> filter(users.r != 30) -> out;'),
+}
+
+
+@pytest.fixture(params=[50, kernels.NUMEXPR_MIN_ROWS], ids=['numpy', 'numexpr'])
+def users(request):
+    rng = np.random.default_rng(2)
+    size = request.param
+    score = rng.normal(40, 15, size).round(2)
+    score[::7] = np.nan
+    bonus = rng.integers(-3, 4, size).astype(float)  # Zeros divide by zero.
+    bonus[::11] = np.nan  # Declared int with missing values: a nullable Int64 column.
+    pd.DataFrame({'id': range(size), 'age': rng.integers(10, 70, size), 'score': score, 'bonus': bonus,
+                  'name': rng.choice(['ann', 'bo', None], size), 'status': rng.choice(['active', 'off'], size)}
+                 ).to_csv("users.csv", index=False)
+
+
+def _output(flow_code, fused_kernels, monkeypatch):
+    monkeypatch.setattr(compiler, 'get_backend', lambda engine='pandas': backends.PandasBackend(fused_kernels))
+    compiled = compiler.compile_flow(flow_code, use_cache=False)
+    assert ("flow_kernels." in compiled.python_script) == fused_kernels
+    exec(compiled.code, {'__name__': '__flow__'})
+    with open("out.csv", "rb") as f: return f.read()
+
+
+@pytest.mark.parametrize("name", sorted(PIPELINES))
+def test_kernels_match_pandas_operators(users, name, monkeypatch):
+    flow_code = (SCHEMA + 'source users <- File(path: "users.csv") using Users;\n'
+                 'sink out -> File(path: "out.csv");\n' + PIPELINES[name])
+    assert _output(flow_code, True, monkeypatch) == _output(flow_code, False, monkeypatch)
@@ -0,0 +1,62 @@
+# tests/test_materialize.py
+#
+# `flow run --materialize`: an assigned variable is reused while its definition
+# and source files are unchanged, and recomputed as soon as either changes.
+
+import os
+import pandas as pd
+from src import materialize
+
+SCRIPT = """schema Users { id: int; age: int; }
+source users <- File(path: "users.csv") using Users;
+sink out -> File(path: "out.csv");
+adults = users -> filter(users.age > {age});
+adults -> out;
+"""
+
+
+def _write_users(ages):
+    pd.DataFrame({'id': range(len(ages)), 'age': ages}).to_csv("users.csv", index=False)
+
+
+def _run(run_flow, capsys, age=17):
+    run_flow(SCRIPT.replace("{age}", str(age)), materialize=True)
+    with open("out.csv") as f: output = f.read()
+    return output, "'adults' is unchanged" in capsys.readouterr().out
+
+
+def test_unchanged_variables_are_read_back(run_flow, capsys):
+    _write_users([12, 30, 45])
+    first, reused = _run(run_flow, capsys)
+    assert not reused
+    again, reused = _run(run_flow, capsys)
+    assert reused and again == first == "id,age\n1,30\n2,45\n"
+    assert len(os.listdir(materialize.get_work_dir())) == 1
+
+
+def test_a_changed_source_file_is_recomputed(run_flow, capsys):
+    _write_users([12, 30, 45])
+    _run(run_flow, capsys)
+    _write_users([12, 30, 45, 60])
+    output, reused = _run(run_flow, capsys)
+    assert not reused and output == "id,age\n1,30\n2,45\n3,60\n"
+
+
+def test_a_changed_definition_is_recomputed(run_flow, capsys):
+    _write_users([12, 30, 45])
+    _run(run_flow, capsys)
+    output, reused = _run(run_flow, capsys, age=40)
+    assert not reused and output == "id,age\n2,45\n"
+
+
+def test_a_stale_fingerprint_is_never_served():
+    calls = []
+    def compute():
+        calls.append(1)
+        return pd.DataFrame({'a': [len(calls)]})
+    with open("input.txt", "w") as f: f.write("one")
+    assert materialize.materialized('v', 'def', ["input.txt"], compute)['a'].tolist() == [1]
+    assert materialize.materialized('v', 'def', ["input.txt"], compute)['a'].tolist() == [1]
+    with open("input.txt", "w") as f: f.write("three")
+    assert materialize.materialized('v', 'def', ["input.txt"], compute)['a'].tolist() == [2]
+    assert materialize.clear() == 1
@@ -0,0 +1,33 @@
+# tests/test_parser.py
+#
+# The LALR(1) parser: it parses every example the way the Earley parser does, and
+# its tables are built once and then loaded from the Flow cache directory.
+
+import glob
+import os
+import pytest
+from src import compiler
+from src.cache import get_cache_dir
+from conftest import EXAMPLES_DIR
+
+
+@pytest.mark.parametrize("path", sorted(glob.glob(os.path.join(EXAMPLES_DIR, "*.flow"))), ids=os.path.basename)
+def test_lalr_and_earley_parse_the_examples_alike(path):
+    with open(path) as f: code = f.read()
+    lalr = compiler.build_parser(use_cache=False).parse(code)
+    earley = compiler.build_parser('earley', use_cache=False).parse(code)
+    assert lalr == earley
+
+
+def test_the_parser_tables_are_cached():
+    compiler.build_parser()
+    table = os.path.join(get_cache_dir(), compiler.PARSER_CACHE_FILE)
+    assert os.path.exists(table)
+    stamp = os.stat(table).st_mtime_ns
+    compiler.build_parser()
+    assert os.stat(table).st_mtime_ns == stamp
+
+
+def test_get_parser_builds_the_parser_once(monkeypatch):
+    monkeypatch.setattr(compiler, '_parser', None)
+    assert compiler.get_parser() is compiler.get_parser()
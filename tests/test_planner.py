@@ -0,0 +1,35 @@
+# tests/test_planner.py
+
+import pandas as pd
+import pytest
+from src.compiler import plan_flow
+
+NULLS_SCRIPT = """
+schema U {{ id: int; status: string; age: float; }}
+source u <- Parquet(path: "users.parquet") using U;
+sink out -> File(path: "out.csv");
+u -> filter({condition}) -> out;
+"""
+
+
+@pytest.fixture
+def users_with_nulls():
+    frame = pd.DataFrame({'id': [1, 2, 3, 4], 'status': ['a', None, 'b', 'a'], 'age': [10.0, None, 20.0, 30.0]})
+    frame.to_parquet("users.parquet")
+    return frame
+
+
+@pytest.mark.parametrize("condition, expected_ids", [
+    ('u.status != "a"', [2, 3]),
+    ('u.age != 10.0', [2, 3, 4]),
+    ('u.status == "a"', [1, 4]),
+    ('u.age > 15.0', [3, 4]),
+])
+def test_pushed_filters_keep_pandas_null_semantics(users_with_nulls, run_flow, condition, expected_ids):
+    run_flow(NULLS_SCRIPT.format(condition=condition))
+    assert pd.read_csv("out.csv")['id'].tolist() == expected_ids
+
+
+def test_not_equal_is_not_pushed_into_parquet_reads(users_with_nulls):
+    plan = plan_flow(NULLS_SCRIPT.format(condition='u.status != "a" and u.age > 15.0'))
+    assert plan.sources['u'].filters == [('age', '>', 15.0)]
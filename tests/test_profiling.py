@@ -0,0 +1,56 @@
+# tests/test_profiling.py
+#
+# `flow explain --analyze` records: one per step, also when a pipeline runs in
+# chunks, and times that add up to the run's total.
+
+import pandas as pd
+import pytest
+from src import profiling
+
+SCRIPT = """schema Users { id: int; age: int; }
+source users <- File(path: "users.csv") using Users;
+sink out -> File(path: "out.csv");
+sink totals -> File(path: "totals.csv");
+users -> filter(users.age > 30) -> mutate(twice = users.age * 2) -> out;
+users -> group_by(age) -> aggregate(n = count()) -> totals;
+"""
+
+
+@pytest.fixture
+def records(run_flow):
+    pd.DataFrame({'id': range(100), 'age': [20, 40] * 50}).to_csv("users.csv", index=False)
+    def run(**options):
+        profiling.reset()
+        run_flow(SCRIPT, profile=True, **options)
+        return profiling.records()
+    return run
+
+
+def _steps(records, node_line):
+    return {r['step']: r for r in records if r['node_line'] == node_line}
+
+
+def test_streamed_steps_add_up_their_chunks(records):
+    steps = _steps(records(chunk_size=7), 5)
+    assert list(steps) == ['filter', 'mutate', 'sink out', 'streamed: reading and merging chunks']
+    assert (steps['filter']['rows_in'], steps['filter']['rows_out']) == (100, 50)
+    assert steps['sink out']['rows_in'] == 50
+    steps = _steps(records(chunk_size=7), 6)
+    assert list(steps) == ['partial aggregate', 'sink totals', 'streamed: reading and merging chunks']
+    assert steps['partial aggregate']['rows_in'] == 100
+
+
+def test_nested_records_leave_out_the_time_of_the_records_inside(monkeypatch):
+    ticks = iter([0.0, 1.0, 3.0, 10.0])
+    monkeypatch.setattr(profiling.time, 'perf_counter', lambda: next(ticks))
+    profiling.reset()
+    profiling.begin()
+    profiling.begin()
+    profiling.end('node', 1, 'inner', [1])
+    profiling.end('node', 1, 'outer', [1])
+    assert [r['seconds'] for r in profiling.records()] == [2.0, 8.0]
+
+
+def test_partitioned_pipelines_say_they_are_timed_as_a_whole(records):
+    steps = _steps(records(workers=2), 5)
+    assert list(steps) == ['whole pipeline, partitioned on 2 workers']
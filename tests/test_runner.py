@@ -0,0 +1,45 @@
+# tests/test_runner.py
+#
+# `flow test`: test blocks compiled like scripts, reported in order, as JUnit too.
+
+import xml.etree.ElementTree as ET
+from src.compiler import parse_flow
+from src import runner as flow_runner
+
+TESTS = """
+test "arithmetic" { assert 1 + 1 == 2; }
+test "a false assertion" { assert 1 > 5; }
+test "a script" {
+    schema Users { id: int; age: int; }
+    source users <- File(path: "users.csv") using Users;
+    source unused <- File(path: "missing.csv");
+    sink out -> File(path: "out.csv");
+    users -> filter(users.age > 30) -> out;
+    assert 2 * 3 == 6;
+}
+"""
+
+
+def _run(**options):
+    with open("users.csv", "w") as f: f.write("id,age\n1,25\n2,40\n")
+    return flow_runner.TestRunner(parse_flow(TESTS), **options).run()
+
+
+def test_tests_are_compiled_with_a_plan():
+    passed = _run(name_filters=["a script"])
+    assert passed  # The unused source's missing file is never read.
+    with open("out.csv") as f: assert f.read() == "id,age\n2,40\n"
+
+
+def test_failures_are_reported_and_fail_fast_skips_the_rest(capsys):
+    passed = _run(fail_fast=True)
+    out = capsys.readouterr().out
+    assert not passed
+    assert "✅ PASSED: 'arithmetic'" in out and "❌ FAILED: 'a false assertion'" in out
+    assert "⏭️  SKIPPED: 'a script'" in out
+
+
+def test_junit_report(tmp_path):
+    _run(junit_path=str(tmp_path / "report.xml"))
+    suite = ET.parse(tmp_path / "report.xml").getroot()
+    assert (suite.get('tests'), suite.get('failures'), suite.get('errors')) == ('3', '1', '0')
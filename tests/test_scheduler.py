@@ -0,0 +1,34 @@
+# tests/test_scheduler.py
+#
+# Overlapped I/O: only scripts with more than one source to load or sink to write
+# get a scheduler, and what they write does not depend on it.
+
+import pandas as pd
+from src.compiler import compile_flow
+from conftest import assert_same_outputs, sink_outputs
+
+COPY = """source users <- File(path: "users.csv");
+sink out -> File(path: "out.csv");
+users -> out;
+"""
+TWO = """source users <- File(path: "users.csv");
+source orders <- Parquet(path: "orders.parquet");
+sink users_out -> File(path: "users_out.csv");
+sink orders_out -> Parquet(path: "orders_out.parquet");
+users -> sort(id) -> users_out;
+orders -> filter(orders.amount > 1) -> orders_out;
+"""
+
+
+def test_a_single_source_and_sink_are_read_and_written_in_place():
+    assert "flow_scheduler" not in compile_flow(COPY, use_cache=False).python_script
+
+
+def test_independent_sources_and_sinks_overlap_without_changing_outputs(monkeypatch):
+    pd.DataFrame({'id': [3, 1, 2]}).to_csv("users.csv", index=False)
+    pd.DataFrame({'amount': [1, 2, 3]}).to_parquet("orders.parquet")
+    script = compile_flow(TWO, use_cache=False).python_script
+    assert "flow_tasks.load(" in script and "flow_tasks.write(" in script
+    overlapped = sink_outputs(TWO)
+    monkeypatch.setenv("FLOW_IO_THREADS", "1")
+    assert_same_outputs(sink_outputs(TWO), overlapped)
@@ -0,0 +1,83 @@
+# tests/test_server.py
+#
+# `flow serve` jobs: what a job prints is captured wherever it is printed, tables
+# are read afresh by every job, and the socket is only ever open to its user.
+
+import os
+import stat
+import sys
+import threading
+import pytest
+from src import server, sources
+from src.cache import CompileCache
+from src.compiler import compile_flow
+
+SCRIPT = """schema Users { id: int; name: string; }
+source users <- File(path: "users.csv") using Users;
+source cities <- File(path: "cities.csv");
+sink users_out -> File(path: "users_out.csv");
+sink cities_out -> File(path: "cities_out.csv");
+users -> users_out;
+cities -> cities_out;
+"""
+
+
+@pytest.fixture
+def job():
+    with open("users.csv", "w") as f: f.write("id,name\n1,a\nx,b\n")
+    with open("cities.csv", "w") as f: f.write("city_id\n101\n")
+    with open("job.flow", "w") as f: f.write(SCRIPT)
+    return {'op': 'run', 'path': os.path.abspath("job.flow"), 'cwd': os.getcwd(), 'options': {}}
+
+
+def test_a_job_captures_what_its_io_threads_print(job, capsys, monkeypatch):
+    # The rejected row is reported by the load of 'users', which runs on an I/O thread.
+    assert "flow_tasks.load('users_df'" in compile_flow(SCRIPT, use_cache=False).python_script
+    output = server._JobOutput(sys.stdout)
+    monkeypatch.setattr(sys, 'stdout', output)  # As serve() does.
+    reply = server.run_job(job, CompileCache(memory=True), output)
+    assert reply['status'] == 'ok', reply['error']
+    assert "1 row(s) of 'users.csv'" in reply['output']
+    assert capsys.readouterr().out == ""
+
+
+def test_jobs_cannot_use_worker_processes(job):
+    job['options']['workers'] = 2
+    reply = server.run_job(job, CompileCache(memory=True), server._JobOutput(sys.stdout))
+    assert reply['status'] == 'error' and "--workers" in reply['error']
+    assert not os.path.exists("users_out.csv")
+
+
+def test_tables_are_read_by_every_job():
+    sources.configure(64)
+    reads = []
+    def load():
+        reads.append(1)
+        return len(reads)
+    assert [sources.read_table('postgresql://u@h/db/t', 'reader', load) for _ in range(2)] == [1, 2]
+
+
+def test_the_socket_is_created_for_its_user_only():
+    flow_server = server.bind(os.path.join(os.getcwd(), "flow.sock"))
+    try:
+        assert stat.S_IMODE(os.stat("flow.sock").st_mode) == 0o600
+    finally:
+        flow_server.server_close()
+
+
+def test_compile_cache_entries_are_stored_from_many_threads(job):
+    compiled = compile_flow(SCRIPT, use_cache=False)
+    cache = CompileCache()
+    key = cache.key(SCRIPT)
+    errors = []
+    def store():
+        try:
+            for _ in range(20): cache.store(key, compiled)
+        except OSError as e:
+            errors.append(e)
+    threads = [threading.Thread(target=store) for _ in range(8)]
+    for thread in threads: thread.start()
+    for thread in threads: thread.join()
+    assert errors == []
+    assert cache.load(key).python_script == compiled.python_script
+    assert os.listdir(cache.cache_dir) == [f"{key}.pkl"]
@@ -0,0 +1,52 @@
+# tests/test_watermarks.py
+#
+# Incremental sources: each run reads the rows added since the last successful
+# run, and a run that fails moves no watermark, not even through a later run.
+
+import os
+import pytest
+
+EVENTS = """source events <- File(path: "events.csv", incremental: true);
+source other <- File(path: "other.csv");
+sink out -> File(path: "out.csv");
+sink copy -> File(path: "copy.csv");
+events -> out;
+other -> copy;
+"""
+LOGS = """source logs <- File(path: "logs.csv", incremental: true);
+sink out -> File(path: "logs_out.csv");
+logs -> out;
+"""
+
+
+def lines(path):
+    with open(path) as f: return f.read().splitlines()
+
+
+def test_each_run_reads_the_rows_added_since_the_last_one(run_flow, capsys):
+    with open("events.csv", "w") as f: f.write("id\n1\n2\n")
+    with open("other.csv", "w") as f: f.write("x\n1\n")
+    run_flow(EVENTS)
+    with open("events.csv", "a") as f: f.write("3\n")
+    run_flow(EVENTS)
+    assert "1 new row(s)" in capsys.readouterr().out
+    assert lines("out.csv") == ["id", "1", "2", "3"]
+
+
+def test_a_failed_run_saves_no_watermark(run_flow, capsys):
+    with open("events.csv", "w") as f: f.write("id\n1\n2\n")
+    with open("other.csv", "w") as f: f.write("x\n1\n")
+    with open("logs.csv", "w") as f: f.write("id\n1\n")
+    run_flow(EVENTS)
+
+    with open("events.csv", "a") as f: f.write("3\n")
+    os.rename("other.csv", "other.bak")
+    with pytest.raises(Exception):
+        run_flow(EVENTS)
+    os.rename("other.bak", "other.csv")
+    run_flow(LOGS)  # Another script's run commits only the sources it read.
+
+    capsys.readouterr()
+    run_flow(EVENTS)
+    assert "1 new row(s)" in capsys.readouterr().out
+    assert lines("out.csv") == ["id", "1", "2", "3"]